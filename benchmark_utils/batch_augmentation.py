@@ -0,0 +1,148 @@
+import math
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import default_collate
+
+# Normalization of albumentations' `Normalize`, used by FLamby
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def normalize(X):
+    """Normalize a batch of images with values in [0, 1]."""
+    mean = torch.tensor(IMAGENET_MEAN, device=X.device).view(1, -1, 1, 1)
+    std = torch.tensor(IMAGENET_STD, device=X.device).view(1, -1, 1, 1)
+    return (X - mean) / std
+
+
+class BatchCenterCrop:
+    """Collate images, center-cropping and normalizing the uint8 ones.
+
+    This is the evaluation counterpart of `BatchAugmentation`. Images which
+    are already float, i.e. transformed by their dataset, are left as is.
+
+    Parameters
+    ----------
+    size : int
+        Size of the square crops.
+    """
+
+    def __init__(self, size=200):
+        self.size = size
+
+    def __call__(self, samples):
+        X, y = default_collate(samples)
+        if X.dtype != torch.uint8:
+            return X, y
+        top = (X.shape[-2] - self.size) // 2
+        left = (X.shape[-1] - self.size) // 2
+        X = X[..., top:top + self.size, left:left + self.size]
+        return normalize(X.float() / 255.0), y
+
+
+class BatchAugmentation:
+    """Collate uint8 images and augment the whole batch at once.
+
+    Each image gets a random resized crop, rotated and sheared, random
+    horizontal and vertical flips and a random brightness and contrast,
+    before being normalized. The geometric transforms of the batch are
+    applied by a single `grid_sample`, and the parameters of each sample
+    are drawn from a generator seeded once, so that the augmentations are
+    reproducible.
+
+    Parameters
+    ----------
+    size : int
+        Size of the square output images.
+    scale : tuple of float
+        Range of the area of the crops, relative to the area of the images.
+    ratio : tuple of float
+        Range of the aspect ratio of the crops.
+    rotation : float
+        Maximum rotation, in degrees.
+    shear : float
+        Maximum horizontal shear.
+    brightness, contrast : float
+        Maximum relative change of the brightness and of the contrast.
+    seed : int
+        Seed of the generator of the parameters.
+    """
+
+    def __init__(
+        self,
+        size=200,
+        scale=(0.6, 1.0),
+        ratio=(3 / 4, 4 / 3),
+        rotation=50.0,
+        shear=0.1,
+        brightness=0.15,
+        contrast=0.1,
+        seed=0,
+    ):
+        self.size = size
+        self.scale = scale
+        self.ratio = ratio
+        self.rotation = rotation
+        self.shear = shear
+        self.brightness = brightness
+        self.contrast = contrast
+        self.generator = torch.Generator().manual_seed(seed)
+
+    def _uniform(self, n, low, high):
+        return low + (high - low) * torch.rand(n, generator=self.generator)
+
+    def _sign(self, n):
+        flip = torch.rand(n, generator=self.generator) < 0.5
+        return 1.0 - 2.0 * flip.float()
+
+    def affine_matrices(self, n):
+        """Matrices mapping the output grid to the input images, in the
+        normalized coordinates of `affine_grid`."""
+        area = self._uniform(n, *self.scale)
+        log_ratio = self._uniform(
+            n, math.log(self.ratio[0]), math.log(self.ratio[1])
+        )
+        width = torch.sqrt(area * torch.exp(log_ratio)).clamp(max=1.0)
+        height = torch.sqrt(area / torch.exp(log_ratio)).clamp(max=1.0)
+        # Crops are centered anywhere they fit in the image
+        center_x = self._uniform(n, -1.0, 1.0) * (1.0 - width)
+        center_y = self._uniform(n, -1.0, 1.0) * (1.0 - height)
+        angle = torch.deg2rad(self._uniform(n, -self.rotation, self.rotation))
+        shear = self._uniform(n, -self.shear, self.shear)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        # Rotation @ shear @ scaling with flips
+        scale_x = width * self._sign(n)
+        scale_y = height * self._sign(n)
+        theta = torch.zeros(n, 2, 3)
+        theta[:, 0, 0] = cos * scale_x
+        theta[:, 0, 1] = (cos * shear - sin) * scale_y
+        theta[:, 1, 0] = sin * scale_x
+        theta[:, 1, 1] = (sin * shear + cos) * scale_y
+        theta[:, 0, 2] = center_x
+        theta[:, 1, 2] = center_y
+        return theta
+
+    def augment(self, X):
+        """Augment a batch of uint8 images into normalized float images."""
+        n = len(X)
+        theta = self.affine_matrices(n).to(X.device)
+        alpha = 1.0 + self._uniform(n, -self.contrast, self.contrast)
+        beta = self._uniform(n, -self.brightness, self.brightness)
+        grid = F.affine_grid(
+            theta, (n, X.shape[1], self.size, self.size), align_corners=False
+        )
+        X = F.grid_sample(
+            X.float() / 255.0,
+            grid,
+            mode="bilinear",
+            padding_mode="reflection",
+            align_corners=False,
+        )
+        X = X * alpha.view(-1, 1, 1, 1).to(X.device)
+        X = (X + beta.view(-1, 1, 1, 1).to(X.device)).clamp(0.0, 1.0)
+        return normalize(X)
+
+    def __call__(self, samples):
+        X, y = default_collate(samples)
+        return self.augment(X), y
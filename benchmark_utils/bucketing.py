@@ -0,0 +1,88 @@
+import torch
+from torch.utils.data import Sampler
+
+
+def bag_lengths(dataset):
+    """Number of instances of each bag, i.e. the length of its first input."""
+    return [len(dataset[idx][0]) for idx in range(len(dataset))]
+
+
+class BucketBatchSampler(Sampler):
+    """Batch sampler grouping bags of similar lengths.
+
+    Bags are sorted by length and consecutive bags are batched together, so
+    that little padding is needed. Batches hold at most `batch_size` bags and
+    at most `max_batch_instances` instances once padded. The order of the
+    bags is deterministic, which is what evaluation needs.
+
+    Parameters
+    ----------
+    lengths : list of int
+        Number of instances of each bag.
+    batch_size : int
+        Maximum number of bags per batch.
+    max_batch_instances : int or None
+        Maximum number of padded instances per batch.
+    """
+
+    def __init__(self, lengths, batch_size, max_batch_instances=None):
+        self.batches = []
+        batch = []
+        for idx in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            # Bags are sorted so the padded length is the last one's, plus the
+            # slot of the padding, see `masked_bag_collate`
+            padded_size = (len(batch) + 1) * (lengths[idx] + 1)
+            too_large = (
+                max_batch_instances is not None
+                and padded_size > max_batch_instances
+            )
+            if len(batch) > 0 and (len(batch) == batch_size or too_large):
+                self.batches.append(batch)
+                batch = []
+            batch.append(idx)
+        if len(batch) > 0:
+            self.batches.append(batch)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+
+def masked_bag_collate(samples, max_tiles=10000):
+    """Batch bags of instances of different lengths, with masks.
+
+    This is equivalent to padding all bags with zeros up to `max_tiles`
+    instances, as FLamby's Camelyon16 `collate_fn` does, for models pooling
+    the instances with an attention softmax: zero instances all get the same
+    attention logit and features, so they are replaced by a single zero
+    instance weighted by their number. Bags are padded to the longest bag of
+    the batch plus this slot, and the log-weight of each instance is appended
+    as an extra feature: 0 for the instances of the bag, the log of the
+    number of padding instances for the slot and -inf for the rest.
+
+    Returns
+    -------
+    X : torch.Tensor
+        Tensor of shape (n_bags, max_length + 1, n_features + 1).
+    y : torch.Tensor
+        Tensor of shape (n_bags, 1).
+    """
+    lengths = [len(X) for X, _ in samples]
+    if max(lengths) > max_tiles:
+        raise ValueError(
+            f"Bags have at most {max_tiles} instances, got {max(lengths)}"
+        )
+    X0, y0 = samples[0]
+    X = torch.zeros(
+        (len(samples), max(lengths) + 1, X0.shape[1] + 1), dtype=X0.dtype
+    )
+    X[:, :, -1] = -float("inf")
+    y = torch.empty((len(samples), 1), dtype=y0.dtype)
+    for i, ((X_i, y_i), n) in enumerate(zip(samples, lengths)):
+        X[i, :n, :-1] = X_i
+        X[i, :n, -1] = 0.0
+        X[i, n, -1] = torch.tensor(float(max_tiles - n)).log()
+        y[i] = y_i
+    return X, y
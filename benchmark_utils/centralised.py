@@ -0,0 +1,121 @@
+import numpy as np
+from flamby.strategies.utils import DataLoaderWithMemory, _Model
+from torch.utils.data import ConcatDataset, Dataset, Subset
+
+
+def _flat_index(dataset):
+    """Return the base datasets of `dataset` and, for each of its samples,
+    the base dataset it comes from and its index in it, resolving the
+    `Subset` and `ConcatDataset` indirections."""
+    if isinstance(dataset, PooledDataset):
+        return dataset.sources, dataset.source_ids, dataset.indices
+    if isinstance(dataset, Subset):
+        sources, source_ids, indices = _flat_index(dataset.dataset)
+        subset = np.asarray(dataset.indices, dtype=np.int64)
+        return sources, source_ids[subset], indices[subset]
+    if isinstance(dataset, ConcatDataset):
+        return _concat_index(dataset.datasets)
+    n = len(dataset)
+    return [dataset], np.zeros(n, dtype=np.int64), np.arange(n)
+
+
+def _concat_index(datasets):
+    sources, source_ids, indices = [], [], []
+    for dataset in datasets:
+        d_sources, d_source_ids, d_indices = _flat_index(dataset)
+        source_ids.append(d_source_ids + len(sources))
+        indices.append(d_indices)
+        sources.extend(d_sources)
+    return (
+        sources,
+        np.concatenate(source_ids).astype(np.int64),
+        np.concatenate(indices).astype(np.int64),
+    )
+
+
+class PooledDataset(Dataset):
+    """Pool of datasets indexed contiguously.
+
+    The index of the pool maps each sample directly to its base dataset and
+    its index in it, so that the samples of clients' splits, i.e. `Subset`s
+    of FLamby datasets possibly concatenated, are fetched without going
+    through the chain of wrappers.
+
+    Parameters
+    ----------
+    datasets : list of torch.utils.data.Dataset
+        The datasets to pool.
+    """
+
+    def __init__(self, datasets):
+        self.sources, self.source_ids, self.indices = _concat_index(datasets)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        return self.sources[self.source_ids[idx]][self.indices[idx]]
+
+
+class Centralised:
+    """Train a single model on pooled data, without federation.
+
+    This has the interface of FLamby's strategies with a single client so
+    that it can be run and instrumented by `FLambySolver`, but a round is
+    just `num_updates` optimizer steps on the pooled data, without any
+    exchange nor aggregation of parameters.
+
+    Parameters
+    ----------
+    training_dataloaders : list of torch.utils.data.DataLoader
+        A single dataloader, on the pooled training data.
+    model : torch.nn.Module
+        The initial model.
+    loss : torch.nn.Module
+        The loss minimized.
+    optimizer_class : torch.optim.Optimizer
+        The class of the optimizer.
+    learning_rate : float
+        The learning rate of the optimizer.
+    num_updates : int
+        The number of optimizer steps of a round.
+    nrounds : int
+        Unused, for compatibility with FLamby's strategies.
+    """
+
+    def __init__(
+        self,
+        training_dataloaders,
+        model,
+        loss,
+        optimizer_class,
+        learning_rate,
+        num_updates,
+        nrounds,
+    ):
+        if len(training_dataloaders) != 1:
+            raise ValueError(
+                "Centralised training expects a single dataloader on the "
+                f"pooled data, got {len(training_dataloaders)}"
+            )
+        self.dataloaders_with_memory = [
+            DataLoaderWithMemory(training_dataloaders[0])
+        ]
+        self.models_list = [
+            _Model(
+                model=model,
+                optimizer_class=optimizer_class,
+                lr=learning_rate,
+                train_dl=training_dataloaders[0],
+                loss=loss,
+                nrounds=nrounds,
+                client_id=0,
+            )
+        ]
+        self.num_updates = num_updates
+        self.nrounds = nrounds
+
+    def perform_round(self):
+        self.models_list[0]._local_train(
+            self.dataloaders_with_memory[0], self.num_updates
+        )
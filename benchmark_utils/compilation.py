@@ -0,0 +1,105 @@
+import os
+import warnings
+from pathlib import Path
+
+import torch
+
+# Compiled artifacts are cached next to benchopt's own cache so that the many
+# runs of a grid-search only pay the compilation cost once
+CACHE_DIR = Path(__file__).parents[1] / "__cache__" / "torch_compile"
+
+
+def enable_compile_cache(cache_dir=CACHE_DIR):
+    """Cache the artifacts of inductor on disk, across processes."""
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(cache_dir))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    # The environment is only read when inductor is imported
+    from torch._inductor import config
+
+    if hasattr(config, "fx_graph_cache"):
+        config.fx_graph_cache = True
+
+
+def is_compiled(model):
+    return "forward" in vars(model)
+
+
+def outputs_and_gradients(forward, model, sample, target=None, loss=None):
+    """Outputs of `forward` on `sample`, and gradients with respect to the
+    parameters of `model` of the loss on `target`, or of the sum of the
+    outputs if no loss is given."""
+    outputs = forward(sample)
+    if loss is None or target is None:
+        value = outputs.sum()
+    else:
+        value = loss(outputs, target)
+    params = [p for p in model.parameters() if p.requires_grad]
+    grads = torch.autograd.grad(value, params, allow_unused=True)
+    grads = [
+        torch.zeros_like(p) if g is None else g for p, g in zip(params, grads)
+    ]
+    return outputs.detach(), torch.cat([g.reshape(-1) for g in grads])
+
+
+def compile_model(
+    model, sample=None, target=None, loss=None, rtol=1e-4, atol=1e-5
+):
+    """Compile the forward of `model` in place with `torch.compile`.
+
+    Only the forward is replaced so that the module, its parameters and the
+    optimizers built on them are left untouched. Note that the model must
+    not be deep-copied afterwards as the copies would share the forward of
+    the original model.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The model to compile.
+    sample : torch.Tensor or None
+        If given, the outputs of the eager and compiled models on this batch
+        and the gradients of a backward step through them are compared, and
+        the model is left in eager mode if they differ. The batch is moved
+        to the device of the model, so that the kernels compared are the
+        ones of the training.
+    target : torch.Tensor or None
+        The target of `sample`, for the loss of the backward step.
+    loss : callable or None
+        The loss of the backward step. If None, the outputs are summed.
+    rtol, atol : float
+        Tolerances of the comparison.
+
+    Returns
+    -------
+    compiled : bool
+        Whether the model was compiled.
+    """
+    if is_compiled(model):
+        return True
+    enable_compile_cache()
+    compiled_forward = torch.compile(model.forward)
+    if sample is not None:
+        device = next(model.parameters()).device
+        sample = sample.to(device)
+        if target is not None:
+            target = target.to(device)
+        # Both steps are run in eval mode so that they are deterministic
+        training = model.training
+        model.eval()
+        expected = outputs_and_gradients(
+            model.forward, model, sample, target, loss
+        )
+        actual = outputs_and_gradients(
+            compiled_forward, model, sample, target, loss
+        )
+        model.train(training)
+        for name, e, a in zip(("outputs", "gradients"), expected, actual):
+            if not torch.allclose(e, a, rtol=rtol, atol=atol):
+                max_diff = (e - a).abs().max().item()
+                warnings.warn(
+                    f"Compiled and eager models disagree on the {name} of "
+                    f"the first batch (max absolute difference of "
+                    f"{max_diff:.2e}), falling back on the eager model."
+                )
+                return False
+    model.forward = compiled_forward
+    return True
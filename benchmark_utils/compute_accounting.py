@@ -0,0 +1,163 @@
+import copy
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import torch
+
+
+def count_compute():
+    return os.environ.get("FLAMBY_BENCHMARK_COUNT_COMPUTE") == "1"
+
+
+class ComputeCounter:
+    """Accumulate the FLOPs, samples and optimizer steps of each client.
+
+    Counts are reported both cumulative since the creation (or last reset)
+    of the counter, and for the last round, i.e. between the last two calls
+    to `round_end`.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the keys returned by `to_dict`.
+    """
+
+    def __init__(self, prefix="compute"):
+        self.prefix = prefix
+        self.reset()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.round = {}
+        self._current = defaultdict(float)
+
+    def add(self, name, value, client_idx=None):
+        self._current[name] += value
+        if client_idx is not None:
+            self._current[f"{name}_client_{client_idx}"] += value
+
+    def round_end(self):
+        for k, v in self._current.items():
+            self.totals[k] += v
+        # Clients which did not train during the round count as 0
+        self.round = {k: self._current.get(k, 0.0) for k in self.totals}
+        self._current = defaultdict(float)
+
+    def to_dict(self):
+        res = {f"{self.prefix}_{k}": v for k, v in self.totals.items()}
+        res.update(
+            {f"{self.prefix}_round_{k}": v for k, v in self.round.items()}
+        )
+        return res
+
+
+class FlopsEstimator:
+    """FLOPs per sample of a model, measured on a single sample.
+
+    FLOPs are counted with `FlopCounterMode` on the first sample of a batch,
+    forward and backward through the loss for training batches and forward
+    only otherwise. They are measured once per shape of the samples, e.g.
+    per number of instances of padded bags, and reused for the batches of
+    samples of that shape, without assuming how they scale with any axis.
+    The measure runs on a copy of the model in eval mode, so that neither
+    its parameters nor its compilation are affected and that a single sample
+    goes through batch normalization.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The model, of the same architecture as the one trained. It is
+        copied, so it must not have been compiled, see `compile_model`.
+    loss : torch.nn.Module or None
+        The loss, needed for training batches.
+    """
+
+    def __init__(self, model, loss=None):
+        self.model = copy.deepcopy(model).eval()
+        self.loss = loss
+        self._cache = {}
+
+    def per_sample(self, X, y=None):
+        """FLOPs per sample of the batch `X`, with its backward pass if its
+        targets `y` are given."""
+        key = (tuple(X.shape[1:]), y is not None)
+        if key not in self._cache:
+            self._cache[key] = self._measure(
+                X[:1], None if y is None else y[:1]
+            )
+        return self._cache[key]
+
+    def _measure(self, X, y):
+        from torch.utils.flop_counter import FlopCounterMode
+
+        with FlopCounterMode(display=False) as counter:
+            if y is None:
+                with torch.no_grad():
+                    self.model(X)
+            else:
+                self.loss(self.model(X), y).backward()
+        self.model.zero_grad(set_to_none=True)
+        return counter.get_total_flops()
+
+
+def instrument_compute(strat, counter, estimator):
+    """Count the samples, FLOPs and optimizer steps of each client of a
+    strategy.
+
+    Samples are counted as they are drawn from the clients' dataloaders.
+    """
+    for idx, (_model, dl_with_memory) in enumerate(
+        zip(strat.models_list, strat.dataloaders_with_memory)
+    ):
+        instrument_client(_model, dl_with_memory, idx, counter, estimator)
+
+
+def instrument_client(_model, dl_with_memory, client_idx, counter, estimator):
+    """Count the samples, FLOPs and optimizer steps of a client, given its
+    FLamby `_Model` and `DataLoaderWithMemory`."""
+    dl_with_memory.get_samples = _counted_samples(
+        dl_with_memory.get_samples, client_idx, counter, estimator
+    )
+    _model._optimizer.step = _counted_steps(
+        _model._optimizer.step, client_idx, counter
+    )
+
+
+def _counted_samples(get_samples, client_idx, counter, estimator):
+    @wraps(get_samples)
+    def counted_get_samples(*args, **kwargs):
+        X, y = get_samples(*args, **kwargs)
+        counter.add("samples", len(y), client_idx)
+        counter.add("flops", len(y) * estimator.per_sample(X, y), client_idx)
+        return X, y
+
+    return counted_get_samples
+
+
+def _counted_steps(step, client_idx, counter):
+    @wraps(step)
+    def counted_step(*args, **kwargs):
+        counter.add("steps", 1, client_idx)
+        return step(*args, **kwargs)
+
+    return counted_step
+
+
+@contextmanager
+def counted_forward(models, counter, estimator):
+    """Count the samples and FLOPs of the forward passes of `models` in the
+    enclosed block."""
+
+    def count(module, args):
+        X = args[0]
+        counter.add("samples", len(X))
+        counter.add("flops", len(X) * estimator.per_sample(X))
+
+    handles = [model.register_forward_pre_hook(count) for model in models]
+    try:
+        yield
+    finally:
+        for handle in handles:
+            handle.remove()
@@ -0,0 +1,405 @@
+import argparse
+import atexit
+import io
+import os
+import pickle
+import time
+import traceback
+from collections import defaultdict
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from benchmark_utils.compute_accounting import (
+    ComputeCounter,
+    FlopsEstimator,
+    instrument_client,
+)
+from benchmark_utils.divergence import DivergenceGuard
+from benchmark_utils.instrumentation import LOCAL_TRAIN_METHODS, PhaseTimer
+
+# Clients' local training can be run in worker processes exchanging the
+# models with the main process over torch.distributed (gloo). The main
+# process (rank 0) runs the strategies and the evaluation, and the local
+# training methods of the clients' FLamby `_Model` are replaced by calls to
+# the worker hosting the client, which holds its own copy of the client's
+# model, optimizer and data. Strategies are thus unchanged, but as they
+# train their clients one after the other, so do the workers. The workers
+# instrument their clients as the main process would and send the counts of
+# each call back with the model.
+
+_BACKEND = None
+
+
+def use_distributed():
+    return os.environ.get("FLAMBY_BENCHMARK_DISTRIBUTED") == "1"
+
+
+def _send_bytes(data, dst):
+    dist.send(torch.tensor([len(data)], dtype=torch.int64), dst=dst)
+    if len(data) > 0:
+        data = torch.frombuffer(bytearray(data), dtype=torch.uint8)
+        dist.send(data, dst=dst)
+
+
+def _recv_bytes(src):
+    size = torch.empty(1, dtype=torch.int64)
+    dist.recv(size, src=src)
+    if int(size) == 0:
+        return b""
+    data = torch.empty(int(size), dtype=torch.uint8)
+    dist.recv(data, src=src)
+    return data.numpy().tobytes()
+
+
+def _serialize_state(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getvalue()
+
+
+def _load_state(model, data):
+    model.load_state_dict(torch.load(io.BytesIO(data), weights_only=True))
+
+
+def _init_process_group(rank, world_size, addr, port):
+    dist.init_process_group(
+        "gloo",
+        init_method=f"tcp://{addr}:{port}",
+        rank=rank,
+        world_size=world_size,
+    )
+
+
+class ClientStats:
+    """Instrumentation of the copy of a client held by a worker.
+
+    The data loading of the client is timed, the losses of its local updates
+    are recorded as by `DivergenceGuard` and, if `count_compute`, its
+    samples, FLOPs and optimizer steps are counted as by `ComputeCounter`.
+
+    Parameters
+    ----------
+    _model : flamby.strategies.utils._Model
+        The client's model, not compiled yet.
+    dl_with_memory : flamby.strategies.utils.DataLoaderWithMemory
+        The client's data.
+    count_compute : bool
+        Whether to count the compute of the client.
+    """
+
+    def __init__(self, _model, dl_with_memory, count_compute):
+        self.timer = PhaseTimer()
+        dl_with_memory.get_samples = self.timer.wrap(
+            dl_with_memory.get_samples, "data_loading"
+        )
+        self.counter = None
+        if count_compute:
+            # Before the losses are recorded, which the measure of the FLOPs
+            # must not be
+            self.counter = ComputeCounter()
+            instrument_client(
+                _model,
+                dl_with_memory,
+                None,
+                self.counter,
+                FlopsEstimator(_model.model, _model._loss),
+            )
+        self.losses = DivergenceGuard()
+        self.losses.instrument_client(_model)
+
+    def pop(self):
+        """Counts since the last call."""
+        stats = {"data_loading": self.timer.total("data_loading")}
+        self.timer.reset()
+        stats["loss_sum"], stats["loss_count"] = self.losses.pop_losses()
+        if self.counter is not None:
+            self.counter.round_end()
+            stats.update(self.counter.round)
+        return stats
+
+
+class WorkerStats:
+    """Counts sent back by the workers training the clients of a strategy,
+    accumulated until they are merged into the instrumentation of the main
+    process, see `ClientStats`."""
+
+    def __init__(self):
+        self.clients = defaultdict(lambda: defaultdict(float))
+
+    def add(self, client_idx, stats):
+        for name, value in stats.items():
+            self.clients[client_idx][name] += value
+
+    def merge(self, timer, compute_counter=None, divergence_guard=None):
+        """Add the counts to the data loading phases of `timer`, to
+        `compute_counter` and to the losses of `divergence_guard`, as if the
+        clients had been trained in the main process."""
+        for idx, stats in self.clients.items():
+            timer.add("data_loading", stats["data_loading"])
+            timer.add(f"data_loading_client_{idx}", stats["data_loading"])
+            if compute_counter is not None:
+                for name in ("samples", "flops", "steps"):
+                    compute_counter.add(name, stats[name], idx)
+            if divergence_guard is not None:
+                divergence_guard.record(
+                    stats["loss_sum"], int(stats["loss_count"])
+                )
+        self.clients.clear()
+
+
+def worker_main(rank, world_size, addr, port):
+    """Serve the requests of the main process until it stops the worker."""
+    from flamby.strategies.utils import DataLoaderWithMemory
+
+    from benchmark_utils.compilation import compile_model
+
+    _init_process_group(rank, world_size, addr, port)
+    clients = {}
+    while True:
+        request = pickle.loads(_recv_bytes(0))
+        if request["op"] == "stop":
+            break
+        if request["op"] == "release":
+            clients.pop(request["key"], None)
+            continue
+        reply, payload = {"status": "ok"}, b""
+        try:
+            if request["op"] == "register":
+                _model = request["model"]
+                dl_with_memory = DataLoaderWithMemory(request["dataloader"])
+                stats = ClientStats(
+                    _model, dl_with_memory, request["count_compute"]
+                )
+                if request["torch_compile"]:
+                    compile_model(_model.model)
+                clients[request["key"]] = (_model, dl_with_memory, stats)
+            elif request["op"] == "call":
+                _model, dl_with_memory, stats = clients[request["key"]]
+                _load_state(_model.model, request["state"])
+                t0 = time.perf_counter()
+                getattr(_model, request["method"])(
+                    dl_with_memory, *request["args"], **request["kwargs"]
+                )
+                reply["compute_time"] = time.perf_counter() - t0
+                reply["stats"] = stats.pop()
+                payload = _serialize_state(_model.model)
+        except Exception:
+            reply = {"status": "error", "traceback": traceback.format_exc()}
+        _send_bytes(pickle.dumps(reply), 0)
+        _send_bytes(payload, 0)
+    dist.destroy_process_group()
+
+
+class DistributedBackend:
+    """Pool of worker processes training the clients.
+
+    Client `k` is hosted by the worker of rank `1 + k % n_workers`. Workers
+    are spawned on the local machine, unless `external` in which case they
+    are launched separately, possibly on other nodes, with
+    `python -m benchmark_utils.distributed --rank <rank> ...`.
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes.
+    addr, port : str, int
+        Address and port of the main process.
+    external : bool
+        Whether the workers are launched separately.
+    """
+
+    def __init__(
+        self, n_workers, addr="127.0.0.1", port=29512, external=False
+    ):
+        self.n_workers = n_workers
+        self.processes = []
+        if not external:
+            context = mp.get_context("spawn")
+            for rank in range(1, n_workers + 1):
+                process = context.Process(
+                    target=worker_main,
+                    args=(rank, n_workers + 1, addr, port),
+                    daemon=True,
+                )
+                process.start()
+                self.processes.append(process)
+        _init_process_group(0, n_workers + 1, addr, port)
+
+    def worker(self, client_idx):
+        return 1 + client_idx % self.n_workers
+
+    def _request(self, client_idx, request):
+        _send_bytes(pickle.dumps(request), self.worker(client_idx))
+
+    def _reply(self, client_idx):
+        reply = pickle.loads(_recv_bytes(self.worker(client_idx)))
+        payload = _recv_bytes(self.worker(client_idx))
+        if reply["status"] == "error":
+            raise RuntimeError(
+                f"Worker of client {client_idx} failed:\n{reply['traceback']}"
+            )
+        return reply, payload
+
+    def register(
+        self, key, client_idx, _model, dataloader, torch_compile, count_compute
+    ):
+        """Send a copy of a client's model and data to its worker."""
+        self._request(
+            client_idx,
+            {
+                "op": "register",
+                "key": key,
+                "model": _model,
+                "dataloader": dataloader,
+                "torch_compile": torch_compile,
+                "count_compute": count_compute,
+            },
+        )
+        self._reply(client_idx)
+
+    def release(self, key, client_idx):
+        self._request(client_idx, {"op": "release", "key": key})
+
+    def call(self, key, client_idx, method, model, args, kwargs, timer):
+        """Run a local training method of a client on its worker, from and
+        into the parameters of `model`.
+
+        The time spent serializing and transferring the models is added to
+        the `communication` phases of `timer`, and the time spent waiting
+        for the worker beyond its training time to `synchronisation`.
+
+        Returns
+        -------
+        stats : dict
+            The counts of the call, see `ClientStats`.
+        """
+        t0 = time.perf_counter()
+        self._request(
+            client_idx,
+            {
+                "op": "call",
+                "key": key,
+                "method": method,
+                "args": args,
+                "kwargs": kwargs,
+                "state": _serialize_state(model),
+            },
+        )
+        t1 = time.perf_counter()
+        reply = pickle.loads(_recv_bytes(self.worker(client_idx)))
+        t2 = time.perf_counter()
+        payload = _recv_bytes(self.worker(client_idx))
+        if reply["status"] == "error":
+            raise RuntimeError(
+                f"Worker of client {client_idx} failed:\n{reply['traceback']}"
+            )
+        _load_state(model, payload)
+        t3 = time.perf_counter()
+        communication = (t1 - t0) + (t3 - t2)
+        timer.add("communication", communication)
+        timer.add(f"communication_client_{client_idx}", communication)
+        timer.add(
+            "synchronisation", max(t2 - t1 - reply["compute_time"], 0.0)
+        )
+        return reply["stats"]
+
+    def shutdown(self):
+        for worker in range(1, self.n_workers + 1):
+            _send_bytes(pickle.dumps({"op": "stop"}), worker)
+        dist.destroy_process_group()
+        for process in self.processes:
+            process.join()
+
+
+def get_backend(num_clients):
+    """Return the backend set by the environment, started on first use.
+
+    The backend is shared by all runs of the process, as a process can only
+    join one default process group.
+    """
+    global _BACKEND
+    if _BACKEND is None and use_distributed():
+        _BACKEND = DistributedBackend(
+            n_workers=int(
+                os.environ.get("FLAMBY_BENCHMARK_DIST_WORKERS", num_clients)
+            ),
+            addr=os.environ.get("FLAMBY_BENCHMARK_DIST_ADDR", "127.0.0.1"),
+            port=int(os.environ.get("FLAMBY_BENCHMARK_DIST_PORT", 29512)),
+            external=os.environ.get("FLAMBY_BENCHMARK_DIST_EXTERNAL") == "1",
+        )
+        atexit.register(_BACKEND.shutdown)
+    return _BACKEND
+
+
+def distribute_strategy(
+    strat, train_dls, timer, torch_compile=False, count_compute=False
+):
+    """Run the local training of the clients of `strat` on the workers.
+
+    Returns
+    -------
+    release : callable
+        Frees the copies of the clients held by the workers.
+    worker_stats : WorkerStats
+        The counts of the local training of the clients, which the workers
+        count if `count_compute`.
+    """
+    backend = get_backend(len(strat.models_list))
+    worker_stats = WorkerStats()
+    keys = []
+    for idx, (_model, train_dl) in enumerate(
+        zip(strat.models_list, train_dls)
+    ):
+        key = f"{id(strat)}_{idx}"
+        backend.register(
+            key, idx, _model, train_dl, torch_compile, count_compute
+        )
+        keys.append((key, idx))
+        for method_name in LOCAL_TRAIN_METHODS:
+            if hasattr(_model, method_name):
+                setattr(
+                    _model,
+                    method_name,
+                    _remote_method(
+                        backend,
+                        key,
+                        idx,
+                        method_name,
+                        _model,
+                        timer,
+                        worker_stats,
+                    ),
+                )
+
+    def release():
+        for key, idx in keys:
+            backend.release(key, idx)
+
+    return release, worker_stats
+
+
+def _remote_method(
+    backend, key, client_idx, method_name, _model, timer, worker_stats
+):
+    def remote_method(dataloader_with_memory, *args, **kwargs):
+        # The client's data is the worker's copy
+        stats = backend.call(
+            key, client_idx, method_name, _model.model, args, kwargs, timer
+        )
+        worker_stats.add(client_idx, stats)
+
+    return remote_method
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Start a worker training clients for a benchmark run on another machine")   # noqa: E501
+    parser.add_argument("--rank", type=int, help="Rank of the worker, from 1 to the number of workers.", required=True)   # noqa: E501
+    parser.add_argument("--world-size", type=int, help="Number of workers plus one.", required=True)   # noqa: E501
+    parser.add_argument("--addr", type=str, help="Address of the main process.", default="127.0.0.1")   # noqa: E501
+    parser.add_argument("--port", type=int, help="Port of the main process.", default=29512)   # noqa: E501
+
+    args = parser.parse_args()
+    worker_main(args.rank, args.world_size, args.addr, args.port)
@@ -0,0 +1,113 @@
+import math
+import os
+
+import torch
+
+# Codes of the reasons why a run diverged, reported in the results
+DIVERGENCE_REASONS = {
+    1: "non-finite parameters",
+    2: "parameter norm growth",
+    3: "non-finite training loss",
+    4: "training loss growth",
+}
+
+
+class DivergenceGuard:
+    """Detect diverging runs after each round, without evaluating the model.
+
+    After each round, the norm of the parameters of the global model is
+    checked against its initial norm, and the mean of the losses of the
+    local updates of the round, recorded as they are computed, against the
+    one of the first round. Non-finite values are caught by both checks.
+    Each check synchronizes with the device only once.
+
+    Parameters
+    ----------
+    norm_growth : float
+        Maximum ratio of the norm of the parameters to the initial one
+        (or to 1 if larger).
+    loss_growth : float
+        Maximum ratio of the mean training loss of a round to the one of
+        the first round.
+    """
+
+    def __init__(self, norm_growth=1e3, loss_growth=10.0):
+        self.norm_growth = norm_growth
+        self.loss_growth = loss_growth
+        self.initial_norm = None
+        self.initial_loss = None
+        self._loss_sum = 0.0
+        self._loss_count = 0
+
+    @classmethod
+    def from_env(cls):
+        """Return the guard, unless `FLAMBY_BENCHMARK_DIVERGENCE_GUARD` is
+        set to 0."""
+        if os.environ.get("FLAMBY_BENCHMARK_DIVERGENCE_GUARD") == "0":
+            return None
+        return cls()
+
+    @staticmethod
+    def parameters_norm(model):
+        with torch.no_grad():
+            norms = [p.detach().float().norm() for p in model.parameters()]
+            return torch.linalg.vector_norm(torch.stack(norms)).item()
+
+    def instrument(self, strat):
+        """Record the losses of the local updates of the clients of `strat`.
+        """
+        for _model in strat.models_list:
+            self.instrument_client(_model)
+
+    def instrument_client(self, _model):
+        """Record the losses of the local updates of a client, given its
+        FLamby `_Model`."""
+        _model._loss = self._recorded(_model._loss)
+
+    def _recorded(self, loss):
+        def recorded_loss(*args, **kwargs):
+            value = loss(*args, **kwargs)
+            # Losses are summed on their device, so that they are only
+            # synchronized once per round
+            self.record(value.detach())
+            return value
+
+        return recorded_loss
+
+    def record(self, loss_sum, count=1):
+        """Record the sum of `count` losses of local updates of the round,
+        e.g. of updates run in worker processes."""
+        self._loss_sum = self._loss_sum + loss_sum
+        self._loss_count += count
+
+    def pop_losses(self):
+        """Sum and number of the losses recorded since the last call."""
+        loss_sum, count = float(self._loss_sum), self._loss_count
+        self._loss_sum, self._loss_count = 0.0, 0
+        return loss_sum, count
+
+    def start(self, model):
+        self.initial_norm = self.parameters_norm(model)
+
+    def check(self, model):
+        """Return the code of the reason why the run diverged during the
+        last round, 0 if it did not, see `DIVERGENCE_REASONS`."""
+        norm = self.parameters_norm(model)
+        if not math.isfinite(norm):
+            return 1
+        if norm > self.norm_growth * max(self.initial_norm, 1.0):
+            return 2
+        loss_sum, count = self.pop_losses()
+        if count == 0:
+            # No local update during the round
+            return 0
+        loss = loss_sum / count
+        if not math.isfinite(loss):
+            return 3
+        if self.initial_loss is None:
+            self.initial_loss = loss
+        elif self.initial_loss > 0 and loss > (
+            self.loss_growth * self.initial_loss
+        ):
+            return 4
+        return 0
@@ -0,0 +1,114 @@
+import math
+import os
+
+# Interval between evaluations used so far, and by default
+DEFAULT_SCHEDULE = "every:10"
+
+
+class EvaluationSchedule:
+    """Rounds after which the model of a callback-driven solver is evaluated.
+
+    benchopt evaluates the model when the callback is called after the round
+    returned by `next_round` for the previously evaluated one, the model
+    being evaluated before the first round too. The schedule is either:
+
+    - `"every:k"`: every `k` rounds,
+    - `"geometric:ratio"`: after rounds spaced geometrically, so that the
+      curve is dense at the beginning and evaluations get rare as training
+      goes,
+    - `"adaptive:tol:max_interval"`: after rounds spaced so that the
+      objective changes by about `tol` (relative to its initial value)
+      between evaluations, extrapolating from the last two evaluations.
+      Evaluations thus get more frequent when the objective changes fast,
+      the interval being at most doubled from one evaluation to the next
+      and at most `max_interval`. `tol` and `max_interval` default to
+      0.01 and 20.
+
+    As benchopt stops runs only after an evaluation, the final round of a
+    run is always evaluated. With a budget of rounds, the run is stopped
+    after the last round, which is evaluated whatever the schedule.
+
+    Parameters
+    ----------
+    schedule : str or None
+        The schedule, as described above. If None, it is read from the
+        `FLAMBY_BENCHMARK_EVAL_SCHEDULE` environment variable and defaults
+        to `"every:10"`.
+    max_rounds : int or None
+        The budget of rounds. If None, it is read from
+        `FLAMBY_BENCHMARK_MAX_ROUNDS` and the number of rounds is only
+        bounded by the evaluations allowed by benchopt's `--max-runs`.
+    """
+
+    def __init__(self, schedule=None, max_rounds=None):
+        if schedule is None:
+            schedule = (
+                os.environ.get("FLAMBY_BENCHMARK_EVAL_SCHEDULE")
+                or DEFAULT_SCHEDULE
+            )
+        if max_rounds is None:
+            max_rounds = os.environ.get("FLAMBY_BENCHMARK_MAX_ROUNDS")
+        self.max_rounds = int(max_rounds) if max_rounds is not None else None
+        mode, *args = str(schedule).split(":")
+        self.mode = mode
+        try:
+            if mode == "every":
+                (every,) = args or [10]
+                self.every = int(every)
+                valid = self.every >= 1
+            elif mode == "geometric":
+                (ratio,) = args or [1.5]
+                self.ratio = float(ratio)
+                valid = self.ratio > 1
+            elif mode == "adaptive":
+                tol, max_interval = args + [0.01, 20][len(args):]
+                self.tol = float(tol)
+                self.max_interval = int(max_interval)
+                valid = self.tol > 0 and self.max_interval >= 1
+            else:
+                valid = False
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError(f"Invalid evaluation schedule: {schedule}")
+        if self.max_rounds is not None and self.max_rounds < 1:
+            raise ValueError(f"Invalid budget of rounds: {max_rounds}")
+        self._interval = 1
+
+    def _adaptive_interval(self, curve):
+        if len(curve) < 2:
+            return 1
+        first, previous, last = curve[0], curve[-2], curve[-1]
+        change = abs(last["objective_value"] - previous["objective_value"])
+        scale = abs(first["objective_value"]) or 1.0
+        rate = change / scale / (last["stop_val"] - previous["stop_val"])
+        if not math.isfinite(rate):
+            return 1
+        interval = self.tol / rate if rate > 0 else math.inf
+        interval = min(interval, 2 * self._interval, self.max_interval)
+        self._interval = max(1, int(interval))
+        return self._interval
+
+    def next_round(self, stop_val, curve=()):
+        """The round after which the model is evaluated next.
+
+        Parameters
+        ----------
+        stop_val : int
+            The round after which the model was last evaluated.
+        curve : list of dict
+            benchopt's curve so far, used by the adaptive schedule.
+        """
+        if self.mode == "every":
+            next_val = stop_val + self.every
+        elif self.mode == "geometric":
+            next_val = max(stop_val + 1, math.ceil(stop_val * self.ratio))
+        else:
+            next_val = stop_val + self._adaptive_interval(curve)
+        if self.max_rounds is not None and stop_val < self.max_rounds:
+            next_val = min(next_val, self.max_rounds)
+        return next_val
+
+    def is_over(self, n_rounds):
+        """Whether the budget of rounds is spent."""
+        return self.max_rounds is not None and n_rounds >= self.max_rounds
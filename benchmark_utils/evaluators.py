@@ -0,0 +1,112 @@
+# Registry of the functions evaluating a model on the test dataloaders of the
+# clients. Each dataset declares the name of its evaluator, which is only
+# imported when it is used so that the dependencies of one dataset (e.g. the
+# 3D-imaging stack of KITS19 and LIDC-IDRI) are not loaded for the others.
+# All evaluators share the signature `evaluate(model, test_dls, metric)` and
+# return a dict mapping `client_test_<k>` to the metric on client k. Datasets
+# can also declare keyword arguments of their evaluator, e.g. the patch size
+# of the sliding-window inference.
+
+import functools
+import os
+
+EVALUATORS = {}
+LOSS_EVALUATORS = {}
+
+
+def register_evaluator(name):
+    """Register the decorated function as the evaluator `name`."""
+
+    def decorator(func):
+        EVALUATORS[name] = func
+        return func
+
+    return decorator
+
+
+def register_loss_evaluator(name):
+    """Register the decorated function as the loss evaluator of the
+    evaluator `name`.
+
+    Loss evaluators share the signature `evaluate(model, dl, loss)` and
+    return the average loss of the model on the batches of `dl`. Evaluators
+    without one have their losses computed on whole batches.
+    """
+
+    def decorator(func):
+        LOSS_EVALUATORS[name] = func
+        return func
+
+    return decorator
+
+
+def get_loss_evaluator(name, **params):
+    """The loss evaluator of the evaluator `name`, or None."""
+    evaluator = LOSS_EVALUATORS.get(name)
+    if evaluator is not None and len(params) > 0:
+        evaluator = functools.partial(evaluator, **params)
+    return evaluator
+
+
+def get_evaluator(name, **params):
+    try:
+        evaluator = EVALUATORS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown evaluator {name}, available evaluators are "
+            f"{sorted(EVALUATORS)}"
+        )
+    if len(params) > 0:
+        evaluator = functools.partial(evaluator, **params)
+    return evaluator
+
+
+@register_evaluator("model_on_tests")
+def evaluate_model_on_tests(model, test_dls, metric):
+    from flamby.utils import evaluate_model_on_tests
+
+    return evaluate_model_on_tests(model, test_dls, metric)
+
+
+@register_evaluator("dice_on_tests")
+def evaluate_dice_on_tests(model, test_dls, metric):
+    from flamby.datasets.fed_kits19 import evaluate_dice_on_tests
+
+    return evaluate_dice_on_tests(model, test_dls, metric)
+
+
+@register_evaluator("dice_on_tests_by_chunks")
+def evaluate_dice_on_tests_by_chunks(model, test_dls, metric):
+    from flamby.datasets.fed_lidc_idri import evaluate_dice_on_tests_by_chunks
+
+    return evaluate_dice_on_tests_by_chunks(model, test_dls)
+
+
+def _sliding_window_params(params):
+    # The memory cap doesn't change the results, it can be set per machine
+    max_batch_voxels = os.environ.get("FLAMBY_BENCHMARK_SW_MAX_VOXELS")
+    if max_batch_voxels is not None:
+        params["max_batch_voxels"] = int(max_batch_voxels)
+    return params
+
+
+@register_evaluator("sliding_window")
+def evaluate_sliding_window(model, test_dls, metric, **params):
+    from benchmark_utils.sliding_window import evaluate_sliding_window
+
+    return evaluate_sliding_window(
+        model, test_dls, metric, **_sliding_window_params(params)
+    )
+
+
+@register_loss_evaluator("sliding_window")
+def sliding_window_loss(model, dl, loss, **params):
+    from benchmark_utils.sliding_window import sliding_window_loss
+
+    # The prediction only matters for the metric
+    params.pop("prediction", None)
+    params.pop("to_numpy", None)
+    params.pop("aggregation", None)
+    return sliding_window_loss(
+        model, dl, loss, **_sliding_window_params(params)
+    )
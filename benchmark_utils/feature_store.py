@@ -0,0 +1,110 @@
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+# Features are cached next to benchopt's own cache
+CACHE_DIR = Path(__file__).parents[1] / "__cache__" / "features"
+
+
+def hash_module(module):
+    """Return a short hash of the parameters and buffers of `module`."""
+    h = hashlib.sha1()
+    for k, v in module.state_dict().items():
+        h.update(k.encode())
+        h.update(v.detach().cpu().numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+class FeatureDataset(Dataset):
+    """Dataset of precomputed features and their targets.
+
+    Features are memory-mapped from the store, targets are held in memory.
+    """
+
+    def __init__(self, features, targets, X_dtype=torch.float32):
+        self.features = features
+        self.targets = targets
+        self.X_dtype = X_dtype
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        X = torch.from_numpy(np.asarray(self.features[idx])).to(self.X_dtype)
+        return X, torch.as_tensor(self.targets[idx])
+
+
+class FeatureStore:
+    """On-disk store of the features computed by a frozen backbone.
+
+    Features are stored as float16 `.npy` files, one per dataset key, under
+    a folder named after the hash of the backbone so that features computed
+    with different weights can't be mixed up.
+
+    Parameters
+    ----------
+    backbone : torch.nn.Module
+        The frozen backbone mapping a batch of inputs to a batch of features.
+    name : str
+        Name of the store, typically the name of the dataset.
+    cache_dir : str or Path
+        Root folder of the stores.
+    batch_size : int
+        Batch size used to compute the features.
+    """
+
+    def __init__(self, backbone, name, cache_dir=CACHE_DIR, batch_size=64):
+        self.backbone = backbone
+        self.folder = Path(cache_dir) / name / hash_module(backbone)
+        self.batch_size = batch_size
+
+    def _paths(self, key):
+        return (
+            self.folder / f"{key}_features.npy",
+            self.folder / f"{key}_targets.npy",
+        )
+
+    def __contains__(self, key):
+        return all(p.exists() for p in self._paths(key))
+
+    @torch.no_grad()
+    def compute(self, key, dataset):
+        """Compute and store the features of all samples of `dataset`."""
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        backbone = self.backbone.to(device).eval()
+        features, targets = [], []
+        for X, y in DataLoader(dataset, self.batch_size, shuffle=False):
+            features.append(
+                backbone(X.to(device)).cpu().numpy().astype(np.float16)
+            )
+            targets.append(y.numpy())
+        self.folder.mkdir(parents=True, exist_ok=True)
+        features_path, targets_path = self._paths(key)
+        # Written to temporary files of the process first so that concurrent
+        # runs never read partially written features
+        for path, array in [
+            (features_path, np.concatenate(features)),
+            (targets_path, np.concatenate(targets)),
+        ]:
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+
+    def load(self, key, dataset_factory=None):
+        """Return the `FeatureDataset` of `key`.
+
+        If the features are not in the store yet, they are computed on the
+        dataset returned by `dataset_factory`.
+        """
+        if key not in self:
+            if dataset_factory is None:
+                raise FileNotFoundError(f"No features for {key} in the store")
+            self.compute(key, dataset_factory())
+        features_path, targets_path = self._paths(key)
+        return FeatureDataset(
+            np.load(features_path, mmap_mode="r"), np.load(targets_path)
+        )
@@ -0,0 +1,194 @@
+import copy
+import heapq
+import math
+
+import numpy as np
+import torch
+from flamby.strategies.utils import DataLoaderWithMemory, _Model
+
+
+def staleness_weight(staleness):
+    """Weight of an update computed on a model `staleness` versions old."""
+    return 1.0 / math.sqrt(1.0 + staleness)
+
+
+class FedBuff:
+    """Buffered asynchronous federated learning (FedBuff).
+
+    Clients train concurrently, each starting from the latest server model
+    available when it finishes its previous local training, and send their
+    update to the server after a random latency. The server buffers updates
+    and aggregates them as soon as `buffer_size` of them arrived, weighting
+    each by its staleness, i.e. the number of server versions elapsed since
+    the client pulled its model.
+
+    Concurrency is simulated with a discrete-event clock: the local training
+    of a client is computed when it starts and its update is delivered at
+    its simulated arrival time, so that runs are reproducible. One call to
+    `perform_round` performs one server aggregation.
+
+    Parameters
+    ----------
+    training_dataloaders : list of torch.utils.data.DataLoader
+        The training dataloaders of the clients.
+    model : torch.nn.Module
+        The initial model.
+    loss : torch.nn.Module
+        The loss minimized by the clients.
+    optimizer_class : torch.optim.Optimizer
+        The class of the clients' optimizers.
+    learning_rate : float
+        The learning rate of the clients' optimizers.
+    num_updates : int
+        The number of local updates of each local training.
+    nrounds : int
+        Unused, for compatibility with FLamby's strategies.
+    buffer_size : int
+        The number of updates aggregated by the server at once.
+    server_learning_rate : float
+        The learning rate of the server.
+    latency_means : list of float or None
+        The mean latency of each client, in simulated seconds, between the
+        start of a local training and the reception of its update. Latencies
+        follow log-normal distributions around their means. All clients
+        have a mean latency of 1 if None.
+    latency_sigma : float
+        The standard deviation of the log of the latencies.
+    seed : int
+        The seed of the latencies.
+
+    References
+    ----------
+    - https://arxiv.org/abs/2106.06639
+    """
+
+    def __init__(
+        self,
+        training_dataloaders,
+        model,
+        loss,
+        optimizer_class,
+        learning_rate,
+        num_updates,
+        nrounds,
+        buffer_size=2,
+        server_learning_rate=1.0,
+        latency_means=None,
+        latency_sigma=0.25,
+        seed=42,
+    ):
+        self.dataloaders_with_memory = [
+            DataLoaderWithMemory(e) for e in training_dataloaders
+        ]
+        self.num_clients = len(training_dataloaders)
+        self.models_list = [
+            _Model(
+                model=model,
+                optimizer_class=optimizer_class,
+                lr=learning_rate,
+                train_dl=_train_dl,
+                loss=loss,
+                nrounds=nrounds,
+                client_id=i,
+            )
+            for i, _train_dl in enumerate(training_dataloaders)
+        ]
+        self.server_model = copy.deepcopy(model)
+        self.num_updates = num_updates
+        self.nrounds = nrounds
+        self.buffer_size = buffer_size
+        self.server_learning_rate = server_learning_rate
+        if latency_means is None:
+            latency_means = [1.0] * self.num_clients
+        self.latency_means = latency_means
+        self.latency_sigma = latency_sigma
+        self.rng = np.random.default_rng(seed)
+
+        self.version = 0
+        self.simulated_time = 0.0
+        self.n_client_updates = 0
+        self.total_staleness = 0
+        self._events = []
+        self._n_events = 0
+        self._started = False
+
+    def _latency(self, client_idx):
+        # Log-normal latencies whose mean is the mean latency of the client
+        sigma = self.latency_sigma
+        noise = self.rng.lognormal(-(sigma**2) / 2, sigma)
+        return self.latency_means[client_idx] * noise
+
+    def _start_local_training(self, client_idx):
+        """Train a client from the current server model and schedule the
+        reception of its update."""
+        _model = self.models_list[client_idx]
+        with torch.no_grad():
+            server_params = [
+                p.detach().clone() for p in self.server_model.parameters()
+            ]
+            for p, server_p in zip(_model.model.parameters(), server_params):
+                p.data.copy_(server_p)
+        _model._local_train(
+            self.dataloaders_with_memory[client_idx], self.num_updates
+        )
+        with torch.no_grad():
+            local_params = _model.model.parameters()
+            update = [
+                p.detach() - server_p
+                for p, server_p in zip(local_params, server_params)
+            ]
+        arrival = self.simulated_time + self._latency(client_idx)
+        # The counter breaks ties between simultaneous arrivals
+        heapq.heappush(
+            self._events,
+            (arrival, self._n_events, client_idx, self.version, update),
+        )
+        self._n_events += 1
+
+    @torch.no_grad()
+    def _aggregate(self, buffer):
+        for p_idx, p in enumerate(self.server_model.parameters()):
+            aggregated = sum(
+                staleness_weight(staleness) * update[p_idx]
+                for staleness, update in buffer
+            )
+            p.data += (
+                self.server_learning_rate * aggregated / len(buffer)
+            ).to(p.device)
+        self.version += 1
+
+    def perform_round(self):
+        """Process the arrivals of updates until the server aggregates."""
+        if not self._started:
+            for client_idx in range(self.num_clients):
+                self._start_local_training(client_idx)
+            self._started = True
+
+        buffer = []
+        while len(buffer) < self.buffer_size:
+            arrival, _, client_idx, version, update = heapq.heappop(
+                self._events
+            )
+            self.simulated_time = arrival
+            staleness = self.version - version
+            buffer.append((staleness, update))
+            self.n_client_updates += 1
+            self.total_staleness += staleness
+            if len(buffer) == self.buffer_size:
+                self._aggregate(buffer)
+            # The client pulls the latest model and starts again right away
+            self._start_local_training(client_idx)
+
+    def stats(self):
+        """Statistics of the simulated asynchronous training.
+
+        The simulated time is reported as `fedbuff_simulated_time`, so that
+        it doesn't overwrite the `simulated_time` of `SiloSimulator`.
+        """
+        return {
+            "fedbuff_simulated_time": self.simulated_time,
+            "n_client_updates": self.n_client_updates,
+            "staleness_mean": (
+                self.total_staleness / max(self.n_client_updates, 1)
+            ),
+        }
@@ -0,0 +1,91 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import Dataset
+
+# Decoded images are cached next to benchopt's own cache
+CACHE_DIR = Path(__file__).parents[1] / "__cache__" / "decoded_images"
+
+
+def decode(dataset, idx, size):
+    """Decode an image of a FLamby image dataset without its augmentations,
+    resized so that its shorter side is `size` and center-cropped."""
+    augmentations = dataset.augmentations
+    dataset.augmentations = None
+    try:
+        X, y = dataset[idx]
+    finally:
+        dataset.augmentations = augmentations
+    X = X.float()
+    short_side = min(X.shape[-2:])
+    if short_side != size:
+        out_size = [round(s * size / short_side) for s in X.shape[-2:]]
+        X = F.interpolate(
+            X[None], size=out_size, mode="bilinear", antialias=True
+        )[0]
+    top = (X.shape[-2] - size) // 2
+    left = (X.shape[-1] - size) // 2
+    X = X[:, top:top + size, left:left + size]
+    return X.round().clamp(0, 255).to(torch.uint8), y
+
+
+class DecodedImageCache(Dataset):
+    """Images of a FLamby dataset, decoded once and memory-mapped.
+
+    The images are decoded without their augmentations into square uint8
+    images, stored in a `.npy` file and read back memory-mapped, so that
+    later runs and concurrent processes skip decoding. The per-image
+    augmentations are replaced by batched ones, see
+    `benchmark_utils.batch_augmentation`.
+
+    Parameters
+    ----------
+    dataset : torch.utils.data.Dataset
+        A FLamby image dataset, with its `augmentations` attribute.
+    name : str
+        Name of the cache file, which must identify the dataset.
+    size : int
+        Size of the square images.
+    cache_dir : str or Path
+        Folder of the cache files.
+    """
+
+    def __init__(self, dataset, name, size=224, cache_dir=CACHE_DIR):
+        path = Path(cache_dir) / f"{name}_{size}.npy"
+        targets_path = Path(cache_dir) / f"{name}_{size}_targets.pt"
+        if not (path.exists() and targets_path.exists()):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # The files are moved in place once complete so that concurrent
+            # processes never read a partial cache
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npy")
+            images = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.uint8,
+                shape=(len(dataset), 3, size, size),
+            )
+            targets = []
+            for idx in range(len(dataset)):
+                X, y = decode(dataset, idx, size)
+                images[idx] = X.numpy()
+                targets.append(y)
+            images.flush()
+            del images
+            tmp_targets_path = targets_path.with_suffix(f".{os.getpid()}.tmp")
+            torch.save(torch.stack(targets), tmp_targets_path)
+            os.replace(tmp_targets_path, targets_path)
+            os.replace(tmp_path, path)
+        self.images = np.load(path, mmap_mode="r")
+        self.targets = torch.load(targets_path)
+        if len(self.images) != len(dataset):
+            raise ValueError(
+                f"The cache {path} holds {len(self.images)} images instead of "
+                f"{len(dataset)}, delete it to decode the images again"
+            )
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, idx):
+        return torch.from_numpy(np.array(self.images[idx])), self.targets[idx]
@@ -0,0 +1,282 @@
+import gc
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import torch
+
+# Methods of FLamby's `_Model` performing the local updates of a client,
+# depending on the strategy (FedAvg/FedOpt/Cyclic, FedProx and Scaffold)
+LOCAL_TRAIN_METHODS = [
+    "_local_train",
+    "_prox_local_train",
+    "_local_train_with_correction",
+]
+
+
+class PhaseTimer:
+    """Accumulate wall-clock time and counters per named phase.
+
+    Timings are cumulative since the creation (or last reset) of the timer
+    so that they can be compared with benchopt's own `time` column, the
+    per-round values being obtained by differencing consecutive rows.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the keys returned by `to_dict`.
+    """
+
+    def __init__(self, prefix="time"):
+        self.prefix = prefix
+        self.reset()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block and add it to the phase `name`."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name, elapsed):
+        self.totals[name] += elapsed
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def total(self, name):
+        return self.totals.get(name, 0.0)
+
+    def wrap(self, func, *names):
+        """Return `func` timed under each phase of `names`."""
+
+        @wraps(func)
+        def timed_func(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t0
+                for name in names:
+                    self.add(name, elapsed)
+
+        return timed_func
+
+    def to_dict(self):
+        res = {f"{self.prefix}_{k}": v for k, v in self.totals.items()}
+        res.update({f"n_{k}": v for k, v in self.counters.items()})
+        return res
+
+
+class MemoryLimitExceeded(RuntimeError):
+    """Raised when the memory soft limit is exceeded during a run."""
+
+
+def current_rss():
+    """Return the current resident set size of the process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Not on Linux, fall back on the peak RSS of the process
+        return max_rss()
+
+
+def max_rss():
+    """Return the peak resident set size of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def live_tensors_bytes():
+    """Return the number of bytes held by live torch tensors."""
+    if torch.cuda.is_available():
+        return torch.cuda.memory_allocated()
+    total = 0
+    for obj in gc.get_objects():
+        try:
+            if torch.is_tensor(obj) and not obj.is_cuda:
+                total += obj.element_size() * obj.nelement()
+        except ReferenceError:
+            continue
+    return total
+
+
+class MemoryTracker:
+    """Record memory high-water marks per named stage.
+
+    For each stage the peak RSS of the process and the size of the live
+    torch tensors are recorded. The process peak RSS can't be reset, so the
+    peak of a stage is the process peak if it was raised during the stage
+    and the largest of the RSS at entry and exit otherwise. On GPU the
+    tensors peak is exact thanks to torch's allocator statistics, on CPU it
+    is the size of the live tensors at the end of the stage. As the latter
+    requires scanning all objects tracked by the garbage collector, it is
+    only done on demand.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the keys returned by `to_dict`.
+    limit : float or None
+        Soft limit on the RSS in GB. When it is exceeded at the end of a
+        stage, `MemoryLimitExceeded` is raised with a diagnostic. If None,
+        it is read from the `FLAMBY_BENCHMARK_MEMORY_LIMIT` environment
+        variable, and no limit is enforced if the latter is not set.
+    track_tensors : bool or None
+        Whether to track the size of live tensors. If None, they are always
+        tracked on GPU and on CPU only if the
+        `FLAMBY_BENCHMARK_TRACK_TENSORS` environment variable is set to 1.
+    """
+
+    def __init__(self, prefix="mem", limit=None, track_tensors=None):
+        self.prefix = prefix
+        if limit is None:
+            limit = os.environ.get("FLAMBY_BENCHMARK_MEMORY_LIMIT")
+        self.limit = None if limit is None else float(limit) * 1024**3
+        if track_tensors is None:
+            track_tensors = torch.cuda.is_available() or (
+                os.environ.get("FLAMBY_BENCHMARK_TRACK_TENSORS") == "1"
+            )
+        self.track_tensors = track_tensors
+        self.reset()
+
+    def reset(self):
+        self.peak_rss = defaultdict(int)
+        self.peak_tensors = defaultdict(int)
+        # Time spent measuring memory, so that it can be deduced from timings
+        self.overhead = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        """Track the memory used by the enclosed block as stage `name`."""
+        t0 = time.perf_counter()
+        rss_start, max_rss_start = current_rss(), max_rss()
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        self.overhead += time.perf_counter() - t0
+        yield
+        t0 = time.perf_counter()
+        rss_end, max_rss_end = current_rss(), max_rss()
+        if max_rss_end > max_rss_start:
+            peak = max_rss_end
+        else:
+            peak = max(rss_start, rss_end)
+        self.peak_rss[name] = max(self.peak_rss[name], peak)
+        if self.track_tensors:
+            if torch.cuda.is_available():
+                tensors = torch.cuda.max_memory_allocated()
+            else:
+                tensors = live_tensors_bytes()
+            self.peak_tensors[name] = max(self.peak_tensors[name], tensors)
+        self.overhead += time.perf_counter() - t0
+        self.check(name, rss_end)
+
+    def wrap(self, func, name):
+        """Return `func` tracked as stage `name`."""
+
+        @wraps(func)
+        def tracked_func(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return tracked_func
+
+    def check(self, name, rss):
+        if self.limit is None or rss <= self.limit:
+            return
+        peaks = "\n".join(
+            f"  {k}: {v / 1024**2:.0f}MB RSS"
+            + (
+                f", {self.peak_tensors[k] / 1024**2:.0f}MB of tensors"
+                if self.track_tensors
+                else ""
+            )
+            for k, v in sorted(
+                self.peak_rss.items(), key=lambda kv: kv[1], reverse=True
+            )
+        )
+        raise MemoryLimitExceeded(
+            f"RSS of {rss / 1024**3:.2f}GB exceeded the soft limit of "
+            f"{self.limit / 1024**3:.2f}GB at the end of stage {name}.\n"
+            f"Peaks per stage:\n{peaks}"
+        )
+
+    def to_dict(self):
+        # Values are reported in MB
+        res = {
+            f"{self.prefix}_peak_rss_{k}": v / 1024**2
+            for k, v in self.peak_rss.items()
+        }
+        res.update(
+            {
+                f"{self.prefix}_tensors_{k}": v / 1024**2
+                for k, v in self.peak_tensors.items()
+            }
+        )
+        return res
+
+
+@contextmanager
+def tracked(name, timer, memory_tracker):
+    """Time and track the memory of the enclosed block as `name`."""
+    # Memory is tracked outside of the timer to keep its cost out of timings
+    with memory_tracker.stage(name), timer.phase(name):
+        yield
+
+
+def instrument_strategy(strat, timer, memory_tracker=None):
+    """Time local training and data loading of each client of a strategy.
+
+    The methods of the FLamby `_Model` and `DataLoaderWithMemory` objects
+    held by the strategy are overridden on the instances, which leaves the
+    strategy classes untouched. Note that local training times include the
+    data loading of the client.
+
+    Parameters
+    ----------
+    strat : flamby.strategies strategy
+        An instantiated FLamby strategy.
+    timer : PhaseTimer
+        The timer accumulating the timings.
+    memory_tracker : MemoryTracker or None
+        If given, also tracks the memory used by the local training of each
+        client and by the update of the models with the aggregated updates.
+    """
+    for idx, _model in enumerate(strat.models_list):
+        for method_name in LOCAL_TRAIN_METHODS:
+            if hasattr(_model, method_name):
+                method = timer.wrap(
+                    getattr(_model, method_name),
+                    "local_train",
+                    f"local_train_client_{idx}",
+                )
+                if memory_tracker is not None:
+                    method = memory_tracker.wrap(
+                        method, f"local_train_client_{idx}"
+                    )
+                setattr(_model, method_name, method)
+        if memory_tracker is not None and hasattr(_model, "_update_params"):
+            _model._update_params = memory_tracker.wrap(
+                _model._update_params, "aggregation"
+            )
+
+    for idx, dl_with_memory in enumerate(
+        getattr(strat, "dataloaders_with_memory", [])
+    ):
+        dl_with_memory.get_samples = timer.wrap(
+            dl_with_memory.get_samples,
+            "data_loading",
+            f"data_loading_client_{idx}",
+        )
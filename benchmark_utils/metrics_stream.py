@@ -0,0 +1,175 @@
+import atexit
+import json
+import math
+import numbers
+import os
+import queue
+import re
+import threading
+import time
+from pathlib import Path
+
+_STREAM = None
+_STOP = object()
+
+
+def _json_value(value):
+    # Strict JSON has no NaN nor infinity
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, str) or value is None:
+        return value
+    return str(value)
+
+
+def _metric_name(key):
+    return "flamby_benchmark_" + re.sub(r"[^a-zA-Z0-9_]", "_", key)
+
+
+def _sample_value(value):
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class MetricsStream:
+    """Stream the metrics of the runs while they are running.
+
+    Records are put in a queue and written by a background thread, so that
+    emitting one never blocks the training. Each record is appended as a
+    line of a JSONL file, and the latest numeric values of each run and kind
+    of record can be exposed as gauges in a Prometheus textfile, rewritten
+    atomically, for node exporter's textfile collector.
+
+    Parameters
+    ----------
+    jsonl_path : str or None
+        File to which records are appended.
+    prometheus_path : str or None
+        Prometheus textfile with the latest values.
+    flush_interval : float
+        Maximum time, in seconds, records wait before being written.
+    """
+
+    def __init__(
+        self, jsonl_path=None, prometheus_path=None, flush_interval=1.0
+    ):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.flush_interval = flush_interval
+        self.run = None
+        self._latest = {}
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls):
+        """Return the stream set by `FLAMBY_BENCHMARK_METRICS_JSONL` and
+        `FLAMBY_BENCHMARK_METRICS_PROM_DIR`, if any.
+
+        The Prometheus textfile of each process is written in the folder as
+        `flamby_benchmark_<pid>.prom`.
+        """
+        jsonl_path = os.environ.get("FLAMBY_BENCHMARK_METRICS_JSONL")
+        prom_dir = os.environ.get("FLAMBY_BENCHMARK_METRICS_PROM_DIR")
+        if jsonl_path is None and prom_dir is None:
+            return None
+        prometheus_path = None
+        if prom_dir is not None:
+            prometheus_path = os.path.join(
+                prom_dir, f"flamby_benchmark_{os.getpid()}.prom"
+            )
+        return cls(jsonl_path, prometheus_path)
+
+    def emit(self, kind, record):
+        """Queue a record of the current run, e.g. a round or an evaluation.
+        """
+        record = {
+            "timestamp": time.time(),
+            "pid": os.getpid(),
+            "run": self.run,
+            "kind": kind,
+            **record,
+        }
+        self._queue.put(record)
+
+    def _write_loop(self):
+        stop = False
+        while not stop:
+            records = []
+            try:
+                records.append(self._queue.get(timeout=self.flush_interval))
+                # Records queued in the meantime are written at once
+                while True:
+                    records.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if _STOP in records:
+                stop = True
+                records = [r for r in records if r is not _STOP]
+            if len(records) > 0:
+                self._write(records)
+
+    def _write(self, records):
+        if self.jsonl_path is not None:
+            Path(self.jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+            lines = [
+                json.dumps({k: _json_value(v) for k, v in r.items()})
+                for r in records
+            ]
+            with open(self.jsonl_path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        if self.prometheus_path is not None:
+            for r in records:
+                self._latest[(r["run"], r["kind"])] = r
+            self._write_prometheus()
+
+    def _write_prometheus(self):
+        gauges = {}
+        for (run, kind), record in sorted(
+            self._latest.items(), key=lambda item: str(item[0])
+        ):
+            labels = f'run="{_label_value(run)}",kind="{kind}"'
+            for key, value in record.items():
+                if key == "pid" or not isinstance(value, numbers.Real):
+                    continue
+                name = _metric_name(key)
+                gauges.setdefault(name, []).append(
+                    f"{name}{{{labels}}} {_sample_value(value)}"
+                )
+        # The collector may read the file at any time
+        tmp_path = self.prometheus_path + ".tmp"
+        Path(tmp_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            for name, samples in gauges.items():
+                f.write(f"# TYPE {name} gauge\n")
+                f.write("\n".join(samples) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
+
+    def close(self):
+        """Write the pending records and stop the writer."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+def get_stream():
+    """Return the stream set by the environment, shared by all runs of the
+    process."""
+    global _STREAM
+    if _STREAM is None:
+        _STREAM = MetricsStream.from_env()
+        if _STREAM is not None:
+            atexit.register(_STREAM.close)
+    return _STREAM
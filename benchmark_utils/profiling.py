@@ -0,0 +1,114 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+# Profiles are written next to benchopt's results
+DEFAULT_OUTPUT_DIR = Path(__file__).parents[1] / "outputs" / "profiles"
+
+
+class TorchProfiler:
+    """Capture a window of rounds and one evaluation with `torch.profiler`.
+
+    For each capture, a Chrome trace (which can also be opened with
+    Perfetto) and a table summarizing the time spent in each operator are
+    written to the output folder. The profiler is disabled unless a window
+    of rounds is given, either directly or through the
+    `FLAMBY_BENCHMARK_PROFILE` environment variable, so that it can be
+    enabled for a single benchopt run without editing the benchmark.
+
+    Parameters
+    ----------
+    rounds : str or None
+        Window of rounds to profile, as `"first:last"` (both included,
+        rounds being numbered from 0) or `"round"` for a single round. The
+        evaluation following the last round of the window is profiled too.
+        If None, it is read from `FLAMBY_BENCHMARK_PROFILE`.
+    output_dir : str or None
+        Folder where traces and tables are written. If None, it is read from
+        `FLAMBY_BENCHMARK_PROFILE_DIR` and defaults to `outputs/profiles`.
+    """
+
+    def __init__(self, rounds=None, output_dir=None):
+        if rounds is None:
+            rounds = os.environ.get("FLAMBY_BENCHMARK_PROFILE")
+        if output_dir is None:
+            output_dir = os.environ.get(
+                "FLAMBY_BENCHMARK_PROFILE_DIR", DEFAULT_OUTPUT_DIR
+            )
+        self.output_dir = Path(output_dir)
+        self.enabled = rounds is not None
+        if self.enabled:
+            first, _, last = str(rounds).partition(":")
+            self.first_round = int(first)
+            self.last_round = int(last) if last else self.first_round
+            if self.last_round < self.first_round:
+                raise ValueError(
+                    f"Invalid window of rounds to profile: {rounds}"
+                )
+        self._profile = None
+        self._evaluation_profiled = False
+
+    def _new_profile(self):
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        return profile(
+            activities=activities, record_shapes=True, profile_memory=True
+        )
+
+    def _export(self, prof, tag):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        basename = f"{tag}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
+        prof.export_chrome_trace(str(self.output_dir / f"{basename}.json"))
+        sort_by = (
+            "self_cuda_time_total"
+            if torch.cuda.is_available()
+            else "self_cpu_time_total"
+        )
+        table = prof.key_averages().table(sort_by=sort_by, row_limit=50)
+        with open(self.output_dir / f"{basename}.txt", "w") as f:
+            f.write(table)
+
+    def round_start(self, round_idx):
+        """Start the capture if `round_idx` opens the window."""
+        if self.enabled and round_idx == self.first_round:
+            self._profile = self._new_profile()
+            self._profile.start()
+
+    def round_end(self, round_idx, tag="rounds"):
+        """Stop the capture and export it if `round_idx` ends the window."""
+        if self._profile is not None and round_idx >= self.last_round:
+            self.stop(tag)
+
+    def stop(self, tag="rounds"):
+        """Stop and export the capture in progress if any."""
+        if self._profile is None:
+            return
+        self._profile.stop()
+        self._export(
+            self._profile, f"{tag}_{self.first_round}-{self.last_round}"
+        )
+        self._profile = None
+
+    def should_profile_evaluation(self, n_rounds):
+        """Whether the evaluation done after `n_rounds` rounds is captured.
+
+        Only the first evaluation following the window of rounds is.
+        """
+        return (
+            self.enabled
+            and not self._evaluation_profiled
+            and n_rounds > self.last_round
+        )
+
+    @contextmanager
+    def capture(self, tag):
+        """Capture the enclosed block and export it under `tag`."""
+        self._evaluation_profiled = True
+        with self._new_profile() as prof:
+            yield
+        self._export(prof, tag)
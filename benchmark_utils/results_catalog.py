@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PARTITION_KEYS = ["dataset", "strategy", "seed"]
+
+
+def _partition_values(table):
+    """Compute the partition columns of a table of benchopt results."""
+    # data_name is e.g. Fed-TCGA-BRCA[seed=42,test=val,train=fl] and
+    # solver_name e.g. FedProx[batch_size=32,learning_rate=0.01,mu=0.1]
+    dataset = pc.replace_substring_regex(
+        table["data_name"], pattern=r"\[.*$", replacement=""
+    )
+    seed = pc.extract_regex(table["data_name"], r"[\[,]seed=(?P<seed>\d+)")
+    seed = pc.cast(pc.struct_field(seed, [0]), pa.int64())
+    strategy = pc.replace_substring_regex(
+        table["solver_name"], pattern=r"\[.*$", replacement=""
+    )
+    return [dataset, strategy, seed]
+
+
+def has_results(dataset):
+    """Whether a dataset of `ResultsCatalog.dataset` has results files.
+
+    Datasets without files only have the partition columns, so results
+    columns can't be read or filtered on.
+    """
+    return "solver_name" in dataset.schema.names
+
+
+class ResultsCatalog:
+    """Append-only catalog of benchopt results.
+
+    Results files are ingested once into a parquet dataset partitioned by
+    dataset, strategy and seed (hive-style, e.g.
+    `dataset=Fed-TCGA-BRCA/strategy=FedProx/seed=42`). A manifest records
+    which files were ingested so that only new or modified files are read
+    when new results land, and queries only read the relevant partitions.
+
+    Parameters
+    ----------
+    root : str or Path
+        Folder of the catalog.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.manifest_path = self.root / "manifest.json"
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def _save_manifest(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        tmp_path.replace(self.manifest_path)
+
+    @staticmethod
+    def _file_key(path):
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def _partition_files(self, partition_dirs=None):
+        if partition_dirs is None:
+            return sorted(self.root.glob("*=*/*=*/*=*/*.parquet"))
+        return sorted(
+            f
+            for d in partition_dirs
+            for f in (self.root / d).glob("*.parquet")
+        )
+
+    def _remove_source(self, source, partition_dirs):
+        """Rewrite the partitions of a source file without its rows."""
+        for d in partition_dirs:
+            for f in self._partition_files([d]):
+                table = pq.read_table(f, partitioning=None)
+                mask = pc.not_equal(table["source_file"], source)
+                kept = table.filter(mask)
+                if kept.num_rows == 0:
+                    f.unlink()
+                elif kept.num_rows < table.num_rows:
+                    pq.write_table(kept, f)
+
+    def ingest(self, paths):
+        """Ingest the results files which are new or were modified.
+
+        Returns
+        -------
+        ingested : list of str
+            The files that were ingested.
+        """
+        ingested = []
+        for path in paths:
+            source = str(Path(path).resolve())
+            key = self._file_key(source)
+            entry = self.manifest.get(source)
+            if entry is not None:
+                if entry["file"] == key:
+                    continue
+                self._remove_source(source, entry["partitions"])
+
+            table = pq.read_table(source)
+            table = table.append_column(
+                "source_file", pa.array([source] * table.num_rows)
+            )
+            for name, column in zip(
+                PARTITION_KEYS, _partition_values(table)
+            ):
+                table = table.append_column(name, column)
+            source_hash = hashlib.sha1(source.encode()).hexdigest()[:16]
+            partitions = []
+
+            def record_partition(written_file):
+                partitions.append(
+                    str(Path(written_file.path).parent.relative_to(self.root))
+                )
+
+            ds.write_dataset(
+                table,
+                self.root,
+                format="parquet",
+                partitioning=PARTITION_KEYS,
+                partitioning_flavor="hive",
+                basename_template=f"{source_hash}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_visitor=record_partition,
+            )
+            self.manifest[source] = {"file": key, "partitions": partitions}
+            # Saved after each file so that an interrupted ingestion is
+            # resumed where it stopped
+            self._save_manifest()
+            ingested.append(source)
+        return ingested
+
+    def compact(self, min_files=8):
+        """Merge the files of partitions holding at least `min_files` files."""
+        partition_dirs = {f.parent for f in self._partition_files()}
+        for d in partition_dirs:
+            files = sorted(d.glob("*.parquet"))
+            if len(files) < min_files:
+                continue
+            schema = pa.unify_schemas([pq.read_schema(f) for f in files])
+            table = ds.dataset(files, schema=schema).to_table()
+            tmp_path = d / "compacted.parquet.tmp"
+            pq.write_table(table, tmp_path)
+            for f in files:
+                f.unlink()
+            # Named after its content so that it never clashes with the
+            # files of later ingestions
+            content_hash = hashlib.sha1(
+                "".join(sorted(f.name for f in files)).encode()
+            ).hexdigest()[:16]
+            tmp_path.replace(d / f"compacted-{content_hash}.parquet")
+
+    def dataset(self, dataset=None, strategy=None, seed=None):
+        """Return a pyarrow dataset restricted to the matching partitions.
+
+        Only the matching partitions are listed, and the schema is unified
+        across their files as results of different datasets or strategies
+        don't have the same columns. If no partition matches, the dataset
+        is empty and only has the partition columns, see `has_results`.
+        """
+        pattern = "/".join(
+            f"{k}={'*' if v is None else v}"
+            for k, v in zip(PARTITION_KEYS, [dataset, strategy, seed])
+        )
+        files = sorted(self.root.glob(f"{pattern}/*.parquet"))
+        partitioning = ds.partitioning(
+            pa.schema(
+                [
+                    ("dataset", pa.string()),
+                    ("strategy", pa.string()),
+                    ("seed", pa.int64()),
+                ]
+            ),
+            flavor="hive",
+        )
+        if len(files) == 0:
+            return ds.dataset([], schema=partitioning.schema)
+        schema = pa.unify_schemas(
+            [pq.read_schema(f) for f in files] + [partitioning.schema]
+        )
+        return ds.dataset(
+            [str(f) for f in files],
+            schema=schema,
+            format="parquet",
+            partitioning=partitioning,
+            partition_base_dir=str(self.root),
+        )
+
+    def learning_curves(
+        self, dataset, strategy=None, seed=None, columns=None, filter=None
+    ):
+        """Return the learning curves of the runs on `dataset`.
+
+        Parameters
+        ----------
+        dataset : str
+            Name of the dataset, e.g. `Fed-TCGA-BRCA`.
+        strategy, seed : str, int or None
+            Restrict the curves to a strategy or a seed.
+        columns : list of str or None
+            Columns to read, in addition to `solver_name` and `time`.
+        filter : pyarrow.compute.Expression or None
+            Additional filter on the rows.
+
+        Returns
+        -------
+        curves : pandas.DataFrame
+            The curves, sorted by solver and time.
+        """
+        base_columns = ["data_name", "solver_name", "time"]
+        if columns is not None:
+            columns = base_columns + [
+                c for c in columns if c not in base_columns
+            ]
+        dataset = self.dataset(dataset, strategy, seed)
+        if not has_results(dataset):
+            return pd.DataFrame(columns=columns or base_columns)
+        table = dataset.to_table(columns=columns, filter=filter)
+        return (
+            table.to_pandas()
+            .sort_values(["solver_name", "time"])
+            .reset_index(drop=True)
+        )
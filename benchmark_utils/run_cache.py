@@ -0,0 +1,155 @@
+import hashlib
+import importlib.metadata
+import importlib.util
+import itertools
+import json
+import os
+from glob import glob
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Packages whose version is part of the code hash
+PACKAGES = ["benchopt", "flamby", "torch"]
+
+# Environment variables changing the curves of the runs, their timings or
+# their columns, which are part of the key of the runs
+ENV_VARS = [
+    "FLAMBY_BENCHMARK_MEMORY_LIMIT",
+    "FLAMBY_BENCHMARK_TRACK_TENSORS",
+    "FLAMBY_BENCHMARK_EVAL_SCHEDULE",
+    "FLAMBY_BENCHMARK_MAX_ROUNDS",
+    "FLAMBY_BENCHMARK_DIVERGENCE_GUARD",
+    "FLAMBY_BENCHMARK_SNAPSHOTS",
+    "FLAMBY_BENCHMARK_COUNT_COMPUTE",
+    "FLAMBY_BENCHMARK_SILO_PROFILES",
+    "FLAMBY_BENCHMARK_DISTRIBUTED",
+    "FLAMBY_BENCHMARK_DIST_WORKERS",
+    "FLAMBY_BENCHMARK_DIST_EXTERNAL",
+    "FLAMBY_BENCHMARK_PROFILE",
+    "FLAMBY_BENCHMARK_SW_MAX_VOXELS",
+]
+
+
+def load_module(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def find_class(folder, class_name, name):
+    """Return the path and the class named `name` among the modules of
+    `folder`, e.g. the `Solver` named `FedProx` in `solvers`."""
+    for path in sorted(glob(os.path.join(ROOT, folder, "*.py"))):
+        cls = getattr(load_module(path), class_name, None)
+        if cls is not None and getattr(cls, "name", None) == name:
+            return path, cls
+    raise ValueError(f"No {class_name} named {name} in {folder}")
+
+
+def grid_names(cls):
+    """Names given by benchopt to each point of the parameters' grid of a
+    dataset, objective or solver, e.g. `FedProx[learning_rate=0.01,mu=0.1]`.
+    """
+    parameters = getattr(cls, "parameters", {})
+    if len(parameters) == 0:
+        return [cls.name]
+    keys = sorted(parameters)
+    return [
+        cls.name
+        + "["
+        + ",".join(f"{k}={v}" for k, v in zip(keys, values))
+        + "]"
+        for values in itertools.product(*[parameters[k] for k in keys])
+    ]
+
+
+def code_hash(paths):
+    """Hash of the content of `paths` and of the versions of the packages
+    the benchmark depends on."""
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        h.update(os.path.relpath(path, ROOT).encode())
+        with open(path, "rb") as f:
+            h.update(f.read())
+    for package in PACKAGES:
+        try:
+            version = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            version = None
+        h.update(f"{package}={version}".encode())
+    return h.hexdigest()
+
+
+def benchmark_code_hash(dataset_path, solver_path):
+    """Hash of the code a run depends on: the objective, the dataset, the
+    solver and the shared utilities."""
+    return code_hash(
+        [os.path.join(ROOT, "objective.py"), dataset_path, solver_path]
+        + glob(os.path.join(ROOT, "benchmark_utils", "*.py"))
+    )
+
+
+class RunCache:
+    """Content-addressed cache of the curves of benchopt runs.
+
+    The rows of the results of each run, i.e. of each dataset, objective and
+    solver configuration, are stored in a parquet file named after the hash
+    of the configuration, the number of runs, the timeout, the code hash and
+    the environment variables of `ENV_VARS`. A change in any of them gives a
+    new key, so that stale curves are never reused. Note that curves cut by
+    benchopt's timeout are cached as they are, until the timeout changes.
+
+    Parameters
+    ----------
+    root : str or Path
+        Folder of the cache.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    @staticmethod
+    def key(
+        data_name,
+        objective_name,
+        solver_name,
+        max_runs,
+        timeout,
+        code_hash,
+        env=None,
+    ):
+        """Key of a run, `env` defaulting to the environment of the process.
+        """
+        env = os.environ if env is None else env
+        config = {
+            "data_name": data_name,
+            "objective_name": objective_name,
+            "solver_name": solver_name,
+            "max_runs": max_runs,
+            "timeout": timeout,
+            "code_hash": code_hash,
+            "env": {name: env.get(name) for name in ENV_VARS},
+        }
+        return hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode()
+        ).hexdigest()
+
+    def path(self, key):
+        return self.root / f"{key}.parquet"
+
+    def __contains__(self, key):
+        return self.path(key).exists()
+
+    def load(self, key):
+        return pd.read_parquet(self.path(key))
+
+    def store(self, key, df):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path(key).with_suffix(".tmp")
+        df.to_parquet(tmp_path)
+        tmp_path.replace(self.path(key))
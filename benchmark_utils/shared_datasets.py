@@ -0,0 +1,223 @@
+import fcntl
+import hashlib
+import inspect
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import yaml
+import torch
+from torch.utils.data import Dataset
+
+
+def shared_data_dir():
+    """Folder holding the shared datasets, in shared memory when possible."""
+    default_root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    default_root = default_root or tempfile.gettempdir()
+    return Path(
+        os.environ.get(
+            "FLAMBY_BENCHMARK_SHARED_DATA_DIR",
+            os.path.join(default_root, "benchmark_flamby"),
+        )
+    )
+
+
+def use_shared_data():
+    return os.environ.get("FLAMBY_BENCHMARK_SHARED_DATA") == "1"
+
+
+class SharedDataError(RuntimeError):
+    """Raised when a dataset can't be written to the shared data folder.
+
+    It is distinct from the errors raised by FLamby when a dataset isn't
+    downloaded, which the datasets of the benchmark catch to run in the CI.
+    """
+
+
+def _tree_stamp(path):
+    """Names, sizes and modification times of the files under `path`."""
+    path = Path(path)
+    files = [path] if path.is_file() else sorted(path.rglob("*"))
+    return [
+        (str(f.relative_to(path)), f.stat().st_size, f.stat().st_mtime_ns)
+        for f in files
+        if f.is_file() and "__pycache__" not in f.parts
+    ]
+
+
+def dataset_stamp(fed_dataset, *args, **kwargs):
+    """Hash of what the samples of `fed_dataset` depend on.
+
+    This covers the arguments of the dataset, the files of its package in
+    FLamby, i.e. its code and its `dataset_location.yaml` configs, and the
+    files of the data, found from these configs or given as arguments.
+    """
+    package = Path(inspect.getfile(fed_dataset)).parent
+    data_paths = [
+        str(a)
+        for a in list(args) + list(kwargs.values())
+        if isinstance(a, (str, os.PathLike)) and os.path.exists(a)
+    ]
+    for config in sorted(package.rglob("dataset_location*.yaml")):
+        with open(config) as f:
+            data_path = (yaml.safe_load(f) or {}).get("dataset_path")
+        if data_path is not None and os.path.exists(data_path):
+            data_paths.append(data_path)
+    stamp = [
+        repr(args),
+        repr(sorted(kwargs.items())),
+        str(package),
+        _tree_stamp(package),
+    ] + [(p, _tree_stamp(p)) for p in data_paths]
+    return hashlib.sha1(repr(stamp).encode()).hexdigest()[:16]
+
+
+class MemmapDataset(Dataset):
+    """Dataset whose samples are read from memory-mapped arrays.
+
+    The i-th sample is the tuple of the i-th rows of the arrays. As arrays
+    are memory-mapped read-only, all processes opening the same files share
+    the same physical memory.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __len__(self):
+        return len(self.arrays[0])
+
+    def __getitem__(self, idx):
+        # Rows are copied as torch can't wrap read-only memory
+        return tuple(torch.from_numpy(np.array(a[idx])) for a in self.arrays)
+
+
+def _materialize(dataset, folder):
+    """Write the samples of `dataset` as one `.npy` file per element."""
+    if len(dataset) == 0:
+        raise ValueError("Can't share an empty dataset")
+    tmp_folder = folder.with_name(folder.name + ".tmp")
+    # Left over by a process killed while writing
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    tmp_folder.mkdir(parents=True)
+    arrays = None
+    for idx in range(len(dataset)):
+        sample = [np.asarray(e) for e in dataset[idx]]
+        if arrays is None:
+            # Written incrementally so that the dataset is never fully
+            # held in memory
+            arrays = [
+                np.lib.format.open_memmap(
+                    tmp_folder / f"{k}.npy",
+                    mode="w+",
+                    dtype=e.dtype,
+                    shape=(len(dataset),) + e.shape,
+                )
+                for k, e in enumerate(sample)
+            ]
+        for a, e in zip(arrays, sample):
+            # Raises if samples don't all have the same shape
+            a[idx] = e
+    for a in arrays:
+        a.flush()
+    tmp_folder.rename(folder)
+
+
+def _try_remove(folder):
+    """Remove the shared dataset `folder`, unless it is being written.
+
+    Lock files are kept, so that processes waiting on them can't end up
+    holding the locks of different files.
+    """
+    with open(folder.with_name(folder.name + ".lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            shutil.rmtree(folder, ignore_errors=True)
+            shutil.rmtree(
+                folder.with_name(folder.name + ".tmp"), ignore_errors=True
+            )
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return True
+
+
+def purge_shared_data(prefix=""):
+    """Remove the shared datasets whose names start with `prefix`.
+
+    Datasets being written are skipped. Processes that memory-mapped the
+    removed files keep reading them, the memory is freed once they exit.
+
+    Returns
+    -------
+    removed : list of str
+        Names of the removed datasets.
+    """
+    data_dir = shared_data_dir()
+    if not data_dir.is_dir():
+        return []
+    removed = []
+    for lock in sorted(data_dir.glob(f"{prefix}*.lock")):
+        folder = lock.with_name(lock.stem)
+        tmp_folder = lock.with_name(lock.stem + ".tmp")
+        exists = folder.exists() or tmp_folder.exists()
+        if exists and _try_remove(folder):
+            removed.append(folder.name)
+    return removed
+
+
+def load_shared_dataset(fed_dataset, *args, **kwargs):
+    """Return the FLamby dataset `fed_dataset(*args, **kwargs)`, shared.
+
+    The first process asking for a dataset loads it and writes its samples
+    to the shared data folder, concurrent processes wait for it and all
+    processes then memory-map the same files. This only applies to datasets
+    whose samples are deterministic and have the same shape.
+
+    Datasets are stored under a key stamped with `dataset_stamp`, so that
+    a change of the data, of its location or of FLamby's code writes a new
+    copy. Copies with an outdated stamp are removed when the new one is
+    written, see also `purge_shared_data`.
+    """
+    name = "_".join(
+        [f"{fed_dataset.__module__}.{fed_dataset.__qualname__}"]
+        + [str(a) for a in args]
+        + [f"{k}={v}" for k, v in sorted(kwargs.items())]
+    )
+    # Arguments can be paths, the stamp tells apart the names they collide
+    name = re.sub(r"[^\w.=-]", "-", name)
+    key = f"{name}_{dataset_stamp(fed_dataset, *args, **kwargs)}"
+    folder = shared_data_dir() / key
+    folder.parent.mkdir(parents=True, exist_ok=True)
+    with open(folder.with_name(key + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not folder.exists():
+                # Errors of FLamby, e.g. a dataset which isn't downloaded,
+                # are raised as is
+                dataset = fed_dataset(*args, **kwargs)
+                try:
+                    _materialize(dataset, folder)
+                except Exception as e:
+                    shutil.rmtree(
+                        folder.with_name(key + ".tmp"), ignore_errors=True
+                    )
+                    raise SharedDataError(
+                        f"Can't write {key} to the shared data folder "
+                        f"{folder.parent}"
+                    ) from e
+                # Copies of the same dataset differ only by their stamps,
+                # which have the same length
+                for stale in folder.parent.glob(f"{name}_*.lock"):
+                    if stale.stem != key and len(stale.stem) == len(key):
+                        _try_remove(stale.with_name(stale.stem))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    n_arrays = len(list(folder.glob("*.npy")))
+    return MemmapDataset(
+        [np.load(folder / f"{k}.npy", mmap_mode="r") for k in range(n_arrays)]
+    )
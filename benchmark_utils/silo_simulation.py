@@ -0,0 +1,121 @@
+import json
+import os
+from collections import defaultdict
+
+# Effective compute speed (FLOP/s), bandwidth (bytes/s) and network latency
+# (s) of typical silos
+SILO_TIERS = {
+    "datacenter_gpu": {"flops": 50e12, "bandwidth": 125e6, "latency": 0.02},
+    "workstation_gpu": {"flops": 10e12, "bandwidth": 12.5e6, "latency": 0.05},
+    "cpu_server": {"flops": 0.5e12, "bandwidth": 2.5e6, "latency": 0.1},
+}
+
+# Profiles of the clients, assigned cyclically if there are more clients
+PRESETS = {
+    "homogeneous": [SILO_TIERS["workstation_gpu"]],
+    "heterogeneous": [
+        SILO_TIERS["datacenter_gpu"],
+        SILO_TIERS["workstation_gpu"],
+        SILO_TIERS["cpu_server"],
+    ],
+}
+
+
+def load_silo_profiles(spec, num_clients):
+    """Return the profile of each client from a preset name or a JSON file.
+
+    The JSON file holds a list of profiles with keys `flops`, `bandwidth`
+    and `latency`.
+    """
+    if spec in PRESETS:
+        profiles = PRESETS[spec]
+    elif os.path.isfile(spec):
+        with open(spec) as f:
+            profiles = json.load(f)
+    else:
+        raise ValueError(
+            f"Unknown silo profiles {spec}, use one of {sorted(PRESETS)} or "
+            "the path to a JSON file"
+        )
+    return [profiles[k % len(profiles)] for k in range(num_clients)]
+
+
+def simulate_silos():
+    return "FLAMBY_BENCHMARK_SILO_PROFILES" in os.environ
+
+
+class SiloSimulator:
+    """Simulate the round times of a strategy on heterogeneous silos.
+
+    The FLOPs of the local updates of each client during a round, read from
+    the `ComputeCounter` of the strategy, are turned into a simulated
+    compute time with the speed of the client. Clients taking part in a
+    round also download and upload the model, which takes their latency plus
+    the size of the model divided by their bandwidth. The round lasts as
+    long as its slowest client, plus the aggregation time measured on the
+    server.
+
+    Parameters
+    ----------
+    profiles : list of dict
+        The profile of each client, see `load_silo_profiles`.
+    model_bytes : int
+        The size of the model exchanged with the clients.
+    counter : ComputeCounter
+        The counter of the compute of the clients, whose round has ended
+        when `round_end` is called.
+    """
+
+    def __init__(self, profiles, model_bytes, counter):
+        self.profiles = profiles
+        self.model_bytes = model_bytes
+        self.counter = counter
+        self.totals = defaultdict(float)
+
+    @classmethod
+    def from_env(cls, model, num_clients, counter):
+        """Return the simulator set by `FLAMBY_BENCHMARK_SILO_PROFILES`, if
+        any, reading the compute of the clients from `counter`."""
+        if not simulate_silos():
+            return None
+        return cls(
+            load_silo_profiles(
+                os.environ["FLAMBY_BENCHMARK_SILO_PROFILES"], num_clients
+            ),
+            sum(p.numel() * p.element_size() for p in model.parameters()),
+            counter,
+        )
+
+    def client_time(self, client_idx, flops):
+        """Simulated time of a client training with `flops` FLOPs."""
+        profile = self.profiles[client_idx]
+        compute = flops / profile["flops"]
+        # The model is downloaded and the update uploaded
+        communication = 2 * (
+            profile["latency"] + self.model_bytes / profile["bandwidth"]
+        )
+        return compute, communication
+
+    def round_end(self, aggregation_time):
+        """Add the simulated time of the round which just ended."""
+        round_time = 0.0
+        for client_idx in range(len(self.profiles)):
+            # Clients which did not train during the round do not take part
+            if not self.counter.round.get(f"samples_client_{client_idx}"):
+                continue
+            compute, communication = self.client_time(
+                client_idx, self.counter.round[f"flops_client_{client_idx}"]
+            )
+            self.totals[f"client_{client_idx}"] += compute + communication
+            round_time = max(round_time, compute + communication)
+        self.totals["round"] = round_time + aggregation_time
+        self.totals["time"] += round_time + aggregation_time
+
+    def to_dict(self):
+        res = {
+            "simulated_time": self.totals["time"],
+            "simulated_round_time": self.totals["round"],
+        }
+        for k in range(len(self.profiles)):
+            res[f"simulated_time_client_{k}"] = self.totals[f"client_{k}"]
+        return res
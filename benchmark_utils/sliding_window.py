@@ -0,0 +1,261 @@
+import itertools
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def gaussian_importance_map(patch_size, sigma_scale=0.125):
+    """Weights favouring the center of patches when blending them."""
+    grids = torch.meshgrid(
+        *[torch.arange(s, dtype=torch.float32) for s in patch_size],
+        indexing="ij",
+    )
+    weights = torch.ones(patch_size)
+    for grid, s in zip(grids, patch_size):
+        sigma = max(s * sigma_scale, 1.0)
+        weights *= torch.exp(-0.5 * ((grid - (s - 1) / 2) / sigma) ** 2)
+    weights /= weights.max()
+    # Avoid dividing by zero on the borders of the volumes
+    return weights.clamp(min=1e-3)
+
+
+def patch_starts(size, patch, overlap):
+    """Start of the patches covering `size` voxels along one axis."""
+    if size <= patch:
+        return [0]
+    stride = max(int(patch * (1 - overlap)), 1)
+    n_patches = math.ceil((size - patch) / stride) + 1
+    # The last patch is aligned on the end of the volume
+    return sorted({min(i * stride, size - patch) for i in range(n_patches)})
+
+
+class _Volume:
+    """Blending accumulators of a volume being predicted."""
+
+    def __init__(self, client, batch, X, y, patch_size, overlap):
+        self.client = client
+        self.batch = batch
+        self.y = y
+        spatial_shape = X.shape[1:]
+        # Volumes smaller than the patches are padded
+        padding = [max(p - s, 0) for s, p in zip(spatial_shape, patch_size)]
+        self.crop = tuple(slice(0, s) for s in spatial_shape)
+        self.X = F.pad(X, [e for p in reversed(padding) for e in (0, p)])
+        self.starts = list(
+            itertools.product(
+                *[
+                    patch_starts(s, p, overlap)
+                    for s, p in zip(self.X.shape[1:], patch_size)
+                ]
+            )
+        )
+        self.logits = None
+        self.weights = None
+        self.n_remaining = len(self.starts)
+
+    def patch_slices(self, start, patch_size):
+        return tuple(slice(s, s + p) for s, p in zip(start, patch_size))
+
+
+@torch.no_grad()
+def sliding_window_outputs(
+    model,
+    dls,
+    patch_size=(128, 128, 128),
+    overlap=0.5,
+    max_batch_voxels=4 * 128**3,
+):
+    """Outputs of a segmentation model on whole volumes, predicted by patches.
+
+    Volumes are split into overlapping patches. Patches of consecutive
+    volumes are batched together, up to `max_batch_voxels` voxels per
+    forward pass, and the outputs of overlapping patches are blended with
+    Gaussian weights. Each volume is yielded as soon as all its patches are
+    predicted, so that only the volumes being predicted are held in memory.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        Model mapping (B, C, D, H, W) inputs to (B, K, D, H, W) outputs.
+    dls : list of torch.utils.data.DataLoader
+        Dataloaders of the volumes.
+    patch_size : tuple of int
+        Spatial size of the patches.
+    overlap : float
+        Fraction of overlap between consecutive patches, in [0, 1).
+    max_batch_voxels : int
+        Maximum number of voxels of a batch of patches.
+
+    Yields
+    ------
+    idx : int
+        Index of the dataloader of the volume.
+    batch : int
+        Index of the batch of the volume in its dataloader.
+    y : torch.Tensor
+        Target of the volume, on the device of the model.
+    output : torch.Tensor
+        The blended (K, D, H, W) output of the model on the volume.
+    """
+    model = model.eval()
+    device = next(model.parameters()).device
+    patch_size = tuple(patch_size)
+    importance = gaussian_importance_map(patch_size).to(device)
+    batch_size = max(max_batch_voxels // math.prod(patch_size), 1)
+
+    pending = []
+
+    def volumes():
+        for idx, dl in enumerate(dls):
+            for batch, (X, y) in enumerate(dl):
+                for X_i, y_i in zip(X, y):
+                    yield _Volume(idx, batch, X_i, y_i, patch_size, overlap)
+
+    def flush():
+        inputs = torch.stack(
+            [
+                v.X[(slice(None),) + v.patch_slices(s, patch_size)]
+                for v, s in pending
+            ]
+        ).to(device)
+        outputs = model(inputs)
+        for (volume, start), out in zip(pending, outputs):
+            if volume.logits is None:
+                shape = volume.X.shape[1:]
+                volume.logits = torch.zeros(
+                    (out.shape[0],) + shape, device=device
+                )
+                volume.weights = torch.zeros(shape, device=device)
+            slices = volume.patch_slices(start, patch_size)
+            volume.logits[(slice(None),) + slices] += out * importance
+            volume.weights[slices] += importance
+            volume.n_remaining -= 1
+            if volume.n_remaining == 0:
+                output = (volume.logits / volume.weights)[
+                    (slice(None),) + volume.crop
+                ]
+                yield (
+                    volume.client,
+                    volume.batch,
+                    volume.y.to(device),
+                    output,
+                )
+                # Free the accumulators as soon as possible
+                volume.logits = volume.weights = volume.X = None
+        pending.clear()
+
+    for volume in volumes():
+        for start in volume.starts:
+            pending.append((volume, start))
+            if len(pending) == batch_size:
+                yield from flush()
+    if len(pending) > 0:
+        yield from flush()
+
+
+def sliding_window_batches(model, dls, **params):
+    """Outputs of `sliding_window_outputs` regrouped by batches of `dls`.
+
+    Volumes are yielded in the order of the dataloaders, so the outputs of
+    a batch are consecutive.
+
+    Yields
+    ------
+    idx : int
+        Index of the dataloader of the batch.
+    y : torch.Tensor
+        Targets of the batch, on the device of the model.
+    outputs : torch.Tensor
+        The blended (B, K, D, H, W) outputs of the model on the batch.
+    """
+    volumes = sliding_window_outputs(model, dls, **params)
+    for (idx, _), batch in itertools.groupby(volumes, lambda v: v[:2]):
+        _, _, y, outputs = zip(*batch)
+        yield idx, torch.stack(y), torch.stack(outputs)
+
+
+def evaluate_sliding_window(
+    model,
+    test_dls,
+    metric,
+    prediction="raw",
+    to_numpy=False,
+    aggregation="concatenate",
+    **params,
+):
+    """Evaluate a segmentation model with a sliding-window inference.
+
+    The dataset's `metric` is computed on the predictions of whole volumes,
+    given and aggregated over the volumes of each client as FLamby's
+    evaluator of the dataset does.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        Model mapping (B, C, D, H, W) inputs to (B, K, D, H, W) outputs.
+    test_dls : list of torch.utils.data.DataLoader
+        Test dataloaders of the clients.
+    metric : callable
+        The metric of the dataset, called as `metric(y_true, y_pred)`.
+    prediction : {"raw", "argmax"}
+        Whether the prediction is the output of the model or the argmax of
+        its channels, i.e. a label map.
+    to_numpy : bool
+        Whether the metric is given numpy arrays rather than CPU tensors.
+    aggregation : {"concatenate", "batch"}
+        Whether the metric is computed once on the predictions of all the
+        batches of a client, as by `flamby.utils.evaluate_model_on_tests`,
+        or on each batch and averaged over the batches of the client, as by
+        the evaluators of KITS19 and LIDC-IDRI.
+    **params
+        Parameters of the sliding window, see `sliding_window_outputs`.
+
+    Returns
+    -------
+    results : dict
+        The metric on each client, with keys `client_test_<k>`.
+    """
+    if prediction not in ("raw", "argmax"):
+        raise ValueError(f"Unknown prediction {prediction}")
+    if aggregation not in ("concatenate", "batch"):
+        raise ValueError(f"Unknown aggregation {aggregation}")
+    predictions = [([], []) for _ in test_dls]
+    values = [[] for _ in test_dls]
+    for client, y, outputs in sliding_window_batches(
+        model, test_dls, **params
+    ):
+        y_pred = outputs.argmax(1) if prediction == "argmax" else outputs
+        y_true, y_pred = y.cpu(), y_pred.cpu()
+        if to_numpy:
+            y_true, y_pred = y_true.numpy(), y_pred.numpy()
+        if aggregation == "batch":
+            values[client].append(float(metric(y_true, y_pred)))
+        else:
+            predictions[client][0].append(y_true)
+            predictions[client][1].append(y_pred)
+    if aggregation == "concatenate":
+        concatenate = np.concatenate if to_numpy else torch.cat
+        values = [
+            [float(metric(concatenate(y_true), concatenate(y_pred)))]
+            if len(y_true) > 0
+            else []
+            for y_true, y_pred in predictions
+        ]
+    return {
+        f"client_test_{k}": float(np.mean(v)) if len(v) > 0 else np.nan
+        for k, v in enumerate(values)
+    }
+
+
+@torch.no_grad()
+def sliding_window_loss(model, dl, loss, **params):
+    """Average of `loss` over the batches of `dl`, computed on the outputs
+    of the sliding-window inference so that whole volumes are never given
+    to the model."""
+    losses = [
+        loss(outputs, y).item()
+        for _, y, outputs in sliding_window_batches(model, [dl], **params)
+    ]
+    return float(np.mean(losses))
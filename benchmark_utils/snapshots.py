@@ -0,0 +1,388 @@
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+import torch
+
+ENCODINGS = ("fp32", "delta")
+
+# Keys of benchopt's meta identifying a run
+RUN_KEYS = ("data_name", "objective_name", "solver_name", "idx_rep")
+
+
+def flatten_state(state_dict):
+    """Layout of a state dict and its content as 32-bit words, floating
+    tensors being stored as fp32."""
+    layout, chunks = [], []
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu()
+        if tensor.is_floating_point():
+            tensor = tensor.float()
+        array = tensor.contiguous().numpy()
+        layout.append([name, array.dtype.str, list(array.shape)])
+        chunks.append(array.reshape(-1).view(np.uint8))
+    # Padded to whole words
+    padding = np.zeros(-sum(map(len, chunks)) % 4, dtype=np.uint8)
+    return layout, np.concatenate(chunks + [padding]).view(np.uint32)
+
+
+def unflatten_state(layout, words):
+    """State dict of `layout` from its content as 32-bit words."""
+    data = words.view(np.uint8)
+    state_dict, offset = {}, 0
+    for name, dtype, shape in layout:
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        array = data[offset:offset + size].view(dtype).reshape(shape)
+        state_dict[name] = torch.from_numpy(array.copy())
+        offset += size
+    return state_dict
+
+
+def encode(words, previous=None, level=1):
+    """Compress `words`, XOR-ed with the `previous` snapshot if any.
+
+    Consecutive snapshots share the sign, exponent and leading mantissa
+    bits of most parameters, which the XOR turns into zeros. Bytes are
+    grouped by their position in the words before compression so that
+    these zeros are contiguous. Both encodings are lossless.
+    """
+    if previous is not None:
+        words = words ^ previous
+    planes = words.view(np.uint8).reshape(-1, 4).T
+    return zlib.compress(planes.tobytes(), level)
+
+
+def decode(blob, n_words, previous=None):
+    """Inverse of `encode`."""
+    planes = np.frombuffer(zlib.decompress(blob), dtype=np.uint8)
+    words = planes.reshape(4, n_words).T.copy().view(np.uint32).reshape(-1)
+    if previous is not None:
+        words ^= previous
+    return words
+
+
+def run_dir(root, meta):
+    """Folder of the snapshots of the run described by benchopt's `meta`."""
+    run = {key: meta.get(key) for key in RUN_KEYS}
+    key = hashlib.sha256(json.dumps(run, sort_keys=True).encode())
+    return Path(root) / key.hexdigest()[:16]
+
+
+class SnapshotWriter:
+    """Record snapshots of the models of a run in a local store.
+
+    Each snapshot holds the state dicts of the models, one stream per model
+    (the model and its replicates), and the information of the round. The
+    models are copied to CPU when recorded, then encoded, compressed and
+    written by a background thread so that training goes on meanwhile. With
+    the delta encoding, a snapshot is stored as its difference with the
+    previous one of its stream, except every `keyframe_interval` snapshots.
+
+    Parameters
+    ----------
+    path : str or Path
+        Folder of the snapshots of the run, emptied first.
+    meta : dict
+        benchopt's meta of the run, stored with the snapshots.
+    encoding : {"fp32", "delta"}
+        Whether snapshots are stored as is or as deltas.
+    keyframe_interval : int
+        Number of snapshots between two snapshots stored as is.
+    level : int
+        zlib's compression level.
+    """
+
+    def __init__(
+        self, path, meta, encoding="delta", keyframe_interval=20, level=1
+    ):
+        if encoding not in ENCODINGS:
+            raise ValueError(
+                f"Unknown snapshot encoding {encoding}, available encodings "
+                f"are {ENCODINGS}"
+            )
+        self.path = Path(path)
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+        with open(self.path / "meta.json", "w") as f:
+            json.dump({"meta": meta, "encoding": encoding}, f)
+        self.encoding = encoding
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self._previous = {}
+        self._counts = {}
+        self._error = None
+        # The queue is bounded so that snapshots waiting to be written do
+        # not pile up in memory
+        self._queue = queue.Queue(maxsize=2)
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, meta, eval_schedule):
+        """Return a writer in the store `FLAMBY_BENCHMARK_SNAPSHOTS`, if set,
+        with the encoding `FLAMBY_BENCHMARK_SNAPSHOT_ENCODING`.
+
+        As runs are not evaluated, they can only be stopped by the budget of
+        rounds of `eval_schedule`, which is required, and the adaptive
+        schedule, which needs the evaluations, is not supported.
+        """
+        root = os.environ.get("FLAMBY_BENCHMARK_SNAPSHOTS")
+        if root is None:
+            return None
+        if eval_schedule.max_rounds is None:
+            raise ValueError(
+                "Snapshots require a budget of rounds, set "
+                "FLAMBY_BENCHMARK_MAX_ROUNDS"
+            )
+        if eval_schedule.mode == "adaptive":
+            raise ValueError(
+                "The adaptive evaluation schedule is not supported with "
+                "snapshots as models are not evaluated during training, use "
+                "every:k or geometric:ratio"
+            )
+        encoding = os.environ.get(
+            "FLAMBY_BENCHMARK_SNAPSHOT_ENCODING", "delta"
+        )
+        return cls(run_dir(root, meta), meta, encoding=encoding)
+
+    def write(self, round_idx, state_dicts, info):
+        """Record the state dicts of the models after `round_idx` rounds.
+
+        Parameters
+        ----------
+        round_idx : int
+            Number of rounds performed.
+        state_dicts : dict
+            State dict of each model, by stream name.
+        info : dict
+            Information on the round, stored in the index of the snapshots.
+        """
+        self._raise_error()
+        flat = {
+            stream: flatten_state(state_dict)
+            for stream, state_dict in state_dicts.items()
+        }
+        self._queue.put((round_idx, flat, info))
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, round_idx, flat, info):
+        streams = {}
+        for stream, (layout, words) in flat.items():
+            count = self._counts.get(stream, 0)
+            keyframe = (
+                self.encoding == "fp32"
+                or count % self.keyframe_interval == 0
+            )
+            previous = None if keyframe else self._previous[stream]
+            file_name = f"{round_idx:06d}_{stream}.bin"
+            with open(self.path / file_name, "wb") as f:
+                f.write(encode(words, previous, self.level))
+            self._previous[stream] = words
+            self._counts[stream] = count + 1
+            streams[stream] = {
+                "file": file_name,
+                "n_words": len(words),
+                "keyframe": keyframe,
+                "layout": layout,
+            }
+        record = {"round": round_idx, "info": info, "streams": streams}
+        with open(self.path / "index.jsonl", "a") as f:
+            f.write(json.dumps(record, default=float) + "\n")
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError(
+                f"Writing snapshots in {self.path} failed"
+            ) from self._error
+
+    def close(self):
+        """Wait for the recorded snapshots to be written."""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+
+class SnapshotReader:
+    """Read back the snapshots of a run written by `SnapshotWriter`.
+
+    Iterating over the reader yields, for each snapshot in order, the number
+    of rounds, the information of the round and the state dicts of the
+    models by stream name.
+
+    Parameters
+    ----------
+    path : str or Path
+        Folder of the snapshots of the run.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            content = json.load(f)
+        self.meta = content["meta"]
+        self.encoding = content["encoding"]
+        index_path = self.path / "index.jsonl"
+        self.records = []
+        if index_path.exists():
+            with open(index_path) as f:
+                self.records = [json.loads(line) for line in f]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        previous = {}
+        for record in self.records:
+            state_dicts = {}
+            for stream, entry in record["streams"].items():
+                with open(self.path / entry["file"], "rb") as f:
+                    blob = f.read()
+                words = decode(
+                    blob,
+                    entry["n_words"],
+                    None if entry["keyframe"] else previous[stream],
+                )
+                previous[stream] = words
+                state_dicts[stream] = unflatten_state(entry["layout"], words)
+            yield record["round"], record["info"], state_dicts
+
+
+def list_runs(root):
+    """Readers of the runs of the store `root`."""
+    return [
+        SnapshotReader(path.parent)
+        for path in sorted(Path(root).glob("*/meta.json"))
+    ]
+
+
+class SnapshotCallback:
+    """Stand-in for benchopt's callback recording snapshots of the models
+    instead of evaluating them.
+
+    The snapshots are taken after the rounds given by the solver's
+    `get_next`, and the time of the snapshots excludes the time spent in
+    the callback like benchopt's. As there are no evaluations, the curve is
+    empty and the runs are only stopped by their budget of rounds, see
+    `stopped_rows` for their stopping criterion.
+
+    Parameters
+    ----------
+    solver : FLambySolver
+        The solver whose models are recorded.
+    writer : SnapshotWriter
+        Where the snapshots are recorded.
+    """
+
+    def __init__(self, solver, writer):
+        self.solver = solver
+        self.writer = writer
+        self.curve = []
+        self.it = 0
+        self.next_stopval = 0
+        self.time_iter = 0.0
+        self.time_callback = time.perf_counter()
+
+    def __call__(self):
+        t0 = time.perf_counter()
+        self.time_iter += t0 - self.time_callback
+        if self.it == self.next_stopval:
+            result = self.solver.get_result()
+            state_dicts = {"model": result["model"].state_dict()}
+            for seed, model in result["replicate_models"].items():
+                state_dicts[f"seed_{seed}"] = model.state_dict()
+            info = {
+                "time": self.time_iter,
+                "solver_stats": result["solver_stats"],
+            }
+            self.writer.write(self.it, state_dicts, info)
+            self.next_stopval = self.solver.get_next(self.it)
+        self.it += 1
+        self.time_callback = time.perf_counter()
+        return True
+
+
+def stopped_rows(rows, stopping_criterion):
+    """Rows of a run up to the one after which `stopping_criterion` stops
+    it, as benchopt would have during training.
+
+    The rows are the evaluations of the snapshots of the run, in order.
+    Like benchopt, no rows are kept if the run diverged.
+    """
+    criterion = stopping_criterion.get_runner_instance(max_runs=len(rows))
+    for idx, row in enumerate(rows):
+        stop, status, _ = criterion.should_stop(
+            row["stop_val"], rows[:idx + 1]
+        )
+        if stop:
+            return [] if status == "diverged" else rows[:idx + 1]
+    return rows
+
+
+class BatchReplay:
+    """Dataloaders replaying the batches of their first pass.
+
+    This replaces the `test_loader` of the objective when many models are
+    evaluated on the same data, so that each batch is loaded and collated
+    once for all of them. Batches are kept in memory up to `max_bytes`,
+    the datasets whose batches do not fit being loaded each time.
+
+    Parameters
+    ----------
+    test_loader : callable
+        The function returning the dataloader of a dataset.
+    max_bytes : int
+        Maximum size of the batches kept in memory.
+    """
+
+    def __init__(self, test_loader, max_bytes):
+        self.test_loader = test_loader
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._batches = {}
+        self._streamed = set()
+
+    @staticmethod
+    def _nbytes(batch):
+        if isinstance(batch, torch.Tensor):
+            return batch.numel() * batch.element_size()
+        if isinstance(batch, (list, tuple)):
+            return sum(BatchReplay._nbytes(b) for b in batch)
+        if isinstance(batch, dict):
+            return sum(BatchReplay._nbytes(b) for b in batch.values())
+        return 0
+
+    def __call__(self, dataset):
+        key = id(dataset)
+        if key in self._batches:
+            return self._batches[key]
+        loader = self.test_loader(dataset)
+        if key in self._streamed:
+            return loader
+        batches, nbytes = [], 0
+        for batch in loader:
+            nbytes += self._nbytes(batch)
+            if self.nbytes + nbytes > self.max_bytes:
+                self._streamed.add(key)
+                return self.test_loader(dataset)
+            batches.append(batch)
+        self.nbytes += nbytes
+        self._batches[key] = batches
+        return batches
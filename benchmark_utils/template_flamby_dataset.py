@@ -11,6 +11,12 @@ with safe_import_context() as import_ctx:
 
     from flamby.benchmarks.benchmark_utils import set_seed
 
+    from benchmark_utils.centralised import PooledDataset
+    from benchmark_utils.shared_datasets import (
+        load_shared_dataset,
+        use_shared_data,
+    )
+
 
 # All datasets must be named `Dataset` and inherit from `BaseDataset`
 class FLambyDataset(BaseDataset):
@@ -34,6 +40,11 @@ class FLambyDataset(BaseDataset):
         test_size=0.2,
         stratify_func=None,
         collate_fn=None,
+        evaluator="model_on_tests",
+        evaluator_params=None,
+        shareable=False,
+        bucket_batches=False,
+        batch_augmentation=None,
         *args,
         **kwargs
     ):
@@ -51,6 +62,19 @@ class FLambyDataset(BaseDataset):
         self.test_size = test_size
         self.stratify_func = stratify_func
         self.collate_fn = collate_fn
+        # Name of the function evaluating the model on the test sets, see
+        # `benchmark_utils.evaluators`
+        self.evaluator = evaluator
+        self.evaluator_params = evaluator_params or {}
+        # Whether the samples are deterministic and of fixed shape so that
+        # the clients' data can be shared across processes
+        self.shareable = shareable
+        # Whether test batches group samples of similar lengths, see
+        # `benchmark_utils.bucketing`
+        self.bucket_batches = bucket_batches
+        # Keyword arguments of the `BatchAugmentation` collating the training
+        # batches of images, which are not augmented if None
+        self.batch_augmentation = batch_augmentation
 
     def train_test_split_datasets(self):
         # This part may vary across datasets specifically for label/RAM issues
@@ -88,6 +112,13 @@ class FLambyDataset(BaseDataset):
         self.pooled_train_dataset = ConcatDataset(self.train_datasets)
         self.pooled_test_dataset = ConcatDataset(self.test_datasets)
 
+    def load_fed_dataset(self, *args, **kwargs):
+        # Concurrent benchopt processes can share a single copy of the data
+        # in memory, see `benchmark_utils.shared_datasets`
+        if self.shareable and use_shared_data():
+            return load_shared_dataset(self.fed_dataset, *args, **kwargs)
+        return self.fed_dataset(*args, **kwargs)
+
     def get_data(self):
         # The return arguments of this function are passed as keyword arguments
         # to `Objective.set_data`. This defines the benchmark's
@@ -98,17 +129,31 @@ class FLambyDataset(BaseDataset):
         self.is_validation = self.test == "val"
         try:
             self.train_datasets = [
-                self.fed_dataset(i, train=True) for i in range(self.num_clients)
+                self.load_fed_dataset(i, train=True)
+                for i in range(self.num_clients)
             ]
             self.train_sizes = [len(d) for d in self.train_datasets]
-            self.test_datasets = [
-                self.fed_dataset(i, train=False) for i in range(self.num_clients)
-            ]
-            self.pooled_train_dataset = self.fed_dataset(train=True, pooled=True)
-            self.pooled_test_dataset = self.fed_dataset(train=False, pooled=True)
+            # The pooled training set is the concatenation of the clients'
+            # ones, which is not loaded again, e.g. decoded into another
+            # cache of images
+            self.pooled_train_dataset = ConcatDataset(self.train_datasets)
+            # In validation mode, the test sets are replaced by validation
+            # sets split from the training ones, see
+            # `train_test_split_datasets`, so FLamby's are only loaded, or
+            # shared, in test mode
+            self.test_datasets, self.pooled_test_dataset = [], None
+            if not self.is_validation:
+                self.test_datasets = [
+                    self.load_fed_dataset(i, train=False)
+                    for i in range(self.num_clients)
+                ]
+                self.pooled_test_dataset = self.load_fed_dataset(
+                    train=False, pooled=True
+                )
 
         except (ValueError, FileNotFoundError, OSError):
-            # so that the CI can run wo downloading any dataset
+            # so that the CI can run wo downloading any dataset. Failures to
+            # share the data raise a `SharedDataError`, which isn't caught
             return dict(
             train_datasets=[],
             test_datasets=[],
@@ -120,18 +165,14 @@ class FLambyDataset(BaseDataset):
             num_clients=self.num_clients,
             batch_size_test=self.batch_size_test,
             collate_fn=self.collate_fn,
+            evaluator=self.evaluator,
+            evaluator_params=self.evaluator_params,
+            bucket_batches=self.bucket_batches,
+            batch_augmentation=self.batch_augmentation,
         )
 
 
-        if self.train == "pooled":
-            self.train_datasets = [self.pooled_train_dataset]
-            self.train_sizes = [len(self.pooled_train_dataset)]
-            self.num_clients = 1
-
-        elif self.train in ["fl", "federated"]:
-            pass
-
-        else:
+        if self.train not in ["pooled", "fl", "federated"]:
             raise ValueError()
 
         if self.test == "val":
@@ -143,6 +184,14 @@ class FLambyDataset(BaseDataset):
         else:
             raise ValueError()
 
+        if self.train == "pooled":
+            # The training sets of the clients are pooled into a single one,
+            # indexed contiguously. The clients' splits and test sets are
+            # kept so that the curves compare with the federated ones.
+            self.train_datasets = [PooledDataset(self.train_datasets)]
+            self.train_sizes = [len(self.train_datasets[0])]
+            self.pooled_train_dataset = self.train_datasets[0]
+
         # ! The metric depends on the dataset it has to be passed to the
         # objective, same for loss and model
 
@@ -158,4 +207,8 @@ class FLambyDataset(BaseDataset):
             num_clients=self.num_clients,
             batch_size_test=self.batch_size_test,
             collate_fn=self.collate_fn,
+            evaluator=self.evaluator,
+            evaluator_params=self.evaluator_params,
+            bucket_batches=self.bucket_batches,
+            batch_augmentation=self.batch_augmentation,
         )
@@ -1,3 +1,6 @@
+import time
+import warnings
+
 from benchopt import BaseSolver, safe_import_context
 
 # Protect the import with `safe_import_context()`. This allows:
@@ -5,9 +8,27 @@ from benchopt import BaseSolver, safe_import_context
 # - getting requirements info when all dependencies are not installed.
 with safe_import_context() as import_ctx:
     from torch.optim import SGD
+    from torch.profiler import record_function
     from torch.utils.data import DataLoader as dl
 
     from benchmark_utils import CustomSPC
+    from benchmark_utils.divergence import (
+        DIVERGENCE_REASONS,
+        DivergenceGuard,
+    )
+    from benchmark_utils.evaluation_schedule import EvaluationSchedule
+    from benchmark_utils.instrumentation import (
+        MemoryLimitExceeded,
+        MemoryTracker,
+        PhaseTimer,
+        instrument_strategy,
+        tracked,
+    )
+
+# The modules of the optional features (batch augmentation, compilation,
+# compute counting, distributed training, metrics streaming, profiling, silo
+# simulation and snapshots) are imported in the code paths using them, like
+# the evaluators of `benchmark_utils.evaluators`.
 
 
 # The benchmark solvers must be named `Solver` and
@@ -36,6 +57,8 @@ class FLambySolver(BaseSolver):
     def __init__(self, strategy, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.strategy = strategy
+        self.eval_schedule = EvaluationSchedule()
+        self.evaluated = []
         # We override dynamically the method of the instance, inheritance
         # would be cleaner but
         # I could not make it work because of pickling issues
@@ -49,6 +72,10 @@ class FLambySolver(BaseSolver):
         is_validation,
         model,
         loss,  # noqa: E501
+        torch_compile=False,
+        batch_augmentation=None,
+        seed=42,
+        replicate_models=None,
     ):
         # Define the information received by each solver from the objective.
         # The arguments of this function are the results of the
@@ -62,53 +89,360 @@ class FLambySolver(BaseSolver):
             "is_validation",
             "model",
             "loss",
+            "torch_compile",
+            "batch_augmentation",
+            "seed",
+            "replicate_models",
         ]
 
         for att in att_names:
             setattr(self, att, eval(att))
 
+    def train_collate_fn(self, client_idx, seed):
+        """Collate function of the training batches of a client."""
+        if self.batch_augmentation is None:
+            return self.collate_fn
+        from benchmark_utils.batch_augmentation import BatchAugmentation
+
+        # Images are augmented by batch, with the same seeding as the
+        # batches of the client
+        return BatchAugmentation(
+            seed=seed + client_idx, **self.batch_augmentation
+        )
+
+    def train_loader(self, dataset, client_idx, seed):
+        """Dataloader of the training batches of a client."""
+        collate_fn = self.train_collate_fn(client_idx, seed)
+        return dl(dataset, self.batch_size, collate_fn=collate_fn)
+
     def set_strategy_specific_args(self):
         self.strategy_specific_args = {}
 
+    def build_strategy(self):
+        """Instantiate the FLamby strategy and instrument it."""
+        from benchmark_utils.compute_accounting import count_compute
+        from benchmark_utils.metrics_stream import get_stream
+        from benchmark_utils.profiling import TorchProfiler
+        from benchmark_utils.silo_simulation import (
+            SiloSimulator,
+            simulate_silos,
+        )
+
+        self.timer = PhaseTimer()
+        # Replicates are timed apart so that the timings are the ones of the
+        # strategy, see `perform_round`
+        self.replicate_timer = PhaseTimer(prefix="replicates_time")
+        self.memory_tracker = MemoryTracker()
+        self.profiler = TorchProfiler()
+        # Rounds and evaluations can be streamed live, see `MetricsStream`
+        self.stream = get_stream()
+        if self.stream is not None:
+            self.stream.run = repr(self)
+        self.release_workers = []
+        self.worker_stats = {}
+        self.strat = self.build_replicate(self.model, self.seed, self.timer)
+        # The compute of the clients can be counted, see `ComputeCounter`
+        self.compute_counter = None
+        if count_compute() or simulate_silos():
+            from benchmark_utils.compute_accounting import (
+                ComputeCounter,
+                FlopsEstimator,
+                instrument_compute,
+            )
+
+            self.compute_counter = ComputeCounter()
+            instrument_compute(
+                self.strat,
+                self.compute_counter,
+                FlopsEstimator(self.model, self.loss),
+            )
+        # Round times on heterogeneous silos can be simulated from the
+        # compute of the clients, see `SiloSimulator`
+        self.silo_simulator = SiloSimulator.from_env(
+            self.model, len(self.train_datasets), self.compute_counter
+        )
+        # Diverging runs are stopped before their next evaluation, see
+        # `DivergenceGuard`
+        self.divergence_guard = DivergenceGuard.from_env()
+        self.diverged = 0
+        if self.divergence_guard is not None:
+            self.divergence_guard.instrument(self.strat)
+            self.divergence_guard.start(self.global_model(self.strat))
+        return self.strat
+
+    def build_replicate(self, model, seed, timer):
+        """Instantiate the strategy training `model` with the given seed,
+        timed by `timer`.
+
+        All replicates share the datasets and the memory tracker.
+        """
+        with tracked("setup", timer, self.memory_tracker):
+            self.train_dls = [
+                self.train_loader(train_d, client_idx, seed)
+                for client_idx, train_d in enumerate(self.train_datasets)
+            ]
+            # Strategies with their own randomness are seeded with it
+            self.strategy_seed = seed
+            self.set_strategy_specific_args()
+            strat = self.strategy(
+                self.train_dls,
+                model,
+                self.loss,
+                SGD,
+                self.learning_rate,
+                self.num_updates,
+                nrounds=-100,  # It won't be used anyway as we do not call the run method   # noqa: E501
+                **self.strategy_specific_args
+            )
+        # Clients can be trained in worker processes, see
+        # `benchmark_utils.distributed`. This is done before the models are
+        # compiled and instrumented as the workers receive copies of them.
+        from benchmark_utils.distributed import use_distributed
+
+        if use_distributed():
+            from benchmark_utils.compute_accounting import count_compute
+            from benchmark_utils.distributed import distribute_strategy
+            from benchmark_utils.silo_simulation import simulate_silos
+
+            release, self.worker_stats[strat] = distribute_strategy(
+                strat,
+                self.train_dls,
+                timer,
+                self.torch_compile,
+                count_compute=count_compute() or simulate_silos(),
+            )
+            self.release_workers.append(release)
+        # The strategy holds copies of the model, which are compiled in place
+        if self.torch_compile:
+            from benchmark_utils.compilation import compile_model
+
+            for _model in strat.models_list:
+                compile_model(_model.model)
+        # We time each client's local updates and data loading and track
+        # their memory usage so that stragglers and OOMs can be spotted
+        instrument_strategy(strat, timer, self.memory_tracker)
+        return strat
+
     def run(self, callback):
         # This is the function that is called to evaluate the solver.
-        # It runs the algorithm for a given a number of rounds
-        # (max_runs * 10)
+        # It runs the algorithm until benchopt stops it after an evaluation,
+        # the evaluations being scheduled by `get_next`
+        self.eval_schedule = EvaluationSchedule()
+        # In snapshot mode, the models are recorded instead of evaluated and
+        # are evaluated afterwards by `evaluate_snapshots.py`
+        from benchmark_utils.snapshots import SnapshotCallback, SnapshotWriter
 
-        self.train_dls = [
-            dl(train_d, self.batch_size, collate_fn=self.collate_fn)
-            for train_d in self.train_datasets  # noqa: E501
-        ]
-        self.set_strategy_specific_args()
-        strat = self.strategy(
-            self.train_dls,
-            self.model,
-            self.loss,
-            SGD,
-            self.learning_rate,
-            self.num_updates,
-            nrounds=-100,  # It won't be used anyway as we do not call the run method   # noqa: E501
-            **self.strategy_specific_args
+        benchopt_callback = callback
+        snapshot_writer = SnapshotWriter.from_env(
+            callback.meta, self.eval_schedule
         )
+        if snapshot_writer is not None:
+            callback = SnapshotCallback(self, snapshot_writer)
+        self.evaluated = callback.curve
+        strat = self.build_strategy()
+        # Replicates with other seeds are trained side by side, round by round
+        self.replicate_strats = {
+            seed: self.build_replicate(model, seed, self.replicate_timer)
+            for seed, model in (self.replicate_models or {}).items()
+        }
+        # Each replicate has its own divergence guard, diverged replicates
+        # are no longer trained and are left out of the evaluations
+        self.replicate_guards = {}
+        self.replicates_diverged = {}
+        if self.divergence_guard is not None:
+            for seed, replicate in self.replicate_strats.items():
+                guard = DivergenceGuard.from_env()
+                guard.instrument(replicate)
+                guard.start(self.global_model(replicate))
+                self.replicate_guards[seed] = guard
+                self.replicates_diverged[seed] = 0
         # We are reproducing the run method but this time a callback checks
         # stopping-criterion at each round, which allows to cache computations
         # and do a single run
-        self.final_model = strat.models_list[0].model
-        while callback():
+        self.final_model = self.global_model(strat)
+        try:
+            while callback():
+                if self.eval_schedule.is_over(self.timer.counters["rounds"]):
+                    # The last round of the budget was just evaluated
+                    break
+                self.perform_round(strat, self.active_replicates())
+                self.final_model = self.global_model(strat)
+                self.check_replicates_divergence()
+                if self.check_divergence():
+                    # The objective does not evaluate diverged models, this
+                    # only records the divergence, the callback being forced
+                    # to evaluate whatever the schedule
+                    callback.next_stopval = callback.it
+                    callback()
+                    break
+            if snapshot_writer is not None:
+                # benchopt only evaluates the final round of snapshot runs
+                benchopt_callback.it = self.timer.counters["rounds"]
+                benchopt_callback.next_stopval = benchopt_callback.it
+                benchopt_callback()
+        except MemoryLimitExceeded as e:
+            # The soft limit can be hit either during the training or during
+            # the evaluation in the callback, in both cases we stop the run
+            # and keep the curve obtained so far
+            warnings.warn(f"Stopping the run: {e}")
+        finally:
+            # The window of rounds to profile may not have been completed
+            self.profiler.stop(tag=self.name)
+            for release in self.release_workers:
+                release()
+            if snapshot_writer is not None:
+                snapshot_writer.close()
+
+        self.final_model = self.global_model(strat)
+
+    def check_divergence(self):
+        """Whether the run diverged during the last round."""
+        if self.divergence_guard is None:
+            return False
+        self.diverged = self.divergence_guard.check(self.final_model)
+        if self.diverged:
+            reason = DIVERGENCE_REASONS[self.diverged]
+            n_rounds = self.timer.counters["rounds"]
+            warnings.warn(
+                f"Stopping the run diverging after {n_rounds} rounds: "
+                f"{reason}"
+            )
+            if self.stream is not None:
+                self.stream.emit(
+                    "divergence", {"round": n_rounds - 1, "reason": reason}
+                )
+        return bool(self.diverged)
+
+    def active_replicates(self):
+        """The replicates which did not diverge, by seed."""
+        return {
+            seed: replicate
+            for seed, replicate in self.replicate_strats.items()
+            if not self.replicates_diverged.get(seed)
+        }
+
+    def check_replicates_divergence(self):
+        """Record the replicates which diverged during the last round, the
+        run going on with the others."""
+        for seed, replicate in self.active_replicates().items():
+            guard = self.replicate_guards.get(seed)
+            if guard is None:
+                continue
+            self.replicates_diverged[seed] = guard.check(
+                self.global_model(replicate)
+            )
+            if self.replicates_diverged[seed]:
+                reason = DIVERGENCE_REASONS[self.replicates_diverged[seed]]
+                n_rounds = self.timer.counters["rounds"]
+                warnings.warn(
+                    f"Stopping the replicate with seed {seed} diverging "
+                    f"after {n_rounds} rounds: {reason}"
+                )
+
+    @staticmethod
+    def global_model(strat):
+        """The model of the server, which is evaluated."""
+        return strat.models_list[0].model
+
+    def perform_round(self, strat, replicates=None):
+        """Perform one round of the strategy while instrumenting it, then
+        one round of each of its `replicates`, by seed.
+
+        The timings, compute and simulated times of the round are the ones
+        of the strategy, the rounds of the replicates being timed on their
+        own by `replicate_timer`.
+        """
+        round_idx = self.timer.counters["rounds"]
+        self.profiler.round_start(round_idx)
+        round_start = time.perf_counter()
+        local_train_start = self.timer.total("local_train")
+        overhead_start = self.memory_tracker.overhead
+        with record_function(f"round_{round_idx}"):
             strat.perform_round()
-            self.final_model = strat.models_list[0].model
+        self.merge_worker_stats(
+            strat, self.timer, self.compute_counter, self.divergence_guard
+        )
+        round_time = time.perf_counter() - round_start
+        self.timer.add("round", round_time)
+        # Everything which is not local training in a round is spent by the
+        # server aggregating and broadcasting the updates
+        local_train_time = self.timer.total("local_train") - local_train_start
+        overhead = self.memory_tracker.overhead - overhead_start
+        aggregation_time = round_time - local_train_time - overhead
+        self.timer.add("aggregation", aggregation_time)
+        if self.compute_counter is not None:
+            self.compute_counter.round_end()
+        if self.silo_simulator is not None:
+            self.silo_simulator.round_end(aggregation_time)
+        if replicates:
+            with self.replicate_timer.phase("round"), record_function(
+                f"replicates_round_{round_idx}"
+            ):
+                for seed, replicate in replicates.items():
+                    replicate.perform_round()
+                    self.merge_worker_stats(
+                        replicate,
+                        self.replicate_timer,
+                        divergence_guard=self.replicate_guards.get(seed),
+                    )
+        self.timer.count("rounds")
+        if self.stream is not None:
+            self.stream.emit(
+                "round",
+                {
+                    "round": round_idx,
+                    "round_time": round_time,
+                    "local_train_time": local_train_time,
+                    "aggregation_time": aggregation_time,
+                    "total_round_time": self.timer.total("round"),
+                },
+            )
+        self.profiler.round_end(round_idx, tag=self.name)
 
-        self.final_model = strat.models_list[0].model
+    def merge_worker_stats(
+        self, strat, timer, compute_counter=None, divergence_guard=None
+    ):
+        """Merge the counts of the clients of `strat` trained in worker
+        processes during the round, see `benchmark_utils.distributed`."""
+        worker_stats = self.worker_stats.get(strat)
+        if worker_stats is not None:
+            worker_stats.merge(timer, compute_counter, divergence_guard)
 
     def get_result(self):
         # Return the result from one optimization run.
         # The outputs of this function are the arguments of `Objective.compute`
         # This defines the benchmark's API for solvers' results.
         # it is customizable for each benchmark.
-        return {"model": self.final_model}
+        # Timings and memory usage are passed along with the model so that
+        # they end up as extra columns of benchopt's results
+        solver_stats = {
+            **self.timer.to_dict(),
+            **self.memory_tracker.to_dict(),
+        }
+        if self.silo_simulator is not None:
+            solver_stats.update(self.silo_simulator.to_dict())
+        if self.compute_counter is not None:
+            solver_stats.update(self.compute_counter.to_dict())
+        if self.replicate_strats:
+            solver_stats.update(self.replicate_timer.to_dict())
+        if self.divergence_guard is not None:
+            solver_stats["diverged"] = self.diverged
+            for seed, diverged in self.replicates_diverged.items():
+                solver_stats[f"diverged_seed_{seed}"] = diverged
+        # Strategies can report their own statistics, e.g. the simulated
+        # time of asynchronous strategies
+        if hasattr(self.strat, "stats"):
+            solver_stats.update(self.strat.stats())
+        return {
+            "model": self.final_model,
+            "replicate_models": {
+                seed: self.global_model(replicate)
+                for seed, replicate in self.active_replicates().items()
+            },
+            "solver_stats": solver_stats,
+        }
 
-    # Not used if callback is used
-    @staticmethod
-    def get_next(stop_val):
-        """This function gives the sampling rate of the curve."""
-        return stop_val + 10
+    def get_next(self, stop_val):
+        """This function gives the sampling rate of the curve, see
+        `EvaluationSchedule`."""
+        return self.eval_schedule.next_round(stop_val, self.evaluated)
@@ -0,0 +1,56 @@
+import pytest
+import torch
+
+from benchmark_utils.bucketing import BucketBatchSampler, masked_bag_collate
+
+
+def test_bucket_batches_sorted_by_length():
+    lengths = [5, 1, 4, 2, 3]
+    sampler = BucketBatchSampler(lengths, batch_size=2)
+    assert list(sampler) == [[1, 3], [4, 2], [0]]
+    assert len(sampler) == 3
+
+
+def test_bucket_batches_max_instances():
+    lengths = [1, 1, 1, 10, 10]
+    # Padded batches hold at most 8 instances: (n_bags) * (length + 1)
+    sampler = BucketBatchSampler(lengths, batch_size=4, max_batch_instances=8)
+    assert list(sampler) == [[0, 1, 2], [3], [4]]
+
+
+def attention_pooling(X, w):
+    """Attention pooling of bags of instances, the last feature of masked
+    bags being the log-weight of each instance."""
+    if X.shape[-1] == w.shape[0] + 1:
+        X, log_weights = X[..., :-1], X[..., -1]
+        logits = X @ w + log_weights
+    else:
+        logits = X @ w
+    attention = torch.softmax(logits, dim=1)
+    return (attention.unsqueeze(-1) * X).sum(dim=1)
+
+
+def test_masked_bags_equivalent_to_zero_padding():
+    generator = torch.Generator().manual_seed(0)
+    max_tiles = 8
+    samples = [
+        (torch.randn(n, 3, generator=generator), torch.tensor([float(n)]))
+        for n in [2, 5, 3]
+    ]
+    X, y = masked_bag_collate(samples, max_tiles=max_tiles)
+    assert X.shape == (3, 6, 4)
+    torch.testing.assert_close(y, torch.tensor([[2.0], [5.0], [3.0]]))
+
+    padded = torch.zeros(3, max_tiles, 3)
+    for i, (X_i, _) in enumerate(samples):
+        padded[i, :len(X_i)] = X_i
+    w = torch.randn(3, generator=generator)
+    torch.testing.assert_close(
+        attention_pooling(X, w), attention_pooling(padded, w)
+    )
+
+
+def test_masked_bags_too_long():
+    samples = [(torch.zeros(5, 2), torch.tensor([0.0]))]
+    with pytest.raises(ValueError, match="at most 4 instances"):
+        masked_bag_collate(samples, max_tiles=4)
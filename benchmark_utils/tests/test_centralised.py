@@ -0,0 +1,36 @@
+import pytest
+import torch
+from torch.utils.data import ConcatDataset, Subset, TensorDataset
+
+pytest.importorskip("flamby")
+
+from benchmark_utils.centralised import PooledDataset  # noqa: E402
+
+
+def tensor_dataset(start, n):
+    return TensorDataset(torch.arange(start, start + n).float())
+
+
+def test_pooled_dataset_matches_concatenation():
+    base = ConcatDataset([tensor_dataset(0, 10), tensor_dataset(100, 5)])
+    clients = [
+        Subset(base, [3, 12, 0]),
+        Subset(Subset(base, [14, 1, 2, 11]), [2, 0]),
+        tensor_dataset(1000, 3),
+    ]
+    pooled = PooledDataset(clients)
+    expected = ConcatDataset(clients)
+    assert len(pooled) == len(expected) == 8
+    for idx in range(len(expected)):
+        assert pooled[idx] == expected[idx]
+    # Samples are fetched from the base datasets directly
+    assert all(isinstance(d, TensorDataset) for d in pooled.sources)
+
+
+def test_pooled_dataset_of_pooled_datasets():
+    clients = [tensor_dataset(0, 4), tensor_dataset(10, 2)]
+    pooled = PooledDataset(
+        [PooledDataset(clients), Subset(PooledDataset(clients), [5, 0])]
+    )
+    expected = [0, 1, 2, 3, 10, 11, 11, 0]
+    assert [pooled[idx][0].item() for idx in range(len(pooled))] == expected
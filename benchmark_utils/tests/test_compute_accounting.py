@@ -0,0 +1,46 @@
+import pytest
+import torch
+from torch.utils.flop_counter import FlopCounterMode
+
+from benchmark_utils.compute_accounting import FlopsEstimator
+
+
+class SelfAttention(torch.nn.Module):
+    """Model whose FLOPs are quadratic in the number of instances."""
+
+    def __init__(self):
+        super().__init__()
+        self.attention = torch.nn.MultiheadAttention(8, 2, batch_first=True)
+
+    def forward(self, X):
+        return self.attention(X, X, X)[0]
+
+
+def batch_flops(model, X):
+    with FlopCounterMode(display=False) as counter, torch.no_grad():
+        model.eval()(X)
+    return counter.get_total_flops()
+
+
+@pytest.mark.parametrize(
+    "model, shapes",
+    [
+        (torch.nn.Linear(39, 1), [(39,)]),
+        (torch.nn.Conv2d(3, 8, 3), [(3, 16, 16), (3, 32, 32)]),
+        (SelfAttention(), [(5, 8), (20, 8)]),
+    ],
+)
+def test_per_sample_flops(model, shapes):
+    estimator = FlopsEstimator(model)
+    for shape in shapes:
+        X = torch.randn((4,) + shape)
+        assert len(X) * estimator.per_sample(X) == batch_flops(model, X)
+
+
+def test_training_flops_include_backward():
+    model = torch.nn.Linear(39, 1)
+    estimator = FlopsEstimator(model, torch.nn.MSELoss())
+    X, y = torch.randn(4, 39), torch.randn(4, 1)
+    assert estimator.per_sample(X, y) > estimator.per_sample(X)
+    # The parameters of the model are left untouched
+    assert model.weight.grad is None
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from benchmark_utils.divergence import DivergenceGuard
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return torch.nn.Linear(4, 2)
+
+
+def started_guard(model):
+    guard = DivergenceGuard(norm_growth=10.0, loss_growth=2.0)
+    guard.start(model)
+    return guard
+
+
+def test_no_divergence(model):
+    guard = started_guard(model)
+    assert guard.check(model) == 0
+    guard.record(torch.tensor(1.0))
+    assert guard.check(model) == 0
+    guard.record(torch.tensor(1.5))
+    assert guard.check(model) == 0
+
+
+def test_non_finite_parameters(model):
+    guard = started_guard(model)
+    with torch.no_grad():
+        model.weight[0, 0] = float("nan")
+    assert guard.check(model) == 1
+
+
+def test_parameter_norm_growth(model):
+    guard = started_guard(model)
+    with torch.no_grad():
+        model.weight.mul_(100)
+    assert guard.check(model) == 2
+
+
+def test_non_finite_loss(model):
+    guard = started_guard(model)
+    guard.record(torch.tensor(float("inf")))
+    assert guard.check(model) == 3
+
+
+def test_loss_growth(model):
+    guard = started_guard(model)
+    # The mean of the losses of the first round is the reference
+    guard.record(torch.tensor(3.0), count=3)
+    assert guard.check(model) == 0
+    guard.record(torch.tensor(5.0), count=2)
+    assert guard.check(model) == 4
+
+
+def test_losses_reset_after_each_check(model):
+    guard = started_guard(model)
+    guard.record(torch.tensor(1.0))
+    guard.record(torch.tensor(2.0))
+    assert guard.pop_losses() == (3.0, 2)
+    assert guard.pop_losses() == (0.0, 0)
+
+
+def test_instrumented_losses_recorded(model):
+    guard = started_guard(model)
+    mse = torch.nn.MSELoss()
+    strat = SimpleNamespace(
+        models_list=[SimpleNamespace(_loss=mse) for _ in range(2)]
+    )
+    guard.instrument(strat)
+    X, y = torch.ones(3, 4), torch.zeros(3, 2)
+    losses = [
+        _model._loss(model(X), y).item() for _model in strat.models_list
+    ]
+    loss_sum, count = guard.pop_losses()
+    assert count == 2
+    assert loss_sum == pytest.approx(sum(losses))
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv("FLAMBY_BENCHMARK_DIVERGENCE_GUARD", raising=False)
+    assert isinstance(DivergenceGuard.from_env(), DivergenceGuard)
+    monkeypatch.setenv("FLAMBY_BENCHMARK_DIVERGENCE_GUARD", "0")
+    assert DivergenceGuard.from_env() is None
@@ -0,0 +1,86 @@
+import pytest
+
+from benchmark_utils.evaluation_schedule import EvaluationSchedule
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    monkeypatch.delenv("FLAMBY_BENCHMARK_EVAL_SCHEDULE", raising=False)
+    monkeypatch.delenv("FLAMBY_BENCHMARK_MAX_ROUNDS", raising=False)
+
+
+def curve(values):
+    return [
+        {"stop_val": stop_val, "objective_value": value}
+        for stop_val, value in values
+    ]
+
+
+def test_every():
+    schedule = EvaluationSchedule("every:3")
+    assert schedule.next_round(0) == 3
+    assert schedule.next_round(3) == 6
+
+
+def test_geometric():
+    schedule = EvaluationSchedule("geometric:2")
+    assert [schedule.next_round(r) for r in [0, 1, 3, 10]] == [1, 2, 6, 20]
+
+
+def test_adaptive_interval_grows_by_doubling():
+    # The objective changes by 2**-10 per round, the tolerance is reached
+    # after 8 rounds
+    schedule = EvaluationSchedule(f"adaptive:{2**-7}:20")
+    assert schedule.next_round(0, curve([(0, 1.0)])) == 1
+    points = [(0, 1.0), (1, 1.0 - 2**-10)]
+    intervals = []
+    for _ in range(4):
+        stop_val = points[-1][0]
+        next_val = schedule.next_round(stop_val, curve(points))
+        intervals.append(next_val - stop_val)
+        points.append((next_val, 1.0 - next_val * 2**-10))
+    assert intervals == [2, 4, 8, 8]
+
+
+def test_adaptive_flat_curve_capped_by_max_interval():
+    schedule = EvaluationSchedule("adaptive:0.01:3")
+    points = curve([(0, 1.0), (1, 1.0)])
+    assert [schedule.next_round(1, points) - 1 for _ in range(3)] == [2, 3, 3]
+
+
+def test_adaptive_non_finite_objective():
+    schedule = EvaluationSchedule("adaptive")
+    points = curve([(0, 1.0), (1, float("nan"))])
+    assert schedule.next_round(1, points) == 2
+
+
+def test_max_rounds():
+    schedule = EvaluationSchedule("every:3", max_rounds=5)
+    assert schedule.next_round(3) == 5
+    assert not schedule.is_over(4)
+    assert schedule.is_over(5)
+    assert not EvaluationSchedule("every:3").is_over(1000)
+
+
+def test_from_env(monkeypatch):
+    assert EvaluationSchedule().every == 10
+    monkeypatch.setenv("FLAMBY_BENCHMARK_EVAL_SCHEDULE", "geometric:1.5")
+    monkeypatch.setenv("FLAMBY_BENCHMARK_MAX_ROUNDS", "7")
+    schedule = EvaluationSchedule()
+    assert schedule.mode == "geometric"
+    assert schedule.max_rounds == 7
+
+
+@pytest.mark.parametrize(
+    "schedule",
+    ["every:0", "every:x", "geometric:1", "adaptive:0", "adaptive:0.1:0",
+     "linear:2"],
+)
+def test_invalid_schedule(schedule):
+    with pytest.raises(ValueError, match="Invalid evaluation schedule"):
+        EvaluationSchedule(schedule)
+
+
+def test_invalid_max_rounds():
+    with pytest.raises(ValueError, match="Invalid budget of rounds"):
+        EvaluationSchedule("every:1", max_rounds=0)
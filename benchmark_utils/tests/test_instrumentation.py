@@ -0,0 +1,105 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark_utils.distributed import WorkerStats
+from benchmark_utils.instrumentation import PhaseTimer, instrument_strategy
+from benchmark_utils.template_flamby_strategy import FLambySolver
+
+
+def test_phase_timer_to_dict():
+    timer = PhaseTimer()
+    timer.add("round", 1.5)
+    timer.add("round", 0.5)
+    timer.add("local_train_client_0", 0.25)
+    timer.count("rounds")
+    timer.count("rounds", 2)
+    assert timer.to_dict() == {
+        "time_round": 2.0,
+        "time_local_train_client_0": 0.25,
+        "n_rounds": 3,
+    }
+    assert timer.total("round") == 2.0
+    assert timer.total("aggregation") == 0.0
+
+    timer.reset()
+    assert timer.to_dict() == {}
+
+
+def test_phase_timer_prefix():
+    timer = PhaseTimer(prefix="eval_time")
+    timer.add("loaders", 1.0)
+    timer.count("evaluations")
+    assert timer.to_dict() == {"eval_time_loaders": 1.0, "n_evaluations": 1}
+
+
+def test_phase_timer_phase_and_wrap():
+    timer = PhaseTimer()
+    with timer.phase("setup"):
+        time.sleep(0.01)
+
+    def fail():
+        time.sleep(0.01)
+        raise RuntimeError
+
+    # Time spent in failing calls is counted too
+    with pytest.raises(RuntimeError):
+        timer.wrap(fail, "local_train", "local_train_client_1")()
+    assert timer.total("setup") >= 0.01
+    assert timer.total("local_train") >= 0.01
+    assert timer.total("local_train") == timer.total("local_train_client_1")
+
+
+def fake_strategy(n_clients):
+    def sleep(*args, **kwargs):
+        time.sleep(0.005)
+
+    return SimpleNamespace(
+        models_list=[
+            SimpleNamespace(_local_train=sleep) for _ in range(n_clients)
+        ],
+        dataloaders_with_memory=[
+            SimpleNamespace(get_samples=sleep) for _ in range(n_clients)
+        ],
+    )
+
+
+def test_instrument_strategy_per_client():
+    timer = PhaseTimer()
+    strat = fake_strategy(2)
+    instrument_strategy(strat, timer)
+    strat.models_list[0]._local_train()
+    strat.models_list[1]._local_train()
+    strat.models_list[1]._local_train()
+    strat.dataloaders_with_memory[0].get_samples()
+    res = timer.to_dict()
+    assert res["time_local_train"] == pytest.approx(
+        res["time_local_train_client_0"] + res["time_local_train_client_1"]
+    )
+    assert res["time_local_train_client_1"] > res["time_local_train_client_0"]
+    assert res["time_data_loading"] == res["time_data_loading_client_0"]
+    assert "time_data_loading_client_1" not in res
+
+
+def test_merge_worker_stats_per_client():
+    strat, other = object(), object()
+    worker_stats = WorkerStats()
+    worker_stats.add(0, {"data_loading": 1.0})
+    worker_stats.add(2, {"data_loading": 0.5})
+    worker_stats.add(2, {"data_loading": 0.25})
+    solver = SimpleNamespace(worker_stats={strat: worker_stats})
+    timer = PhaseTimer()
+    timer.add("data_loading_client_0", 0.5)
+
+    FLambySolver.merge_worker_stats(solver, strat, timer)
+    # Strategies trained in the main process have no worker stats
+    FLambySolver.merge_worker_stats(solver, other, timer)
+    assert timer.to_dict() == {
+        "time_data_loading_client_0": 1.5,
+        "time_data_loading": 1.75,
+        "time_data_loading_client_2": 0.75,
+    }
+    # Counts are only merged once
+    FLambySolver.merge_worker_stats(solver, strat, timer)
+    assert timer.total("data_loading") == 1.75
@@ -0,0 +1,38 @@
+import math
+
+import pytest
+
+from benchmark_utils.run_cache import ROOT, load_module
+
+Objective = load_module(ROOT / "objective.py").Objective
+
+
+def test_aggregate_replicates():
+    res = Objective.aggregate_replicates(
+        {
+            42: {"value": 1.0, "pooled_test_metric": 0.5},
+            43: {"value": 3.0, "pooled_test_metric": 0.7},
+        }
+    )
+    assert res["seed_42_value"] == 1.0
+    assert res["seed_43_value"] == 3.0
+    assert res["value"] == pytest.approx(2.0)
+    assert res["value_std"] == pytest.approx(1.0)
+    assert res["pooled_test_metric"] == pytest.approx(0.6)
+    assert res["pooled_test_metric_std"] == pytest.approx(0.1)
+
+
+def test_aggregate_replicates_missing_metrics():
+    # Metrics which are not computed for some seeds are averaged over the
+    # others
+    res = Objective.aggregate_replicates(
+        {42: {"value": 1.0, "extra": 2.0}, 43: {"value": 3.0}}
+    )
+    assert math.isnan(res["seed_43_extra"])
+    assert res["extra"] == 2.0
+    assert res["extra_std"] == 0.0
+
+
+def test_aggregate_single_replicate():
+    res = Objective.aggregate_replicates({42: {"value": 0.5}})
+    assert res == {"seed_42_value": 0.5, "value": 0.5, "value_std": 0.0}
@@ -0,0 +1,129 @@
+import os
+
+import pandas as pd
+import pyarrow.compute as pc
+
+from benchmark_utils.results_catalog import ResultsCatalog, has_results
+
+
+def results(dataset, seeds, solvers, offset=0.0):
+    return pd.DataFrame(
+        [
+            {
+                "data_name": f"{dataset}[seed={seed},test=val,train=fl]",
+                "solver_name": f"{solver}[batch_size=32,learning_rate=0.01]",
+                "time": float(time),
+                "objective_value": offset + 1.0 / (1 + time),
+            }
+            for seed in seeds
+            for solver in solvers
+            for time in [2, 0, 1]
+        ]
+    )
+
+
+def write(path, df):
+    df.to_parquet(path)
+    return path
+
+
+def test_ingest_and_query(tmp_path):
+    catalog = ResultsCatalog(tmp_path / "catalog")
+    first = write(
+        tmp_path / "first.parquet",
+        results("Fed-TCGA-BRCA", [42, 43], ["FedAvg", "FedProx"]),
+    )
+    second = write(
+        tmp_path / "second.parquet",
+        results("Fed-Heart-Disease", [42], ["FedAvg"]),
+    )
+    assert len(catalog.ingest([first, second])) == 2
+
+    curves = catalog.learning_curves("Fed-TCGA-BRCA")
+    assert len(curves) == 12
+    keys = curves[["solver_name", "time"]]
+    pd.testing.assert_frame_equal(keys, keys.sort_values(list(keys.columns)))
+
+    curves = catalog.learning_curves(
+        "Fed-TCGA-BRCA",
+        strategy="FedProx",
+        seed=43,
+        columns=["objective_value"],
+    )
+    assert len(curves) == 3
+    assert list(curves.columns) == [
+        "data_name", "solver_name", "time", "objective_value"
+    ]
+    assert curves["data_name"].str.contains("seed=43").all()
+
+    curves = catalog.learning_curves(
+        "Fed-TCGA-BRCA", filter=pc.field("time") > 0
+    )
+    assert len(curves) == 8
+
+    assert len(catalog.learning_curves("Fed-Heart-Disease")) == 3
+
+
+def test_ingest_only_new_or_modified_files(tmp_path):
+    catalog = ResultsCatalog(tmp_path / "catalog")
+    path = write(
+        tmp_path / "results.parquet",
+        results("Fed-TCGA-BRCA", [42], ["FedAvg"]),
+    )
+    assert len(catalog.ingest([path])) == 1
+    # The manifest is kept across instances
+    catalog = ResultsCatalog(tmp_path / "catalog")
+    assert catalog.ingest([path]) == []
+
+    # A modified file replaces its rows
+    write(path, results("Fed-TCGA-BRCA", [42], ["FedAvg"], offset=1.0))
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+    assert len(catalog.ingest([path])) == 1
+    curves = catalog.learning_curves(
+        "Fed-TCGA-BRCA", columns=["objective_value"]
+    )
+    assert len(curves) == 3
+    assert (curves["objective_value"] > 1.0).all()
+
+
+def test_compact(tmp_path):
+    catalog = ResultsCatalog(tmp_path / "catalog")
+    paths = [
+        write(
+            tmp_path / f"results_{idx}.parquet",
+            results("Fed-TCGA-BRCA", [42], ["FedAvg"], offset=idx),
+        )
+        for idx in range(3)
+    ]
+    catalog.ingest(paths)
+    partition = tmp_path / "catalog/dataset=Fed-TCGA-BRCA/strategy=FedAvg"
+    assert len(list(partition.glob("seed=42/*.parquet"))) == 3
+
+    catalog.compact(min_files=2)
+    files = list(partition.glob("seed=42/*.parquet"))
+    assert len(files) == 1
+    assert files[0].name.startswith("compacted-")
+    assert len(catalog.learning_curves("Fed-TCGA-BRCA")) == 9
+
+
+def test_empty_catalog(tmp_path):
+    catalog = ResultsCatalog(tmp_path / "catalog")
+    assert not has_results(catalog.dataset())
+    curves = catalog.learning_curves("Fed-TCGA-BRCA")
+    assert curves.empty
+    assert list(curves.columns) == ["data_name", "solver_name", "time"]
+
+
+def test_unknown_dataset(tmp_path):
+    catalog = ResultsCatalog(tmp_path / "catalog")
+    path = write(
+        tmp_path / "results.parquet",
+        results("Fed-TCGA-BRCA", [42], ["FedAvg"]),
+    )
+    catalog.ingest([path])
+    assert has_results(catalog.dataset("Fed-TCGA-BRCA"))
+    assert not has_results(catalog.dataset("Fed-IXI"))
+    curves = catalog.learning_curves("Fed-IXI", columns=["objective_value"])
+    assert curves.empty
+    assert "objective_value" in curves.columns
@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+from benchmark_utils.run_cache import ENV_VARS, RunCache, grid_names
+
+CONFIG = dict(
+    data_name="Fed-TCGA-BRCA[seed=42,test=val,train=fl]",
+    objective_name="FLamby[n_replicates=1,seed=42,torch_compile=False]",
+    solver_name="FederatedAveraging[batch_size=32,learning_rate=0.01]",
+    max_runs=10,
+    timeout=100,
+    code_hash="abc",
+)
+
+
+def key(**kwargs):
+    return RunCache.key(**{**CONFIG, "env": {}, **kwargs})
+
+
+def test_key_is_deterministic():
+    assert key() == key()
+    assert len(key()) == 64
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("data_name", "Fed-TCGA-BRCA[seed=43,test=val,train=fl]"),
+        ("solver_name", "FedProx[batch_size=32,learning_rate=0.01,mu=0.1]"),
+        ("max_runs", 20),
+        ("timeout", 200),
+        ("code_hash", "def"),
+    ],
+)
+def test_key_depends_on_config(name, value):
+    assert key(**{name: value}) != key()
+
+
+@pytest.mark.parametrize("name", ENV_VARS)
+def test_key_depends_on_env_vars(name):
+    assert key(env={name: "1"}) != key()
+    assert key(env={name: "1"}) != key(env={name: "2"})
+
+
+def test_key_ignores_other_env_vars():
+    assert key(env={"HOME": "/somewhere"}) == key()
+
+
+def test_key_reads_process_env(monkeypatch):
+    for name in ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    assert RunCache.key(**CONFIG) == key()
+    monkeypatch.setenv("FLAMBY_BENCHMARK_MAX_ROUNDS", "5")
+    assert RunCache.key(**CONFIG) == key(
+        env={"FLAMBY_BENCHMARK_MAX_ROUNDS": "5"}
+    )
+
+
+def test_store_and_load(tmp_path):
+    cache = RunCache(tmp_path / "cache")
+    df = pd.DataFrame({"stop_val": [0, 10], "objective_value": [1.0, 0.5]})
+    assert key() not in cache
+    cache.store(key(), df)
+    assert key() in cache
+    pd.testing.assert_frame_equal(cache.load(key()), df)
+    assert sorted(p.name for p in (tmp_path / "cache").iterdir()) == [
+        f"{key()}.parquet"
+    ]
+
+
+def test_grid_names():
+    class Solver:
+        name = "FedProx"
+        parameters = {"mu": [0.1, 1.0], "learning_rate": [0.01]}
+
+    assert grid_names(Solver) == [
+        "FedProx[learning_rate=0.01,mu=0.1]",
+        "FedProx[learning_rate=0.01,mu=1.0]",
+    ]
+
+    class Dataset:
+        name = "Fed-IXI"
+
+    assert grid_names(Dataset) == ["Fed-IXI"]
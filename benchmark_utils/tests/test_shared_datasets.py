@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import TensorDataset
+
+from benchmark_utils.shared_datasets import (
+    SharedDataError,
+    load_shared_dataset,
+    purge_shared_data,
+)
+
+
+class FakeDataset(TensorDataset):
+    n_loads = 0
+
+    def __init__(self, center, data_path, train=True):
+        FakeDataset.n_loads += 1
+        values = np.loadtxt(data_path, ndmin=1)
+        X = torch.from_numpy(values).float()[:, None] + center
+        super().__init__(X, (X > 0).long())
+
+
+class RaggedDataset(FakeDataset):
+    def __getitem__(self, idx):
+        return (torch.zeros(idx + 1),)
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("FLAMBY_BENCHMARK_SHARED_DATA_DIR", str(tmp_path))
+    path = tmp_path / "data.txt"
+    path.write_text("-1.0\n2.0\n3.0\n")
+    return path
+
+
+def shared_folders(tmp_path):
+    return sorted(p.name for p in tmp_path.glob("*FakeDataset*[!k]"))
+
+
+def test_shared_dataset_roundtrip(tmp_path, data_path):
+    expected = FakeDataset(1, str(data_path))
+    n_loads = FakeDataset.n_loads
+    for _ in range(2):
+        dataset = load_shared_dataset(FakeDataset, 1, data_path=str(data_path))
+        assert len(dataset) == len(expected)
+        for idx in range(len(expected)):
+            for a, b in zip(dataset[idx], expected[idx]):
+                torch.testing.assert_close(a, b)
+    # The dataset is only loaded by the first call
+    assert FakeDataset.n_loads == n_loads + 1
+    assert len(shared_folders(tmp_path)) == 1
+
+
+def test_change_of_data_writes_new_copy(tmp_path, data_path):
+    load_shared_dataset(FakeDataset, 0, data_path=str(data_path))
+    (old,) = shared_folders(tmp_path)
+    data_path.write_text("5.0\n")
+    dataset = load_shared_dataset(FakeDataset, 0, data_path=str(data_path))
+    assert len(dataset) == 1
+    # The outdated copy is removed
+    (new,) = shared_folders(tmp_path)
+    assert new != old
+    # Other datasets are kept
+    load_shared_dataset(FakeDataset, 1, data_path=str(data_path))
+    assert len(shared_folders(tmp_path)) == 2
+
+
+def test_errors(tmp_path, data_path):
+    # Errors of the dataset itself are raised as is, e.g. for the CI
+    with pytest.raises(FileNotFoundError):
+        load_shared_dataset(FakeDataset, 0, data_path=str(tmp_path / "x"))
+    data_path.write_text("1.0\n2.0\n")
+    with pytest.raises(SharedDataError) as exc_info:
+        load_shared_dataset(RaggedDataset, 0, data_path=str(data_path))
+    assert isinstance(exc_info.value.__cause__, ValueError)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_purge(tmp_path, data_path):
+    for center in range(3):
+        load_shared_dataset(FakeDataset, center, data_path=str(data_path))
+    prefix = f"{FakeDataset.__module__}.FakeDataset_1_"
+    expected = [n for n in shared_folders(tmp_path) if n.startswith(prefix)]
+    assert len(expected) == 1
+    assert purge_shared_data(prefix) == expected
+    assert len(shared_folders(tmp_path)) == 2
+    assert len(purge_shared_data()) == 2
+    assert shared_folders(tmp_path) == []
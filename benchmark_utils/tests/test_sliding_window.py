@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from benchmark_utils.sliding_window import (
+    evaluate_sliding_window,
+    patch_starts,
+    sliding_window_loss,
+)
+
+
+def dice(y_true, y_pred):
+    y_pred = y_pred > 0
+    return 2 * (y_pred * y_true).sum() / (y_pred.sum() + y_true.sum())
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    # A pointwise model has the same outputs on patches and whole volumes
+    return torch.nn.Conv3d(1, 2, 1)
+
+
+def loaders():
+    generator = torch.Generator().manual_seed(0)
+    X = torch.randn(5, 1, 8, 10, 12, generator=generator)
+    y = torch.randint(0, 2, (5, 2, 8, 10, 12), generator=generator).float()
+    return [
+        DataLoader(TensorDataset(X, y), batch_size=2),
+        DataLoader(TensorDataset(X[:3], y[:3]), batch_size=2),
+    ]
+
+
+def test_patch_starts():
+    assert patch_starts(5, 8, 0.5) == [0]
+    assert patch_starts(10, 4, 0.5) == [0, 2, 4, 6]
+    # The last patch is aligned on the end of the volume
+    assert patch_starts(11, 4, 0.5) == [0, 2, 4, 6, 7]
+
+
+@pytest.mark.parametrize("patch_size", [(8, 10, 12), (4, 4, 4)])
+def test_concatenate_aggregation(model, patch_size):
+    dls = loaders()
+    res = evaluate_sliding_window(
+        model, dls, dice, to_numpy=True, patch_size=patch_size, overlap=0.5
+    )
+    # The metric is computed once on the predictions of the client
+    with torch.no_grad():
+        for k, dl in enumerate(dls):
+            y_true = np.concatenate([y.numpy() for _, y in dl])
+            y_pred = np.concatenate([model(X).numpy() for X, _ in dl])
+            assert res[f"client_test_{k}"] == pytest.approx(
+                dice(y_true, y_pred)
+            )
+
+
+def test_batch_aggregation(model):
+    dls = loaders()
+    res = evaluate_sliding_window(
+        model, dls, dice, aggregation="batch", patch_size=(4, 4, 4)
+    )
+    with torch.no_grad():
+        for k, dl in enumerate(dls):
+            expected = np.mean([float(dice(y, model(X))) for X, y in dl])
+            assert res[f"client_test_{k}"] == pytest.approx(expected)
+
+
+def test_argmax_prediction(model):
+    def metric(y_true, y_pred):
+        assert y_pred.shape == y_true.shape[:1] + y_true.shape[2:]
+        return 1.0
+
+    res = evaluate_sliding_window(
+        model, loaders(), metric, prediction="argmax", patch_size=(4, 4, 4)
+    )
+    assert res == {"client_test_0": 1.0, "client_test_1": 1.0}
+
+
+def test_unknown_parameters(model):
+    with pytest.raises(ValueError, match="Unknown prediction"):
+        evaluate_sliding_window(model, loaders(), dice, prediction="soft")
+    with pytest.raises(ValueError, match="Unknown aggregation"):
+        evaluate_sliding_window(model, loaders(), dice, aggregation="volume")
+
+
+def test_loss_averaged_over_batches(model):
+    (dl, _) = loaders()
+    loss = torch.nn.BCEWithLogitsLoss()
+    with torch.no_grad():
+        expected = np.mean([loss(model(X), y).item() for X, y in dl])
+    assert sliding_window_loss(
+        model, dl, loss, patch_size=(4, 4, 4), overlap=0.5
+    ) == pytest.approx(expected)
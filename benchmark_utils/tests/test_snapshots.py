@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+import torch
+
+from benchmark_utils.evaluation_schedule import EvaluationSchedule
+from benchmark_utils.snapshots import (
+    SnapshotReader,
+    SnapshotWriter,
+    decode,
+    encode,
+    flatten_state,
+    list_runs,
+    run_dir,
+    stopped_rows,
+    unflatten_state,
+)
+from benchmark_utils.stopping_criteria import CustomSPC
+
+META = {
+    "data_name": "Fed-TCGA-BRCA[seed=42]",
+    "objective_name": "FLamby",
+    "solver_name": "FederatedAveraging",
+    "idx_rep": 0,
+}
+
+
+def state_dict(seed):
+    generator = torch.Generator().manual_seed(seed)
+    return {
+        "weight": torch.randn(3, 5, generator=generator),
+        "half": torch.randn(7, generator=generator).half(),
+        "double": torch.randn(2, generator=generator).double(),
+        "steps": torch.tensor([seed, 2 * seed]),
+        "flags": torch.tensor([1, 0, 1], dtype=torch.uint8),
+    }
+
+
+def assert_state_equal(actual, expected):
+    assert list(actual) == list(expected)
+    for name, tensor in expected.items():
+        if tensor.is_floating_point():
+            tensor = tensor.float()
+        assert actual[name].dtype == tensor.dtype
+        torch.testing.assert_close(actual[name], tensor, rtol=0, atol=0)
+
+
+def test_flatten_roundtrip():
+    layout, words = flatten_state(state_dict(0))
+    assert words.dtype == np.uint32
+    assert_state_equal(unflatten_state(layout, words), state_dict(0))
+
+
+@pytest.mark.parametrize("with_previous", [False, True])
+def test_encode_roundtrip(with_previous):
+    rng = np.random.default_rng(0)
+    words = rng.integers(0, 2**32, size=101, dtype=np.uint32)
+    previous = None
+    if with_previous:
+        previous = rng.integers(0, 2**32, size=101, dtype=np.uint32)
+    blob = encode(words, previous)
+    np.testing.assert_array_equal(decode(blob, len(words), previous), words)
+
+
+def test_delta_of_close_snapshots_is_smaller():
+    generator = torch.Generator().manual_seed(0)
+    weight = torch.randn(10000, generator=generator)
+    _, words = flatten_state({"weight": weight})
+    _, close = flatten_state(
+        {"weight": torch.from_numpy(words.view(np.float32) * 1.0001)}
+    )
+    assert len(encode(close, words)) < len(encode(close))
+
+
+def test_run_dir_depends_on_run_keys():
+    assert run_dir("store", META) == run_dir("store", {**META, "time": 1})
+    assert run_dir("store", META) != run_dir("store", {**META, "idx_rep": 1})
+
+
+@pytest.mark.parametrize("encoding", ["fp32", "delta"])
+def test_writer_reader_roundtrip(tmp_path, encoding):
+    path = run_dir(tmp_path, META)
+    writer = SnapshotWriter(path, META, encoding, keyframe_interval=2)
+    for round_idx in range(5):
+        writer.write(
+            round_idx,
+            {
+                "model": state_dict(round_idx),
+                "seed_43": state_dict(-round_idx),
+            },
+            {"time": float(round_idx)},
+        )
+    writer.close()
+
+    (reader,) = list_runs(tmp_path)
+    assert reader.meta == META
+    assert reader.encoding == encoding
+    assert len(reader) == 5
+    for round_idx, (stop_val, info, state_dicts) in enumerate(reader):
+        assert stop_val == round_idx
+        assert info == {"time": float(round_idx)}
+        assert_state_equal(state_dicts["model"], state_dict(round_idx))
+        assert_state_equal(state_dicts["seed_43"], state_dict(-round_idx))
+    keyframes = [r["streams"]["model"]["keyframe"] for r in reader.records]
+    if encoding == "delta":
+        assert keyframes == [True, False, True, False, True]
+    else:
+        assert all(keyframes)
+
+
+def test_writer_empties_the_run_folder(tmp_path):
+    (tmp_path / "subdir").mkdir()
+    (tmp_path / "index.jsonl").write_text("stale\n")
+    SnapshotWriter(tmp_path, META).close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["meta.json"]
+    assert len(SnapshotReader(tmp_path)) == 0
+
+
+def test_unknown_encoding(tmp_path):
+    with pytest.raises(ValueError, match="Unknown snapshot encoding"):
+        SnapshotWriter(tmp_path, META, encoding="fp16")
+
+
+def test_from_env(tmp_path, monkeypatch):
+    monkeypatch.delenv("FLAMBY_BENCHMARK_SNAPSHOTS", raising=False)
+    schedule = EvaluationSchedule("every:1", max_rounds=3)
+    assert SnapshotWriter.from_env(META, schedule) is None
+
+    monkeypatch.setenv("FLAMBY_BENCHMARK_SNAPSHOTS", str(tmp_path))
+    with pytest.raises(ValueError, match="budget of rounds"):
+        SnapshotWriter.from_env(META, EvaluationSchedule("every:1"))
+    with pytest.raises(ValueError, match="adaptive"):
+        SnapshotWriter.from_env(
+            META, EvaluationSchedule("adaptive", max_rounds=3)
+        )
+    writer = SnapshotWriter.from_env(META, schedule)
+    writer.close()
+    assert writer.path == run_dir(tmp_path, META)
+
+
+def rows(values):
+    return [
+        {"stop_val": 10 * idx, "objective_value": value}
+        for idx, value in enumerate(values)
+    ]
+
+
+def test_stopped_rows():
+    criterion = CustomSPC(patience=100, strategy="callback")
+    # The run is stopped once the objective is above its initial value
+    run_rows = rows([1.0, 0.8, 0.7, 1.2, 0.5])
+    assert stopped_rows(run_rows, criterion) == run_rows[:4]
+    run_rows = rows([1.0, 0.8, 0.7])
+    assert stopped_rows(run_rows, criterion) == run_rows
+
+
+def test_stopped_rows_diverged():
+    criterion = CustomSPC(patience=100, strategy="callback")
+    assert stopped_rows(rows([1.0, float("nan"), 0.5]), criterion) == []
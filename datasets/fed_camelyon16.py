@@ -12,9 +12,34 @@ with safe_import_context() as import_ctx:
         NUM_CLIENTS,
         Baseline,
         BaselineLoss,
-        collate_fn,
     )
 
+    from benchmark_utils.bucketing import masked_bag_collate
+
+    # Defined here as it inherits from torch
+    class MaskedBaseline(Baseline):
+        """FLamby's Camelyon16 baseline taking bags built by
+        `masked_bag_collate`.
+
+        The last feature of the instances is the log-weight added to their
+        attention logits, which masks the padding of the bags.
+        """
+
+        def __init__(self):
+            super().__init__()
+            self._log_weights = None
+            self.attention.register_forward_hook(self._mask_attention)
+
+        def _mask_attention(self, module, inputs, output):
+            return output + self._log_weights.reshape(output.shape)
+
+        def forward(self, x):
+            x, self._log_weights = x[..., :-1], x[..., -1:]
+            try:
+                return super().forward(x)
+            finally:
+                self._log_weights = None
+
 
 # All datasets must be named `Dataset` and inherit from `BaseDataset`
 class Dataset(FLambyDataset):
@@ -34,15 +59,17 @@ class Dataset(FLambyDataset):
 
         super().__init__(
             fed_dataset=FedDataset,
-            model_arch=Baseline,
+            model_arch=MaskedBaseline,
             loss=BaselineLoss,
             num_clients=NUM_CLIENTS,
             metric=metric,
             test_size=0.25,
-            collate_fn=collate_fn,
+            # Bags are only padded to the longest bag of each batch, and bags
+            # of similar lengths are evaluated together
+            collate_fn=masked_bag_collate,
+            bucket_batches=True,
             stratify_func=stratify_on_y,
             *args,
             **kwargs
         )
-        # Important for evaluation
-        self.batch_size_test = 1
+        self.batch_size_test = 16
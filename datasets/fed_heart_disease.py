@@ -38,6 +38,7 @@ class Dataset(FLambyDataset):
             num_clients=NUM_CLIENTS,
             metric=metric,
             test_size=0.25,
+            shareable=True,
             stratify_func=stratify_on_y,
             *args,
             **kwargs
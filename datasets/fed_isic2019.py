@@ -14,6 +14,9 @@ with safe_import_context() as import_ctx:
         BaselineLoss,
     )
 
+    from benchmark_utils.batch_augmentation import BatchCenterCrop
+    from benchmark_utils.image_cache import DecodedImageCache
+
 
 # All datasets must be named `Dataset` and inherit from `BaseDataset`
 class Dataset(FLambyDataset):
@@ -24,7 +27,14 @@ class Dataset(FLambyDataset):
     # List of parameters to generate the datasets. The benchmark will consider
     # the cross product for each key in the dictionary.
     # Any parameters 'param' defined here is available as `self.param`.
-    parameters = {"train": ["fl"], "test": ["val"], "seed": [42]}
+    # With `augmentation="batched"`, training images are decoded once and
+    # augmented by batch instead of by FLamby's per-image transforms
+    parameters = {
+        "train": ["fl"],
+        "test": ["val"],
+        "seed": [42],
+        "augmentation": ["flamby"],
+    }
 
     def __init__(self, *args, **kwargs):
 
@@ -42,3 +52,23 @@ class Dataset(FLambyDataset):
             *args,
             **kwargs
         )
+
+    def get_data(self):
+        if self.augmentation == "batched":
+            # Training images are decoded once and augmented by batch, the
+            # test images are FLamby's, cropped and normalized per image
+            self.collate_fn = BatchCenterCrop(size=200)
+            self.batch_augmentation = {"size": 200}
+        elif self.augmentation != "flamby":
+            raise ValueError(
+                f"Unknown augmentation {self.augmentation}, use flamby or "
+                "batched"
+            )
+        return super().get_data()
+
+    def load_fed_dataset(self, center=0, train=True, pooled=False):
+        dataset = super().load_fed_dataset(center, train=train, pooled=pooled)
+        if not train or self.batch_augmentation is None:
+            return dataset
+        # The pooled training set is not loaded, see `get_data`
+        return DecodedImageCache(dataset, f"fed_isic2019_center{center}")
@@ -0,0 +1,101 @@
+from benchopt import safe_import_context
+from benchmark_utils.template_flamby_dataset import FLambyDataset
+
+# Dimension of the features of the EfficientNet-b0 backbone of the baseline
+# and number of classes of Fed-ISIC2019
+NUM_FEATURES = 1280
+NUM_CLASSES = 8
+
+# Protect the import with `safe_import_context()`. This allows:
+# - skipping import to speed up autocompletion in CLI.
+# - getting requirements info when all dependencies are not installed.
+with safe_import_context() as import_ctx:
+    import torch
+    from torch.utils.data import ConcatDataset
+    from flamby.datasets.fed_isic2019 import FedIsic2019 as FedDataset
+    from flamby.datasets.fed_isic2019 import (
+        metric,
+        NUM_CLIENTS,
+        Baseline,
+        BaselineLoss,
+    )
+
+    from benchmark_utils.feature_store import FeatureStore
+
+    # Defined here as it inherits from torch
+    class BaselineHead(torch.nn.Linear):
+        """Classifier head of FLamby's Fed-ISIC2019 baseline."""
+
+        def __init__(self):
+            super().__init__(NUM_FEATURES, NUM_CLASSES)
+
+
+_FEATURE_STORE = None
+
+
+def get_feature_store():
+    """Return the store of the features of the baseline's frozen backbone."""
+    global _FEATURE_STORE
+    if _FEATURE_STORE is None:
+        backbone = Baseline().base_model
+        # The backbone outputs the pooled features fed to the classifier
+        backbone._fc = torch.nn.Identity()
+        _FEATURE_STORE = FeatureStore(backbone, "Fed-ISIC2019")
+    return _FEATURE_STORE
+
+
+def FedFrozenBackboneDataset(center=0, train=True, pooled=False):
+    """Features of FedIsic2019's images computed by the frozen backbone.
+
+    It mimics the signature of `FedIsic2019`. The features of each client
+    are computed once and read from the feature store afterwards. As each
+    sample is embedded once, training images are not augmented.
+    """
+    if pooled:
+        return ConcatDataset(
+            [
+                FedFrozenBackboneDataset(center=i, train=train)
+                for i in range(NUM_CLIENTS)
+            ]
+        )
+
+    def raw_dataset():
+        dataset = FedDataset(center=center, train=train)
+        dataset.augmentations = FedDataset(
+            center=center, train=False
+        ).augmentations
+        return dataset
+
+    split = "train" if train else "test"
+    return get_feature_store().load(f"client_{center}_{split}", raw_dataset)
+
+
+# All datasets must be named `Dataset` and inherit from `BaseDataset`
+class Dataset(FLambyDataset):
+
+    # Name to select the dataset in the CLI and to display the results.
+    name = "Fed-ISIC2019-FrozenBackbone"
+
+    # List of parameters to generate the datasets. The benchmark will consider
+    # the cross product for each key in the dictionary.
+    # Any parameters 'param' defined here is available as `self.param`.
+    parameters = {"train": ["fl"], "test": ["val"], "seed": [42]}
+
+    def __init__(self, *args, **kwargs):
+
+        def stratify_on_y(sample):
+            return sample[1]
+
+        # Only the classifier head of the baseline is federated, on top of
+        # the features of its frozen backbone
+        super().__init__(
+            fed_dataset=FedFrozenBackboneDataset,
+            model_arch=BaselineHead,
+            loss=BaselineLoss,
+            num_clients=NUM_CLIENTS,
+            metric=metric,
+            test_size=0.25,
+            stratify_func=stratify_on_y,
+            *args,
+            **kwargs
+        )
@@ -35,6 +35,13 @@ class Dataset(FLambyDataset):
             num_clients=NUM_CLIENTS,
             metric=metric,
             test_size=0.25,
+            shareable=True,
+            # Volumes of IXI-Tiny fit in a single patch
+            evaluator="sliding_window",
+            # The metric of IXI is given numpy arrays, as by FLamby
+            evaluator_params=dict(
+                patch_size=(48, 60, 48), overlap=0.0, to_numpy=True
+            ),
             *args,
             **kwargs
         )
@@ -35,6 +35,15 @@ class Dataset(FLambyDataset):
             num_clients=NUM_CLIENTS,
             metric=metric,
             test_size=0.25,
+            evaluator="sliding_window",
+            # The metric of KITS19 is computed on label maps and averaged
+            # over the batches, as by FLamby
+            evaluator_params=dict(
+                patch_size=(80, 160, 160),
+                overlap=0.5,
+                prediction="argmax",
+                aggregation="batch",
+            ),
             *args,
             **kwargs
         )
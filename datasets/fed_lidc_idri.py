@@ -35,6 +35,11 @@ class Dataset(FLambyDataset):
             num_clients=NUM_CLIENTS,
             metric=metric,
             test_size=0.25,
+            evaluator="sliding_window",
+            # The metric is averaged over the batches, as by FLamby
+            evaluator_params=dict(
+                patch_size=(128, 128, 128), overlap=0.25, aggregation="batch"
+            ),
             *args,
             **kwargs
         )
@@ -35,6 +35,7 @@ class Dataset(FLambyDataset):
             num_clients=NUM_CLIENTS,
             metric=metric,
             test_size=0.25,
+            shareable=True,
             *args,
             **kwargs
         )
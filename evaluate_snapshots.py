@@ -0,0 +1,104 @@
+import argparse
+import os
+from itertools import groupby
+
+import pandas as pd
+import torch
+from benchopt.benchmark import _extract_options
+
+from benchmark_utils.run_cache import ROOT, find_class, load_module
+from benchmark_utils.snapshots import BatchReplay, list_runs, stopped_rows
+
+# Evaluate the snapshots recorded by runs with FLAMBY_BENCHMARK_SNAPSHOTS set,
+# e.g. after adding a metric to the objective, without training again
+
+
+def run_group(reader):
+    return reader.meta["data_name"], reader.meta["objective_name"]
+
+
+def get_objective(data_name, objective_name):
+    """The objective of benchopt's `objective_name`, set with the data of
+    the dataset `data_name`."""
+    dataset_name, _, dataset_params = _extract_options(data_name)
+    _, Dataset = find_class("datasets", "Dataset", dataset_name)
+    dataset = Dataset.get_instance(**dataset_params)
+    _, _, objective_params = _extract_options(objective_name)
+    Objective = load_module(os.path.join(ROOT, "objective.py")).Objective
+    objective = Objective.get_instance(**objective_params)
+    objective.set_data(**dataset.get_data())
+    return objective
+
+
+def get_stopping_criterion(solver_name):
+    """The stopping criterion of benchopt's `solver_name`."""
+    name, _, _ = _extract_options(solver_name)
+    _, Solver = find_class("solvers", "Solver", name)
+    return Solver.stopping_criterion
+
+
+def evaluate_run(objective, reader, models):
+    """Rows of benchopt's results for the snapshots of `reader`, the models
+    of each stream being loaded in `models`."""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    rows = []
+    for round_idx, info, state_dicts in reader:
+        for stream, state_dict in state_dicts.items():
+            if stream not in models:
+                models[stream] = objective.model_arch().to(device)
+            models[stream].load_state_dict(state_dict)
+        result = {
+            "model": models["model"],
+            "replicate_models": {
+                int(stream[len("seed_"):]): models[stream]
+                for stream in state_dicts
+                if stream != "model"
+            },
+            "solver_stats": info["solver_stats"],
+        }
+        rows.append(
+            dict(
+                **reader.meta,
+                stop_val=round_idx,
+                time=info["time"],
+                **objective(result),
+            )
+        )
+    return rows
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Evaluate the snapshots of runs in bulk")   # noqa: E501
+    parser.add_argument("--snapshots", type=str, help="Folder of the snapshot store.", default=os.environ.get("FLAMBY_BENCHMARK_SNAPSHOTS", os.path.join(ROOT, "outputs", "snapshots")))   # noqa: E501
+    parser.add_argument("--output", type=str, help="Name of the results file, saved in outputs/<output>.parquet.", required=True)   # noqa: E501
+    parser.add_argument("--replay-memory", type=float, help="Memory in GB of the batches replayed for all snapshots.", default=4.0)   # noqa: E501
+
+    args = parser.parse_args()
+
+    readers = sorted(list_runs(args.snapshots), key=run_group)
+    print(f"{len(readers)} runs, {sum(map(len, readers))} snapshots")
+    rows = []
+    # The objective, the models and the batches are shared by all the runs
+    # on the same data
+    for (data_name, objective_name), group in groupby(readers, run_group):
+        objective = get_objective(data_name, objective_name)
+        objective.test_loader = BatchReplay(
+            objective.test_loader, int(args.replay_memory * 1e9)
+        )
+        models = {}
+        for reader in group:
+            solver_name = reader.meta["solver_name"]
+            print(f"Evaluating {len(reader)} snapshots of {solver_name} on {data_name}")   # noqa: E501
+            # Runs recording snapshots are trained up to their budget, the
+            # evaluations after which the solver would have stopped are cut
+            run_rows = stopped_rows(
+                evaluate_run(objective, reader, models),
+                get_stopping_criterion(solver_name),
+            )
+            rows.extend(run_rows)
+
+    output_path = os.path.join(ROOT, "outputs", f"{args.output}.parquet")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    pd.DataFrame(rows).to_parquet(output_path)
+    print(f"Saved the evaluations of {len(rows)} snapshots in {output_path}")
@@ -27,14 +27,17 @@ if [ -z "$4" ]
     TIMEOUT=$4
 fi
 
-# Perform validation runs on all parameters defined in common.py
-benchopt run --max-runs $MAX_RUNS -s FederatedAveraging -d $dataset --output fedavg --timeout $TIMEOUT
-benchopt run --max-runs $MAX_RUNS -s Cyclic -d $dataset --output cyclic --timeout $TIMEOUT
-benchopt run --max-runs $MAX_RUNS -s FedProx -d $dataset --output fedprox --timeout $TIMEOUT
-benchopt run --max-runs $MAX_RUNS -s Scaffold -d $dataset --output scaffold --timeout $TIMEOUT
-benchopt run --max-runs $MAX_RUNS -s FedAdam -d $dataset --output fedadam--timeout $TIMEOUT
-benchopt run --max-runs $MAX_RUNS -s FedAdagrad -d $dataset --output fedadagrad --timeout $TIMEOUT
-benchopt run --max-runs $MAX_RUNS -s FedYogi -d $dataset --output fedyogi --timeout $TIMEOUT
+# Perform validation runs on all parameters defined in common.py, reusing the
+# curves of the configurations already run with the same code
+python run_cached.py --max-runs $MAX_RUNS -s FederatedAveraging -d $dataset --output fedavg --timeout $TIMEOUT
+python run_cached.py --max-runs $MAX_RUNS -s Cyclic -d $dataset --output cyclic --timeout $TIMEOUT
+python run_cached.py --max-runs $MAX_RUNS -s FedProx -d $dataset --output fedprox --timeout $TIMEOUT
+python run_cached.py --max-runs $MAX_RUNS -s Scaffold -d $dataset --output scaffold --timeout $TIMEOUT
+python run_cached.py --max-runs $MAX_RUNS -s FedAdam -d $dataset --output fedadam --timeout $TIMEOUT
+python run_cached.py --max-runs $MAX_RUNS -s FedAdagrad -d $dataset --output fedadagrad --timeout $TIMEOUT
+python run_cached.py --max-runs $MAX_RUNS -s FedYogi -d $dataset --output fedyogi --timeout $TIMEOUT
+# Centralised training on the pooled data, as a reference
+python run_cached.py --max-runs $MAX_RUNS -s Centralised -d $dataset --output centralised --timeout $TIMEOUT
 
 # Extract best hyperparameters for each strategy using final objective_value
 python write_config_from_validation_results.py -o . -d $dataset
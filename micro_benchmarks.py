@@ -0,0 +1,249 @@
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import TensorDataset
+
+from benchmark_utils.template_flamby_dataset import FLambyDataset
+
+# Micro-benchmarks of the benchmark's own hot paths, on an in-memory synthetic
+# federated dataset so that no download is needed
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+NUM_CLIENTS = 3
+NUM_SAMPLES = 500
+NUM_FEATURES = 10
+
+
+def synthetic_fed_dataset(center=0, train=True, pooled=False):
+    # Mimics the signature of FLamby's datasets
+    if pooled:
+        return torch.utils.data.ConcatDataset(
+            [synthetic_fed_dataset(i, train) for i in range(NUM_CLIENTS)]
+        )
+    g = torch.Generator().manual_seed(2 * center + int(train))
+    X = torch.randn(NUM_SAMPLES, NUM_FEATURES, generator=g)
+    y = (X[:, :1] > 0).float()
+    return TensorDataset(X, y)
+
+
+class SyntheticBaseline(torch.nn.Linear):
+    def __init__(self):
+        super().__init__(NUM_FEATURES, 1)
+
+
+def accuracy(y_true, y_pred):
+    return ((y_pred > 0) == y_true).mean()
+
+
+def load_module(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def instantiate(cls, parameters, *args, **kwargs):
+    """Instantiate a benchopt class with the given parameters."""
+    obj = cls(*args, **kwargs, **parameters)
+    # Depending on benchopt's version parameters are set by the constructor
+    # or when the object is created by benchopt
+    for k, v in parameters.items():
+        setattr(obj, k, v)
+    return obj
+
+
+def default_parameters(cls, **overrides):
+    parameters = {k: v[0] for k, v in cls.parameters.items()}
+    parameters.update(overrides)
+    return parameters
+
+
+def make_dataset():
+    return instantiate(
+        FLambyDataset,
+        {"train": "fl", "test": "val"},
+        fed_dataset=synthetic_fed_dataset,
+        model_arch=SyntheticBaseline,
+        loss=torch.nn.BCEWithLogitsLoss,
+        num_clients=NUM_CLIENTS,
+        metric=accuracy,
+        stratify_func=lambda sample: sample[1][0],
+    )
+
+
+def make_objective():
+    Objective = load_module(os.path.join(ROOT, "objective.py")).Objective
+    objective = instantiate(Objective, default_parameters(Objective))
+    objective.set_data(**make_dataset().get_data())
+    return objective
+
+
+def make_solver(path, objective, num_updates):
+    Solver = load_module(path).Solver
+    solver = instantiate(
+        Solver, default_parameters(Solver, num_updates=num_updates)
+    )
+    solver.set_objective(**objective.get_objective())
+    return solver
+
+
+def write_results(folder, n_files=20, n_solvers=50, n_points=20):
+    rng = np.random.default_rng(0)
+    for i in range(n_files):
+        solver_names = [
+            f"FedProx[batch_size=32,learning_rate={lr},mu={mu}]"
+            for lr, mu in rng.random((n_solvers, 2))
+        ]
+        df = pd.DataFrame(
+            {
+                "solver_name": np.repeat(solver_names, n_points),
+                "data_name": "Fed-TCGA-BRCA[seed=42,test=val,train=fl]",
+                "time": np.tile(np.arange(n_points, dtype=float), n_solvers),
+                "objective_value": rng.random(n_solvers * n_points),
+                "objective_average_val_metric": rng.random(
+                    n_solvers * n_points
+                ),
+            }
+        )
+        df.to_parquet(os.path.join(folder, f"results_{i}.parquet"))
+
+
+def setup_train_test_split():
+    # The clients' datasets are loaded without being split
+    dataset = make_dataset()
+    dataset.test = "test"
+    dataset.get_data()
+    return (dataset,)
+
+
+def get_cases(num_updates):
+    """Return a dict mapping the name of each case to (setup, func).
+
+    `setup` returns the arguments of `func`, it is not timed.
+    """
+    cases = {
+        "dataset_get_data": (
+            lambda: (make_dataset(),),
+            lambda d: d.get_data(),
+        ),
+        "dataset_train_test_split": (
+            setup_train_test_split,
+            lambda d: d.train_test_split_datasets(),
+        ),
+    }
+
+    objective = make_objective()
+    model = SyntheticBaseline()
+    cases["objective_evaluate_result"] = (
+        lambda: (),
+        lambda: objective.evaluate_result(model=model),
+    )
+    cases["objective_compute_avg_loss_on_client"] = (
+        lambda: (),
+        lambda: objective.compute_avg_loss_on_client(
+            model, objective.train_datasets[0]
+        ),
+    )
+
+    for path in sorted(glob(os.path.join(ROOT, "solvers", "*.py"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+
+        def setup(path=path):
+            solver = make_solver(path, objective, num_updates)
+            return solver, solver.build_strategy()
+
+        cases[f"perform_round_{name}"] = (
+            setup,
+            lambda solver, strat: solver.perform_round(strat),
+        )
+
+    extraction = load_module(
+        os.path.join(ROOT, "write_config_from_validation_results.py")
+    )
+    results_folder = tempfile.mkdtemp()
+    write_results(results_folder)
+    data_name = "Fed-TCGA-BRCA[seed=42,test=val,train=fl]"
+
+    def extract_results():
+        dataset = extraction.ds.dataset(results_folder, format="parquet")
+        final_values = extraction.read_final_values(dataset, data_name)
+        return extraction.add_params_columns(final_values)
+
+    cases["results_extraction"] = (lambda: (), extract_results)
+    return cases
+
+
+def measure(setup, func, rounds):
+    """Time `rounds` calls of `func`, after a warmup call."""
+    timings = []
+    for i in range(rounds + 1):
+        args = setup()
+        t0 = time.perf_counter()
+        func(*args)
+        if i > 0:
+            timings.append(time.perf_counter() - t0)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "rounds": rounds,
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Time the hot paths of the benchmark and compare them to a baseline")   # noqa: E501
+    parser.add_argument("--baseline", "-b", type=str, help="Path to the baseline timings.", default=os.path.join(ROOT, "outputs", "micro_benchmarks_baseline.json"))   # noqa: E501
+    parser.add_argument("--save-baseline", action="store_true", help="Save the timings as the new baseline.")   # noqa: E501
+    parser.add_argument("--threshold", "-t", type=float, help="Relative slowdown of the median flagged as a regression.", default=0.2)   # noqa: E501
+    parser.add_argument("--rounds", "-r", type=int, help="Number of timed calls per case.", default=5)   # noqa: E501
+    parser.add_argument("--num-updates", type=int, help="Local updates per client in perform_round cases.", default=10)   # noqa: E501
+    parser.add_argument("-k", type=str, help="Only run cases whose name contains this string.", default="")   # noqa: E501
+
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    results = {}
+    for name, (setup, func) in get_cases(args.num_updates).items():
+        if args.k not in name:
+            continue
+        results[name] = measure(setup, func, args.rounds)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'case':<45}{'min (ms)':>12}{'median (ms)':>14}{'vs baseline':>14}")   # noqa: E501
+    for name, stats in results.items():
+        ratio = ""
+        if name in baseline:
+            change = stats["median"] / baseline[name]["median"] - 1
+            ratio = f"{change:+.1%}"
+            if change > args.threshold:
+                regressions.append(name)
+                ratio += " !"
+        print(f"{name:<45}{stats['min'] * 1e3:>12.2f}{stats['median'] * 1e3:>14.2f}{ratio:>14}")   # noqa: E501
+
+    if args.save_baseline:
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"Baseline saved in {args.baseline}")
+
+    if len(regressions) > 0:
+        print(f"Regressions beyond {args.threshold:.0%}: {regressions}")
+        sys.exit(1)
@@ -1,4 +1,5 @@
 import re
+from contextlib import contextmanager
 from itertools import zip_longest
 
 from benchopt import BaseObjective, safe_import_context
@@ -9,16 +10,22 @@ from benchopt import BaseObjective, safe_import_context
 with safe_import_context() as import_ctx:
     import numpy as np
     import torch
+    import copy
     import gc
     from flamby.benchmarks.benchmark_utils import set_seed
-    from flamby.datasets.fed_kits19 import FedKits19, evaluate_dice_on_tests
-    from flamby.datasets.fed_lidc_idri import (
-        FedLidcIdri,
-        evaluate_dice_on_tests_by_chunks,
-    )
-    from flamby.utils import evaluate_model_on_tests
     from torch.utils.data import DataLoader as dl
 
+    from benchmark_utils.evaluators import get_evaluator, get_loss_evaluator
+    from benchmark_utils.instrumentation import (
+        MemoryTracker,
+        PhaseTimer,
+        tracked,
+    )
+
+# The modules of the optional features (bucketing, compilation, compute
+# counting, metrics streaming and profiling) are imported in the code paths
+# using them, like the evaluators of `benchmark_utils.evaluators`.
+
 
 # The benchmark objective must be named `Objective` and
 # inherit from `BaseObjective` for `benchopt` to work properly.
@@ -55,6 +62,8 @@ class Objective(BaseObjective):
 
     parameters = {
         "seed": [42],
+        "torch_compile": [False],
+        "n_replicates": [1],
     }
 
     # Minimal version of benchopt required to run this benchmark.
@@ -73,6 +82,10 @@ class Objective(BaseObjective):
         num_clients,
         batch_size_test,
         collate_fn,
+        evaluator="model_on_tests",
+        evaluator_params=None,
+        bucket_batches=False,
+        batch_augmentation=None,
     ):
         # The keyword arguments of this function are the keys of the dictionary
         # returned by `Dataset.get_data`. This defines the benchmark's
@@ -88,59 +101,238 @@ class Objective(BaseObjective):
             "num_clients",
             "batch_size_test",
             "collate_fn",
+            "evaluator",
+            "evaluator_params",
+            "bucket_batches",
+            "batch_augmentation",
         ]
         for att in att_names:
             setattr(self, att, eval(att))
 
-        # We init the model
-        set_seed(self.seed)
-        self.model = self.model_arch()
-        # Small boilerplate for datasets that require custom evaluation
-        if hasattr(train_datasets[0], "dataset"):
-            check_dataset = train_datasets[0].dataset
-        else:
-            check_dataset = train_datasets[0]
-        if isinstance(check_dataset, FedLidcIdri):
+        # We init the model, and one model per seed of the replicates which
+        # are trained side by side on the same data, see `aggregate_replicates`
+        self.models = {}
+        for seed in range(self.seed, self.seed + self.n_replicates):
+            set_seed(seed)
+            self.models[seed] = self.model_arch()
+        self.model = self.models[self.seed]
+        # Datasets that require custom evaluation declare their evaluator,
+        # which is imported lazily
+        self.eval = get_evaluator(
+            self.evaluator, **(self.evaluator_params or {})
+        )
+        # Evaluators that do not run the model on whole batches, e.g. the
+        # sliding window, compute the losses in the same way
+        self.eval_loss = get_loss_evaluator(
+            self.evaluator, **(self.evaluator_params or {})
+        )
 
-            def evaluate_func(m, test_dls, metric):
-                return evaluate_dice_on_tests_by_chunks(m, test_dls)
+        from benchmark_utils.compute_accounting import count_compute
+        from benchmark_utils.profiling import TorchProfiler
+
+        self.profiler = TorchProfiler()
+        self._batch_samplers = {}
+        # The compute of the evaluations can be counted, see `ComputeCounter`
+        self.eval_compute_counter = None
+        if count_compute():
+            from benchmark_utils.compute_accounting import (
+                ComputeCounter,
+                FlopsEstimator,
+            )
 
-            self.eval = evaluate_func
+            self.eval_compute_counter = ComputeCounter(prefix="eval_compute")
+            self.eval_flops_estimator = FlopsEstimator(self.model)
+
+        # Compiled and eager models are checked against each other on the
+        # forward and backward of the first test batch, the models being
+        # compiled only if they agree. This is done on a copy of the model as
+        # the strategies copy the model they are given, see `compile_model`,
+        # on the device where FLamby trains the clients' models. It also
+        # fills the cache of compiled artifacts for the solver.
+        self.compile_models = self.torch_compile
+        if self.torch_compile and len(self.test_datasets) > 0:
+            from benchmark_utils.compilation import compile_model
+
+            X, y = next(iter(self.test_loader(self.test_datasets[0])))
+            device = torch.device(
+                "cuda:0" if torch.cuda.is_available() else "cpu"
+            )
+            self.compile_models = compile_model(
+                copy.deepcopy(self.model).to(device),
+                sample=X,
+                target=y,
+                loss=self.loss,
+            )
 
-        elif isinstance(check_dataset, FedKits19):
+    def test_loader(self, dataset):
+        """Dataloader evaluating the model on `dataset`."""
+        if not self.bucket_batches:
+            return dl(
+                dataset,
+                self.batch_size_test,
+                shuffle=False,
+                collate_fn=self.collate_fn,
+            )
+        # Samplers are built once per dataset as they need the length of
+        # all samples
+        if id(dataset) not in self._batch_samplers:
+            from benchmark_utils.bucketing import (
+                BucketBatchSampler,
+                bag_lengths,
+            )
 
-            def evaluate_func(m, test_dls, metric):
-                return evaluate_dice_on_tests(m, test_dls, metric)
 
-            self.eval = evaluate_func
-        else:
-            self.eval = evaluate_model_on_tests
+            self._batch_samplers[id(dataset)] = BucketBatchSampler(
+                bag_lengths(dataset), self.batch_size_test
+            )
+        return dl(
+            dataset,
+            batch_sampler=self._batch_samplers[id(dataset)],
+            collate_fn=self.collate_fn,
+        )
 
     def compute_avg_loss_on_client(self, model, dataset):
+        if self.eval_loss is not None:
+            return self.eval_loss(model, self.test_loader(dataset), self.loss)
         average_loss = 0.0
         count_batch = 0
-        for X, y in dl(dataset, self.batch_size_test, shuffle=False, collate_fn=self.collate_fn):
+        for X, y in self.test_loader(dataset):
             if torch.cuda.is_available():
                 X = X.cuda()
                 y = y.cuda()
-            average_loss += self.loss(model(X), y).item()
-            count_batch += 1
+            # Batches of buckets have different sizes, they are weighted so
+            # that the loss is the one of the unbatched evaluation
+            weight = len(y) if self.bucket_batches else 1
+            average_loss += weight * self.loss(model(X), y).item()
+            count_batch += weight
         del X, y
         average_loss /= float(count_batch)
         return average_loss
 
-    def evaluate_result(self, model):
+    def evaluate_result(
+        self, model, solver_stats=None, replicate_models=None
+    ):
         # This method can return many metrics in a dictionary. One of these
         # metrics needs to be `value` for convergence detection purposes.
-        test_dls = [
-            dl(
-                test_d,
-                self.batch_size_test,
-                shuffle=False,
-                collate_fn=self.collate_fn,
-            )
-            for test_d in self.test_datasets  # noqa: E501
-        ]
+        # Runs stopped by the solver's `DivergenceGuard` are not evaluated,
+        # benchopt marks them as diverged because of the NaN value
+        if (solver_stats or {}).get("diverged", 0):
+            return {"value": np.nan, **solver_stats}
+        # The profiling of one evaluation can be enabled, see `TorchProfiler`
+        n_rounds = (solver_stats or {}).get("n_rounds", 0)
+        if self.profiler.should_profile_evaluation(n_rounds):
+            with self.profiler.capture(f"evaluation_after_{n_rounds}_rounds"):
+                res = self.evaluate_model(
+                    model, solver_stats, replicate_models
+                )
+        else:
+            res = self.evaluate_model(model, solver_stats, replicate_models)
+        # Results are streamed as they come, see `MetricsStream`
+        from benchmark_utils.metrics_stream import get_stream
+
+        stream = get_stream()
+        if stream is not None:
+            stream.emit("evaluation", res)
+        return res
+
+    @staticmethod
+    def aggregate_replicates(results):
+        """Aggregate the results of the replicates, indexed by their seed.
+
+        Each metric is reported for each seed as `seed_<seed>_<metric>`, and
+        its mean and standard deviation across seeds as `<metric>` and
+        `<metric>_std`.
+        """
+        keys = sorted(set().union(*results.values()))
+        res = {}
+        for key in keys:
+            values = [r.get(key, np.nan) for r in results.values()]
+            for seed, value in zip(results, values):
+                res[f"seed_{seed}_{key}"] = value
+            res[key] = float(np.nanmean(values))
+            res[key + "_std"] = float(np.nanstd(values))
+        return res
+
+    def evaluate_model(self, model, solver_stats=None, replicate_models=None):
+        # Each stage of the evaluation is timed and its memory tracked, these
+        # are reported with the solver's ones as extra columns of the results
+        timer = PhaseTimer(prefix="eval_time")
+        memory = MemoryTracker(prefix="eval_mem")
+        with self.counted_evaluation(model, solver_stats, replicate_models):
+            res = self.compute_metrics(model, timer, memory)
+            if replicate_models:
+                results = {self.seed: res}
+                for seed, replicate_model in replicate_models.items():
+                    results[seed] = self.compute_metrics(
+                        replicate_model, timer, memory
+                    )
+                res = self.aggregate_replicates(results)
+
+        if self.is_validation:
+            test_name = "val"
+        else:
+            test_name = "test"
+
+        res.update(timer.to_dict())
+        res.update(memory.to_dict())
+        if self.eval_compute_counter is not None:
+            res.update(self.eval_compute_counter.to_dict())
+        if solver_stats is not None:
+            res.update(solver_stats)
+
+        # Important for display purposes, this way averages are displayed first
+        sorted_res = {key: value for key, value in sorted(res.items())}
+
+        # Very important because of check_convergence that operates on val
+        # if is validation or on train
+        if self.is_validation:
+            objective_value = res["average_" + test_name + "_loss"]
+        else:
+            objective_value = res["average_train_loss"]
+
+        keys_list = list(sorted_res.keys())
+
+        # We add the value that is used in convergence_check in the first
+        # place so that it appears by default and the rest of the values are
+        # sorted in the clickable list
+        new_res = {}
+        new_res["value"] = objective_value
+        for k in keys_list:
+            new_res[k] = sorted_res.pop(k)
+
+        gc.collect()
+        torch.cuda.empty_cache()
+        return new_res
+
+    @contextmanager
+    def counted_evaluation(self, model, solver_stats, replicate_models):
+        """Count the compute of the forward passes of the enclosed evaluation
+        if `FLAMBY_BENCHMARK_COUNT_COMPUTE` is set."""
+        if self.eval_compute_counter is None:
+            yield
+            return
+        # Counts are cumulative over the evaluations of a run
+        if (solver_stats or {}).get("n_rounds", 0) == 0:
+            self.eval_compute_counter.reset()
+        from benchmark_utils.compute_accounting import counted_forward
+
+        models = [model, *(replicate_models or {}).values()]
+        with counted_forward(
+            models, self.eval_compute_counter, self.eval_flops_estimator
+        ):
+            yield
+        self.eval_compute_counter.round_end()
+
+    def compute_metrics(self, model, timer, memory):
+        """Compute the metrics and losses of `model` on each client."""
+        if self.compile_models:
+            from benchmark_utils.compilation import compile_model
+
+            compile_model(model)
+        with tracked("loaders", timer, memory):
+            test_dls = [
+                self.test_loader(test_d) for test_d in self.test_datasets
+            ]
 
         def robust_metric(y_true, y_pred):
             try:
@@ -154,23 +346,18 @@ class Objective(BaseObjective):
             test_name = "test"
 
         # Evaluation on the different test sets
-        res = self.eval(model, test_dls, robust_metric)
+        with tracked("client_metrics", timer, memory):
+            res = self.eval(model, test_dls, robust_metric)
 
         # Evaluation on the pooled test set
-        pooled_res_value = self.eval(
-            model,
-            [
-                dl(
-                    self.pooled_test_dataset,
-                    self.batch_size_test,
-                    shuffle=False,
-                    collate_fn=self.collate_fn,
-                )
-            ],
-            robust_metric,
-        )[
-            "client_test_0"
-        ]  # noqa: E501
+        with tracked("pooled_metric", timer, memory):
+            pooled_res_value = self.eval(
+                model,
+                [self.test_loader(self.pooled_test_dataset)],
+                robust_metric,
+            )[
+                "client_test_0"
+            ]  # noqa: E501
 
         # We do not take into account clients where metric is not defined
         # nd use the average metric across clients as the default benchopt
@@ -201,7 +388,10 @@ class Objective(BaseObjective):
             zip_longest(self.train_datasets, self.test_datasets)
         ):
             if train_d is not None:
-                cl_train_loss = self.compute_avg_loss_on_client(model, train_d)
+                with tracked("train_losses", timer, memory):
+                    cl_train_loss = self.compute_avg_loss_on_client(
+                        model, train_d
+                    )
                 res[f"train_loss_client_{idx}"] = cl_train_loss
                 average_train_loss += cl_train_loss
 
@@ -211,15 +401,19 @@ class Objective(BaseObjective):
                 continue
 
             if test_d is not None:
-                cl_test_loss = self.compute_avg_loss_on_client(model, test_d)
+                with tracked(test_name + "_losses", timer, memory):
+                    cl_test_loss = self.compute_avg_loss_on_client(
+                        model, test_d
+                    )
                 res[test_name + f"_loss_client_{idx}"] = cl_test_loss
                 average_test_loss += cl_test_loss
 
         # We compute average loss on test if it doesn't exist already
         if len(self.test_datasets) > 1:
-            pooled_test_loss = self.compute_avg_loss_on_client(
-                model, self.pooled_test_dataset
-            )  # noqa: E501
+            with tracked("pooled_loss", timer, memory):
+                pooled_test_loss = self.compute_avg_loss_on_client(
+                    model, self.pooled_test_dataset
+                )  # noqa: E501
         else:
             pooled_test_loss = res[test_name + "_loss_client_0"]
 
@@ -232,30 +426,7 @@ class Objective(BaseObjective):
         average_test_loss /= float(num_test_sets - nb_clients_nan)
         res["average_train_loss"] = average_train_loss
         res["average_" + test_name + "_loss"] = average_test_loss
-
-        # Important for display purposes, this way averages are displayed first
-        sorted_res = {key: value for key, value in sorted(res.items())}
-
-        # Very important because of check_convergence that operates on val
-        # if is validation or on train
-        if self.is_validation:
-            objective_value = average_test_loss
-        else:
-            objective_value = average_train_loss
-
-        keys_list = list(sorted_res.keys())
-
-        # We add the value that is used in convergence_check in the first
-        # place so that it appears by default and the rest of the values are
-        # sorted in the clickable list
-        new_res = {}
-        new_res["value"] = objective_value
-        for k in keys_list:
-            new_res[k] = sorted_res.pop(k)
-
-        gc.collect()
-        torch.cuda.empty_cache()
-        return new_res
+        return res
 
     def get_one_result(self):
         # Return one solution. The return value should be an object compatible
@@ -275,4 +446,12 @@ class Objective(BaseObjective):
             is_validation=self.is_validation,
             model=self.model,
             loss=self.loss,
+            torch_compile=self.compile_models,
+            batch_augmentation=self.batch_augmentation,
+            seed=self.seed,
+            replicate_models={
+                seed: model
+                for seed, model in self.models.items()
+                if seed != self.seed
+            },
         )
@@ -0,0 +1,18 @@
+import argparse
+
+from benchmark_utils.shared_datasets import purge_shared_data, shared_data_dir
+
+# Remove the datasets written to the shared data folder by runs with
+# FLAMBY_BENCHMARK_SHARED_DATA=1, e.g. to free /dev/shm after a campaign
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Remove the datasets shared across concurrent runs")   # noqa: E501
+    parser.add_argument("--prefix", type=str, help="Only remove the datasets whose names start with this string, e.g. flamby.datasets.fed_ixi.", default="")   # noqa: E501
+
+    args = parser.parse_args()
+
+    removed = purge_shared_data(args.prefix)
+    for name in removed:
+        print(f"Removed {name}")
+    print(f"{len(removed)} datasets removed from {shared_data_dir()}")
@@ -0,0 +1,110 @@
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import uuid
+
+import pandas as pd
+
+from benchmark_utils.run_cache import (
+    ROOT,
+    RunCache,
+    benchmark_code_hash,
+    find_class,
+    grid_names,
+    load_module,
+)
+
+# Run a grid of a solver with benchopt, skipping the configurations whose
+# curves are already in the run cache. Each configuration is run by its own
+# benchopt call and cached as soon as it completes, so that an interrupted
+# grid is resumed where it stopped
+
+
+def select_rows(df, data_name, objective_name, solver_name):
+    mask = (df["data_name"] == data_name) & (df["solver_name"] == solver_name)
+    if "objective_name" in df.columns:
+        mask &= df["objective_name"] == objective_name
+    return df[mask]
+
+
+def read_benchopt_output(name):
+    """Read and remove the results saved by `benchopt run --output <name>`.
+
+    benchopt only appends a suffix to the file name if the file exists, so
+    `name` has to be unique, see `uncached_output_name`.
+    """
+    path = os.path.join(ROOT, "outputs", f"{name}.parquet")
+    if not os.path.exists(path):
+        return None
+    df = pd.read_parquet(path)
+    os.remove(path)
+    return df
+
+
+def uncached_output_name(output):
+    """Name of the results of one benchopt call, which no other call,
+    concurrent or not, writes to."""
+    return f"{output}_uncached_{uuid.uuid4().hex}"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run the grid of a solver on a dataset with benchopt, reusing cached curves")   # noqa: E501
+    parser.add_argument("--dataset", "-d", type=str, help="The FLamby dataset on which to run.", default="Fed-TCGA-BRCA")   # noqa: E501
+    parser.add_argument("--solver", "-s", type=str, help="Name of the solver whose grid is run.", required=True)   # noqa: E501
+    parser.add_argument("--max-runs", type=int, help="Passed to benchopt run.", default=12)   # noqa: E501
+    parser.add_argument("--timeout", type=str, help="Passed to benchopt run.", default="72h")   # noqa: E501
+    parser.add_argument("--output", type=str, help="Name of the results file, saved in outputs/<output>.parquet.", required=True)   # noqa: E501
+    parser.add_argument("--cache-dir", type=str, help="Folder of the run cache.", default=os.path.join(ROOT, "outputs", "run_cache"))   # noqa: E501
+
+    args = parser.parse_args()
+
+    dataset_path, Dataset = find_class("datasets", "Dataset", args.dataset)
+    solver_path, Solver = find_class("solvers", "Solver", args.solver)
+    Objective = load_module(os.path.join(ROOT, "objective.py")).Objective
+    code_hash = benchmark_code_hash(dataset_path, solver_path)
+
+    cache = RunCache(args.cache_dir)
+    keys = {
+        config: cache.key(*config, args.max_runs, args.timeout, code_hash)
+        for config in itertools.product(
+            grid_names(Dataset), grid_names(Objective), grid_names(Solver)
+        )
+    }
+    missing = {config for config, key in keys.items() if key not in cache}
+    print(f"{len(keys) - len(missing)} configurations cached, {len(missing)} to run")   # noqa: E501
+
+    for data_name, objective_name, solver_name in sorted(missing):
+        tmp_output = uncached_output_name(args.output)
+        cmd = [
+            "benchopt", "run", ".",
+            "-d", data_name,
+            "-o", objective_name,
+            "-s", solver_name,
+            "--max-runs", str(args.max_runs),
+            "--timeout", args.timeout,
+            "--output", tmp_output,
+            "--no-plot",
+        ]
+        returncode = subprocess.run(cmd, cwd=ROOT).returncode
+        df = read_benchopt_output(tmp_output)
+        if returncode != 0:
+            # Results of failed runs may be partial, they are not cached
+            print(f"benchopt failed with code {returncode} on {solver_name}")   # noqa: E501
+            continue
+        config = (data_name, objective_name, solver_name)
+        rows = select_rows(df, *config) if df is not None else []
+        if len(rows) > 0:
+            cache.store(keys[config], rows)
+
+    failed = [config for config, key in keys.items() if key not in cache]
+    results = [cache.load(key) for key in keys.values() if key in cache]
+    if len(results) > 0:
+        output_path = os.path.join(ROOT, "outputs", f"{args.output}.parquet")
+        pd.concat(results, ignore_index=True).to_parquet(output_path)
+        print(f"Saved the curves of {len(results)} configurations in {output_path}")   # noqa: E501
+    if len(failed) > 0:
+        print(f"No results for {failed}")
+        sys.exit(1)
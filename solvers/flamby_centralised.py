@@ -0,0 +1,62 @@
+from benchopt import safe_import_context
+
+from benchmark_utils.common import lrs
+from benchmark_utils.template_flamby_strategy import FLambySolver
+
+# Protect the import with `safe_import_context()`. This allows:
+# - skipping import to speed up autocompletion in CLI.
+# - getting requirements info when all dependencies are not installed.
+with safe_import_context() as import_ctx:
+    import torch
+    from torch.utils.data import DataLoader as dl
+
+    from benchmark_utils.centralised import Centralised, PooledDataset
+
+
+# The benchmark solvers must be named `Solver` and
+# inherit from `BaseSolver` for `benchopt` to work properly.
+class Solver(FLambySolver):
+    """Train a single model on the pooled data of all clients.
+
+    This is the centralised reference of the federated strategies: the
+    training sets of the clients are pooled, indexed contiguously, and each
+    epoch goes through a new permutation of them. A round is `num_updates`
+    optimizer steps, with no exchange nor aggregation of parameters. The
+    model is evaluated on the clients' test sets as for the strategies.
+
+    Parameters
+    ----------
+    FLambySolver : FlambySolver
+        We define a common interface for all strategies implemented
+        in FLamby.
+
+    """
+
+    # Name to select the solver in the CLI and to display the results.
+    name = "Centralised"
+
+    # List of parameters for the solver. The benchmark will consider
+    # the cross product for each key in the dictionary.
+    # All parameters 'p' defined here are available as 'self.p'.
+    parameters = {
+        "learning_rate": lrs,
+        "batch_size": [32],
+        "num_updates": [100],
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(strategy=Centralised, *args, **kwargs)
+
+    def set_objective(self, *args, **kwargs):
+        super().set_objective(*args, **kwargs)
+        # Datasets already pooled, with `train=pooled`, are flattened as is
+        self.train_datasets = [PooledDataset(self.train_datasets)]
+
+    def train_loader(self, dataset, client_idx, seed):
+        return dl(
+            dataset,
+            self.batch_size,
+            shuffle=True,
+            generator=torch.Generator().manual_seed(seed),
+            collate_fn=self.train_collate_fn(client_idx, seed),
+        )
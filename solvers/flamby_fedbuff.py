@@ -0,0 +1,70 @@
+from benchopt import safe_import_context
+
+from benchmark_utils.common import lrs
+from benchmark_utils.template_flamby_strategy import FLambySolver
+
+# Protect the import with `safe_import_context()`. This allows:
+# - skipping import to speed up autocompletion in CLI.
+# - getting requirements info when all dependencies are not installed.
+with safe_import_context() as import_ctx:
+    from benchmark_utils.fedbuff import FedBuff
+
+
+# The benchmark solvers must be named `Solver` and
+# inherit from `BaseSolver` for `benchopt` to work properly.
+class Solver(FLambySolver):
+    """Implement the FedBuff strategy.
+
+    This solver uses the buffered asynchronous strategy of
+    `benchmark_utils.fedbuff`, in which clients have simulated latencies
+    and the server aggregates as soon as `buffer_size` updates arrived.
+    Mean latencies are spread geometrically from 1 for the first client to
+    `latency_skew` for the last one. Each point of the curve is one server
+    aggregation, the simulated time is reported as
+    `fedbuff_simulated_time`.
+
+    Parameters
+    ----------
+    FLambySolver : FlambySolver
+        We define a common interface for all strategies implemented
+        in FLamby.
+
+    References
+    ----------
+    - https://arxiv.org/abs/2106.06639
+
+    """
+
+    # Name to select the solver in the CLI and to display the results.
+    name = "FedBuff"
+
+    # List of parameters for the solver. The benchmark will consider
+    # the cross product for each key in the dictionary.
+    # All parameters 'p' defined here are available as 'self.p'.
+    parameters = {
+        "learning_rate": lrs,
+        "server_learning_rate": [1.0],
+        "batch_size": [32],
+        "num_updates": [100],
+        "buffer_size": [2],
+        "latency_skew": [4.0],
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(strategy=FedBuff, *args, **kwargs)
+
+    @staticmethod
+    def global_model(strat):
+        return strat.server_model
+
+    def set_strategy_specific_args(self):
+        num_clients = len(self.train_datasets)
+        self.strategy_specific_args = {
+            "buffer_size": self.buffer_size,
+            "server_learning_rate": self.server_learning_rate,
+            "latency_means": [
+                self.latency_skew ** (k / max(num_clients - 1, 1))
+                for k in range(num_clients)
+            ],
+            "seed": self.strategy_seed,
+        }
@@ -2,11 +2,95 @@ import pandas as pd
 from glob import glob
 import argparse
 import os
-import re
-import numpy as np
+import pyarrow.dataset as ds
 import yaml
 from datetime import datetime
 
+from benchmark_utils.results_catalog import ResultsCatalog, has_results
+
+
+# Only these columns are read from the results
+COLUMNS = [
+    "solver_name",
+    "time",
+    "objective_value",
+    "objective_average_val_metric",
+]
+
+
+def convert_param_value(value):
+    # We currently can match all hyperparams either floats or boolean, other
+    # values are kept as strings
+    try:
+        return float(value)
+    except ValueError:
+        if value.lower() in ["true", "false"]:
+            return value.lower() == "true"
+        return value
+
+
+def parse_solver_name(solver_name):
+    """Split a benchopt solver name into its strategy and its parameters.
+
+    For instance `FedProx[learning_rate=0.01,mu=0.1]` gives `FedProx` and
+    `{"learning_rate": 0.01, "mu": 0.1}`.
+    """
+    strategy, _, params = solver_name.partition("[")
+    params = params.rstrip("]")
+    values = {}
+    if params:
+        for pv in params.split(","):
+            pname, value = pv.split("=")
+            values[pname] = convert_param_value(value)
+    return strategy, values
+
+
+def final_values(df):
+    # The final value of a run is the one with the largest time
+    return df.loc[df.groupby("solver_name")["time"].idxmax()]
+
+
+def read_final_values(dataset, data_name, compact_every=64):
+    """Read the final value of each solver run on `data_name`.
+
+    Only the needed columns of the pyarrow `dataset` are read and the rows
+    of other datasets are filtered out by pyarrow before being loaded. Files
+    are processed by batches whose final values are compacted regularly, so
+    that the memory used only depends on the number of solvers, not on the
+    number of files.
+    """
+    if not has_results(dataset):
+        return pd.DataFrame(columns=COLUMNS)
+    batches = dataset.to_batches(
+        columns=COLUMNS, filter=ds.field("data_name") == data_name
+    )
+    finals = []
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        finals.append(final_values(batch.to_pandas()))
+        if len(finals) >= compact_every:
+            finals = [final_values(pd.concat(finals, ignore_index=True))]
+    if len(finals) == 0:
+        return pd.DataFrame(columns=COLUMNS)
+    return final_values(pd.concat(finals, ignore_index=True))
+
+
+def add_params_columns(df):
+    """Add the strategy and hyperparameters columns parsed from solver names.
+
+    Each unique solver name is only parsed once.
+    """
+    parsed = {name: parse_solver_name(name) for name in df["solver_name"]}
+    params_df = pd.DataFrame.from_dict(
+        {name: params for name, (_, params) in parsed.items()},
+        orient="index",
+    )
+    params_df["strategy"] = [parsed[name][0] for name in params_df.index]
+    pnames = [c for c in params_df.columns if c != "strategy"]
+    df = df.join(params_df, on="solver_name")
+    return df, pnames
+
 
 if __name__ == "__main__":
 
@@ -14,77 +98,28 @@ if __name__ == "__main__":
     parser.add_argument('--output-folder', "-o", type=str,  help="Path to directory containing validation results.", default=".")   # noqa: E501
     parser.add_argument('--dataset', "-d", type=str,  help="The FLamby dataset on which to test.", default="Fed-TCGA-BRCA")   # noqa: E501
     parser.add_argument('--seed', "-s", type=int, help="The seed for the dataset", default=42)   # noqa: E501
+    parser.add_argument('--catalog', "-c", type=str, help="Path to the results catalog, defaults to outputs/catalog in the output folder.", default=None)   # noqa: E501
 
     args = parser.parse_args()
 
-    # Find all results parquet files
+    # Find all results parquet files and ingest the new ones in the catalog
     pq_files_list = glob(os.path.join(args.output_folder, "outputs", "*.parquet"))   # noqa: E501
-
-    # Establish list of strategies
-    strategies = {}
-    new_dfs_list = []
-    for i, pq in enumerate(pq_files_list):
-        cdf = pd.read_parquet(pq)
-        print(cdf["solver_name"].unique())
-        new_dfs_list.append(cdf)
-
-    # Gather all results
-    new_df = pd.concat(new_dfs_list, ignore_index=True)
-
-    # For the right dataset
-    new_df = new_df[new_df["data_name"] == (args.dataset + f"[seed={args.seed},test=val,train=fl]")]   # noqa: E501
-
-    # Create startegy column
-    new_df["strategy"] = [re.findall("[a-zA-Z].+(?=\[)", e)[0] for e in new_df["solver_name"].tolist()]   # noqa: E501 W605
-    found_strategies = new_df["strategy"].unique()
-
-    # Create all params columns by extracting all params for all strategies
-    pnames = []
-    for strat in found_strategies:
-        strat_df = new_df[new_df["strategy"] == strat]
-        # We can take any row to extract params
-        first_row = strat_df.iloc[0]
-        full_name = first_row["solver_name"]
-        params_value_couples = re.findall("(?<=\[).+(?=\])", full_name)[0].split(",")    # noqa: E501 W605
-        for pv in params_value_couples:
-            pname, value = pv.split("=")
-            if pname not in pnames:
-                pnames.append(pname)
-
-    # Create params columns using previous names (can probably be done
-    # in one sweep with a one-liner)
-
-    # helper function used just below
-    def number_or_nan_filler(cell_value, name):
-        param_value_list = re.findall("(?<=" + "," + name + "=)([a-zA-Z-0-9]+[.]?[0-9]*)", cell_value)   # noqa: E501  W605
-        if len(param_value_list) > 0:
-            assert len(param_value_list) == 1
-            # We currently can match all hyperparams either floats or boolean
-            try:
-                return float(param_value_list[0])
-            except ValueError:
-                try:
-                    if not (param_value_list[0].lower() in ["true", "false"]):
-                        raise ValueError
-                    else:
-                        return (param_value_list[0].lower() == "true")
-                except ValueError:
-                    raise ValueError(f"{param_value_list[0]} cannot be converted to float or boolean")   # noqa: E501
-        else:
-            return np.nan
-
-    for pn in pnames:
-        new_df[pn] = [number_or_nan_filler(e, pn) for e in new_df["solver_name"].tolist()]   # noqa: E501
-
-    # We look for a specific hpset (note that we could also use solver_name
-    # indeed we will make the equivalence explicit with an assert)
-    groupby_cols = ["strategy"] + pnames
-    # We look at final performance to choose best hyperparameters
-    idx_max_time = new_df.groupby(groupby_cols, dropna=False)['time'].transform(max) == new_df['time']   # noqa: E501
-    assert (idx_max_time != (new_df.groupby(["solver_name"])["time"].transform(max) == new_df["time"])).sum() == 0   # noqa: E501
-    # This way we keep only the final-value which we will be able to use
-    # to filter the dataframe
-    new_df_final_values = new_df[idx_max_time]
+    if args.catalog is None:
+        args.catalog = os.path.join(args.output_folder, "outputs", "catalog")
+    catalog = ResultsCatalog(args.catalog)
+    ingested = catalog.ingest(pq_files_list)
+    print(f"Ingested {len(ingested)} new results files in {args.catalog}")
+    catalog.compact()
+
+    # We look at final performance on the right dataset to choose best
+    # hyperparameters, only the partitions of this dataset and seed are read
+    data_name = args.dataset + f"[seed={args.seed},test=val,train=fl]"
+    new_df_final_values = read_final_values(
+        catalog.dataset(dataset=args.dataset, seed=args.seed), data_name
+    )
+    new_df_final_values, pnames = add_params_columns(new_df_final_values)
+    found_strategies = new_df_final_values["strategy"].unique()
+    print(f"Found strategies: {list(found_strategies)}")
 
     cfg = {}
     cfg["n-repetitions"] = 1